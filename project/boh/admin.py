@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.core.urlresolvers import reverse
+from django.db.models.functions import Coalesce
 from django.utils.html import format_html
 from django.utils.translation import ugettext_lazy as _
 
@@ -188,9 +189,13 @@ class ApplicationAdmin(admin.ModelAdmin):
     inlines = [EnvironmentInline, RelationInline, EngagementInline, ApplicationCustomFieldValueInline]
     search_fields = ['^name']
 
+    def get_queryset(self, request):
+        return super(ApplicationAdmin, self).get_queryset(request).annotate(dcl=Coalesce('override_dcl', 'calculated_dcl'))
+
     def dcl_display(self, obj):
         return obj.data_classification_level()
     dcl_display.short_description = 'DCL'
+    dcl_display.admin_order_field = 'dcl'
 
 
 admin.site.register(models.Application, ApplicationAdmin)
@@ -299,6 +304,14 @@ class ThreadFixMetricsAdmin(admin.ModelAdmin):
 admin.site.register(models.ThreadFixMetrics, ThreadFixMetricsAdmin)
 
 
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'report_type', 'file_format', 'status', 'requester', 'created_date', 'completed_date']
+    list_filter = ['report_type', 'status']
+    readonly_fields = ['created_date', 'modified_date', 'start_date', 'completed_date']
+
+admin.site.register(models.ReportJob, ReportJobAdmin)
+
+
 class TechnologyAdmin(admin.ModelAdmin):
     list_display = ['__str__', 'category_display', 'name', 'description', 'reference_link']
     list_filter = ['category']
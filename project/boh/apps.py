@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BagOfHoldingConfig(AppConfig):
     name = 'boh'
     verbose_name = "Bag of Holding"
+
+    def ready(self):
+        from . import signals  # noqa: F401
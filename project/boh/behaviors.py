@@ -1,4 +1,8 @@
-from django.db import models
+from django.db import DatabaseError, models
+
+
+class ConcurrentUpdateError(DatabaseError):
+    """Raised when saving a guarded field another transaction changed since the object was loaded."""
 
 
 class TimeStampedModel(models.Model):
@@ -9,3 +13,84 @@ class TimeStampedModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class DirtyFieldsModel(models.Model):
+    """
+    An abstract model remembering the field values it was loaded or last saved with, so changes are known without
+    querying the database. Saving an object loaded from the database only writes the changed fields.
+    """
+
+    # Fields only saved while the row still holds the value they were loaded with, so concurrent changes are not overwritten
+    guarded_fields = ()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(DirtyFieldsModel, cls).from_db(db, field_names, values)
+        instance._remember_values()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super(DirtyFieldsModel, self).refresh_from_db(using=using, fields=fields)
+        self._remember_values(fields)
+
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            self._loaded_values = {}  # Every field is new, also to signal receivers once the primary key is set
+        elif not args and 'update_fields' not in kwargs and not kwargs.get('force_insert') and hasattr(self, '_loaded_values'):
+            changed = self.changed_fields()
+            if changed and self._meta.pk.name not in changed:
+                auto_now = [field.name for field in self._meta.concrete_fields if getattr(field, 'auto_now', False)]
+                kwargs['update_fields'] = set(changed + auto_now)
+        super(DirtyFieldsModel, self).save(*args, **kwargs)
+        self._remember_values()
+
+    def changed_fields(self):
+        """Returns the names of the fields changed since the object was loaded or saved, or every field if it never was."""
+        loaded = self._get_loaded_values()
+        return [
+            field.name for field in self._meta.concrete_fields
+            if field.attname in self.__dict__ and (field.attname not in loaded or loaded[field.attname] != getattr(self, field.attname))
+        ]
+
+    def has_changed(self, *field_names):
+        """Returns true if any of the fields changed since the object was loaded or saved."""
+        changed = self.changed_fields()
+        return any(field_name in changed for field_name in field_names)
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        loaded = self._get_loaded_values()
+        guards = {}
+        for field_name in self.guarded_fields:
+            attname = self._meta.get_field(field_name).attname
+            if attname in loaded and loaded[attname] != getattr(self, attname):
+                guards[attname] = loaded[attname]
+        if not guards or not values:
+            return super(DirtyFieldsModel, self)._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+
+        if base_qs.filter(pk=pk_val, **guards)._update(values) > 0:
+            return True
+        if base_qs.filter(pk=pk_val).exists():
+            raise ConcurrentUpdateError('%s %s was changed by another transaction.' % (self._meta.verbose_name, pk_val))
+        return False
+
+    def _get_loaded_values(self):
+        if self.pk is None:
+            return {}
+        if not hasattr(self, '_loaded_values'):
+            # Constructed with the primary key of an existing row rather than loaded, so the row is read once
+            attnames = [field.attname for field in self._meta.concrete_fields]
+            self._loaded_values = type(self)._base_manager.using(self._state.db).filter(pk=self.pk).values(*attnames).first() or {}
+        return self._loaded_values
+
+    def _remember_values(self, fields=None):
+        loaded = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields if field.attname in self.__dict__}
+        if fields is None or not hasattr(self, '_loaded_values'):
+            self._loaded_values = loaded
+        else:
+            for field_name in fields:
+                attname = self._meta.get_field(field_name).attname
+                self._loaded_values[attname] = loaded[attname]
@@ -11,10 +11,14 @@ class ApplicationFilter(django_filters.FilterSet):
     lifecycle = django_filters.MultipleChoiceFilter(choices=Application.LIFECYCLE_CHOICES)
     origin = django_filters.MultipleChoiceFilter(choices=Application.ORIGIN_CHOICES)
     asvs_level = django_filters.MultipleChoiceFilter(choices=Application.ASVS_CHOICES)
+    dcl = django_filters.MultipleChoiceFilter(choices=Application.DATA_CLASSIFICATION_CHOICES[1:], method='filter_dcl', label='DCL')
 
     class Meta:
         model = Application
         fields = [
             'name', 'organization', 'business_criticality', 'platform', 'lifecycle', 'origin', 'external_audience',
-            'internet_accessible', 'technologies', 'regulations', 'service_level_agreements', 'tags', 'asvs_level'
+            'internet_accessible', 'technologies', 'regulations', 'service_level_agreements', 'tags', 'asvs_level', 'dcl'
         ]
+
+    def filter_dcl(self, queryset, name, value):
+        return queryset.classified([int(level) for level in value])
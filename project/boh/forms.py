@@ -37,7 +37,7 @@ class EngagementCoverageReportForm(forms.Form):
     CSV_FORMAT = 'csv'
     FORMAT_CHOICES = (
         (HTML_FORMAT, 'HTML'),
-        #(CSV_FORMAT, 'CSV'),
+        (CSV_FORMAT, 'CSV'),
     )
 
     organizations = forms.ModelMultipleChoiceField(
@@ -52,7 +52,7 @@ class ThreadFixSummaryReportForm(forms.Form):
     CSV_FORMAT = 'csv'
     FORMAT_CHOICES = (
         (HTML_FORMAT, 'HTML'),
-        #(CSV_FORMAT, 'CSV'),
+        (CSV_FORMAT, 'CSV'),
     )
 
     organizations = forms.ModelMultipleChoiceField(
@@ -66,7 +66,7 @@ class AppSummaryReportForm(forms.Form):
     CSV_FORMAT = 'csv'
     FORMAT_CHOICES = (
         (HTML_FORMAT, 'HTML'),
-        #(CSV_FORMAT, 'CSV'),
+        (CSV_FORMAT, 'CSV'),
     )
 
     applications = forms.ModelMultipleChoiceField(
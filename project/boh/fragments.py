@@ -0,0 +1,56 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import translation
+from django.utils.crypto import get_random_string
+from django.utils.http import urlencode
+
+from . import models
+
+
+# Models whose changes alter each cached fragment
+DEPENDENCIES = {
+    'application_list': ['Application', 'Organization', 'Tag', 'Technology', 'Regulation', 'ServiceLevelAgreement'],
+}
+
+
+def cache():
+    return caches[settings.FRAGMENT_CACHE]
+
+
+def version(name):
+    """
+    Returns the current version of the fragment, which changes whenever it is invalidated. Versions are kept in the
+    database rather than the cache, so invalidations reach every process even with a per-process cache backend.
+    """
+    value = models.FragmentVersion.objects.filter(name=name).values_list('version', flat=True).first()
+    if value is None:
+        value = models.FragmentVersion.objects.get_or_create(name=name, defaults={'version': get_random_string(12)})[0].version
+    return value
+
+
+def invalidate(name):
+    """Discards every cached copy of the fragment by moving it to a new version."""
+    value = get_random_string(12)
+    if not models.FragmentVersion.objects.filter(name=name).update(version=value):
+        models.FragmentVersion.objects.get_or_create(name=name, defaults={'version': value})
+
+
+def invalidate_model(model):
+    """Invalidates the fragments showing the model."""
+    for name, model_names in DEPENDENCIES.items():
+        if model.__name__ in model_names:
+            invalidate(name)
+
+
+def normalized_query(query_dict, ignore=()):
+    """Returns the query string sorted by parameter with blank values removed, so equivalent filters share a key."""
+    items = [(key, sorted(value for value in values if value)) for key, values in query_dict.lists() if key not in ignore]
+    return urlencode(sorted((key, values) for key, values in items if values), doseq=True)
+
+
+def key(name, *parts):
+    """Returns a cache key for the current version of the fragment varying on the active language and the given parts."""
+    digest = hashlib.md5(repr([translation.get_language()] + [str(part) for part in parts]).encode('utf-8')).hexdigest()
+    return '%s.%s.%s' % (name, version(name), digest)
@@ -14,6 +14,13 @@ def data_sensitivity_value(data_elements):
     for data_element in data_elements:
         vector[data_element.category] += data_element.weight
 
+    return data_sensitivity_formula(vector)
+
+
+def data_sensitivity_formula(vector):
+    """Combines the weights summed per category into the data sensitivity value, either numbers or query expressions."""
+    from .models import DataElement
+
     # DSV = Global * (Personal + Student + Government) + PCI + Medical + Company
     dsv = (
         vector[DataElement.GLOBAL_CATEGORY] *
@@ -30,13 +37,14 @@ def data_sensitivity_value(data_elements):
     return dsv
 
 
+# The data sensitivity values below which each data classification level applies, lowest first
+DATA_CLASSIFICATION_THRESHOLDS = [(15, 1), (100, 2), (150, 3)]
+HIGHEST_DATA_CLASSIFICATION_LEVEL = 4
+
+
 def data_classification_level(dsv):
     """Returns the data classification level of the calculated data sensitivity value."""
-    if dsv < 15:
-        return 1
-    elif 15 <= dsv < 100:
-        return 2
-    elif 100 <= dsv < 150:
-        return 3
-    else:
-        return 4
+    for threshold, level in DATA_CLASSIFICATION_THRESHOLDS:
+        if dsv < threshold:
+            return level
+    return HIGHEST_DATA_CLASSIFICATION_LEVEL
@@ -0,0 +1,147 @@
+import statistics
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from ... import helpers, models, synthetic
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+
+    help = 'Times database heavy operations against synthetic data which is rolled back afterwards.'
+
+    suites = ['metrics', 'indexes', 'classification']
+
+    # Models whose index_together indexes, and fields whose indexes, are dropped to compare query plans without them
+    indexed_models = [models.Activity, models.Engagement, models.ThreadFixMetrics]
+    indexed_fields = [(models.Engagement, 'start_date'), (models.Engagement, 'open_date')]
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=self.suites, help='The operations to time.')
+        parser.add_argument('--activities', type=int, dest='activities', default=100000, help='The number of synthetic activities to create before timing.')
+        parser.add_argument('--applications', type=int, dest='applications', default=None, help='The number of synthetic applications to create. Defaults to one for every hundred activities.')
+        parser.add_argument('--repeat', type=int, dest='repeat', default=5, help='The number of times each operation is timed.')
+        parser.add_argument('--seed', type=int, dest='seed', default=0, help='Seeds the random synthetic data.')
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        try:
+            with transaction.atomic():
+                self._seed(options['activities'], options['applications'], options['seed'])
+                getattr(self, '_' + options['suite'])()
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def _seed(self, count, applications, seed):
+        """Generates count activities spread over engagements, applications and activity types opened in the last five years."""
+        applications = applications or max(1, count // 100)
+        self.stdout.write('Creating %d activities and %d applications...' % (count, applications))
+        started = time.time()
+
+        self.data = synthetic.SyntheticData(seed=seed, prefix='Benchmark%d' % seed)
+        self.data.generate(
+            organizations=max(1, count // 10000), applications=applications, people=max(1, count // 200),
+            engagements=max(1, count // 10), activities=count, comments=0, threadfix_days=10, search_index=False
+        )
+
+        self.stdout.write('Created in %.1fs' % (time.time() - started))
+
+    def _time(self, name, operation):
+        """Runs the operation repeatedly and reports its queries, best and median times, and peak memory."""
+        times = []
+        queries = 0
+        peak = 0
+        for index in range(self.repeat):
+            reset_queries()  # Captured queries are only counted while the query log has room
+            tracemalloc.start()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                operation()
+                times.append(time.perf_counter() - started)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            queries = len(context.captured_queries)
+
+        self.stdout.write('%-48s %4d queries  best %8.1fms  median %8.1fms  peak %8.1fKiB' % (
+            name, queries, min(times) * 1000, statistics.median(times) * 1000, peak / 1024.0
+        ))
+
+    def _metrics(self):
+        year = timezone.now().year
+        self._time('DailyMetrics.objects.rebuild()', models.DailyMetrics.objects.rebuild)
+        self._time('ActivityType.metrics.stats()', lambda: list(models.ActivityType.metrics.stats()))
+        self._time('ActivityType.metrics.stats(%d)' % year, lambda: list(models.ActivityType.metrics.stats(year)))
+        self._time('Engagement.metrics.stats(%d)' % year, lambda: models.Engagement.metrics.stats(year))
+        self._time('Activity.metrics.monthly(%d)' % year, lambda: models.Activity.metrics.monthly(year))
+
+    def _indexes(self):
+        """Explains and times the hot filters with the composite indexes, then again after dropping them."""
+        if not connection.features.can_rollback_ddl:
+            raise CommandError('The indexes suite drops indexes and needs a database which can roll them back.')
+
+        now = timezone.now()
+        User = get_user_model()
+        user = User.objects.get(pk=self.data.ids[User][0])
+        application = models.Application.objects.get(pk=self.data.ids[models.Application][0])
+
+        queries = [
+            ('Activity status', lambda: models.Activity.objects.filter(status=models.Activity.OPEN_STATUS)[:100]),
+            ('Activity users', lambda: models.Activity.objects.filter(users__id=user.id, status=models.Activity.PENDING_STATUS)),
+            ('Activity unassigned', lambda: models.Activity.objects.filter(users=None)[:100]),
+            ('Engagement status', lambda: models.Engagement.objects.filter(status=models.Engagement.OPEN_STATUS)[:100]),
+            ('Engagement open year', lambda: models.Engagement.objects.filter(open_date__year=now.year)[:100]),
+            ('ThreadFixMetrics latest', lambda: application.threadfixmetrics_set.order_by('-created_date')[:1]),
+            ('ThreadFixMetrics latest per application', lambda: models.ThreadFixMetrics.objects.latest_per_application().values('id')),
+        ]
+
+        self.stdout.write('With indexes')
+        self._explain_queries(queries)
+
+        with connection.schema_editor() as schema_editor:
+            for model in self.indexed_models:
+                schema_editor.alter_index_together(model, model._meta.index_together, [])
+            for model, name in self.indexed_fields:
+                # Dropped by name, since SQLite recreates the indexes of every other field when one is altered
+                table = model._meta.db_table
+                with connection.cursor() as cursor:
+                    constraints = connection.introspection.get_constraints(cursor, table)
+                for index, constraint in constraints.items():
+                    if constraint['index'] and not constraint['unique'] and constraint['columns'] == [model._meta.get_field(name).column]:
+                        schema_editor.execute(schema_editor.sql_delete_index % {'table': schema_editor.quote_name(table), 'name': schema_editor.quote_name(index)})
+
+        self.stdout.write('Without indexes')
+        self._explain_queries(queries)
+
+    def _explain_queries(self, queries):
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        for name, queryset in queries:
+            sql, params = queryset().query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(prefix + sql, params)
+                plan = cursor.fetchall()
+
+            self._time(name, lambda: list(queryset()))
+            for row in plan:
+                self.stdout.write('    ' + ' '.join(str(column) for column in row))
+
+    def _classification(self):
+        """Times recomputing the data classification of every application one by one, in Python, and in SQL."""
+        sample = list(models.Application.objects.order_by('pk')[:1000])
+
+        def one_by_one():
+            for application in sample:
+                dsv = helpers.data_sensitivity_value(application.data_elements.all())
+                models.Application.objects.filter(pk=application.pk).update(calculated_dsv=dsv, calculated_dcl=helpers.data_classification_level(dsv))
+
+        self._time('One by one, %d applications' % len(sample), one_by_one)
+        self._time('refresh_data_classification(), %d applications' % models.Application.objects.count(), models.Application.objects.all().refresh_data_classification)
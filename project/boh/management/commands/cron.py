@@ -1,8 +1,6 @@
 from django.core.management.base import BaseCommand, CommandError
 
-from threadfix_api import threadfix
-
-from ... import models
+from ... import fragments, models, sync
 
 
 class Command(BaseCommand):
@@ -11,38 +9,32 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('--threadfix', action='store_true', dest='threadfix', default=False, help='Retrieves metrics from ThreadFix. Recommended to be run once daily.')
+        parser.add_argument('--workers', type=int, dest='workers', default=8, help='The number of ThreadFix applications retrieved concurrently.')
+        parser.add_argument('--requests-per-host', type=int, dest='requests_per_host', default=4, help='The maximum number of concurrent requests made to a single ThreadFix host.')
+        parser.add_argument('--delta', action='store_true', dest='delta', default=False, help='Only saves ThreadFix metrics that changed since the last retrieval.')
+        parser.add_argument('--rollup', action='store_true', dest='rollup', default=False, help='Rebuilds the daily engagement and activity metrics. Recommended to be run once daily.')
+        parser.add_argument('--search-index', action='store_true', dest='search_index', default=False, help='Rebuilds the search index. Recommended to be run once daily.')
+        parser.add_argument('--data-classification', action='store_true', dest='data_classification', default=False, help='Recomputes the data sensitivity value and classification level of every application.')
 
     def handle(self, *args, **options):
+        if options['rollup']:
+            models.DailyMetrics.objects.rebuild()
+        if options['search_index']:
+            models.SearchTerm.objects.rebuild()
+        if options['data_classification']:
+            models.Application.objects.all().refresh_data_classification()
+            fragments.invalidate_model(models.Application)
         if options['threadfix']:
-            self._threadfix()
+            self._threadfix(options['workers'], options['requests_per_host'], options['delta'])
 
-    def _threadfix(self):
+    def _threadfix(self, workers, requests_per_host, delta):
         applications = models.Application.objects.threadfix_associated()
 
-        errors = []
-        for application in applications:
-            tf_api = threadfix.ThreadFixAPI(host=application.threadfix.host, api_key=application.threadfix.api_key, verify_ssl=application.threadfix.verify_ssl)
-
-            response = tf_api.get_application(application_id=application.threadfix_application_id)
-            if response.success:
-                critical_count = response.data['criticalVulnCount']
-                high_count = response.data['highVulnCount']
-                medium_count = response.data['mediumVulnCount']
-                low_count = response.data['lowVulnCount']
-                informational_count = response.data['infoVulnCount']
-
-                models.ThreadFixMetrics.objects.create(
-                    application=application,
-                    critical_count=critical_count,
-                    high_count=high_count,
-                    medium_count=medium_count,
-                    low_count=low_count,
-                    informational_count=informational_count
-                ).save()
-            else:
-                error = 'Unable to retrieve ThreadFix data from "' + application.threadfix.name + '" for "' + application.name + '": ' + response.message
-                self.stderr.write(error)
-                errors.append(error)
-
-        if len(errors) > 0:
-            raise CommandError(errors)
+        threadfix_sync = sync.ThreadFixSync(workers=workers, requests_per_host=requests_per_host, delta=delta)
+        threadfix_sync.run(applications)
+
+        for error in threadfix_sync.errors:
+            self.stderr.write(error)
+
+        if len(threadfix_sync.errors) > 0:
+            raise CommandError(threadfix_sync.errors)
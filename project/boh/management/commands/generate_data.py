@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ... import synthetic
+
+
+class Command(BaseCommand):
+
+    help = 'Generates a large synthetic portfolio for load and benchmark testing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organizations', type=int, dest='organizations', default=20, help='The number of organizations to create.')
+        parser.add_argument('--applications', type=int, dest='applications', default=1000, help='The number of applications to create.')
+        parser.add_argument('--people', type=int, dest='people', default=500, help='The number of people to create, each related to organizations and applications.')
+        parser.add_argument('--engagements', type=int, dest='engagements', default=10000, help='The number of engagements to create.')
+        parser.add_argument('--activities', type=int, dest='activities', default=100000, help='The number of activities to create.')
+        parser.add_argument('--comments', type=int, dest='comments', default=50000, help='The number of engagement and activity comments to create.')
+        parser.add_argument('--threadfix-days', type=int, dest='threadfix_days', default=30, help='The number of days of ThreadFix metrics history to create for each application.')
+        parser.add_argument('--data-elements', type=int, dest='data_elements', default=4, help='The number of existing data elements selected for each application.')
+        parser.add_argument('--users', type=int, dest='users', default=10, help='The number of users to create, who are assigned activities and write comments.')
+        parser.add_argument('--seed', type=int, dest='seed', default=0, help='Seeds the random data. The same seed always generates the same data.')
+        parser.add_argument('--prefix', dest='prefix', default=None, help='Starts the names of created objects, which must be unique in the database. Defaults to "S" followed by the seed.')
+        parser.add_argument('--no-search-index', action='store_false', dest='search_index', default=True, help='Skips rebuilding the search index.')
+
+    def handle(self, *args, **options):
+        for name in ['organizations', 'applications', 'people', 'users']:
+            if options[name] < 1:
+                raise CommandError('At least one of each of organizations, applications, people and users is required.')
+        if options['engagements'] < 1 and (options['activities'] or options['comments']):
+            raise CommandError('Activities and comments require at least one engagement.')
+        if options['activities'] < 1 and options['comments']:
+            raise CommandError('Comments require at least one activity.')
+
+        started = time.time()
+        generator = synthetic.SyntheticData(seed=options['seed'], prefix=options['prefix'])
+        with transaction.atomic():
+            counts = generator.generate(
+                organizations=options['organizations'], applications=options['applications'], people=options['people'],
+                engagements=options['engagements'], activities=options['activities'], comments=options['comments'],
+                threadfix_days=options['threadfix_days'], users=options['users'], data_elements=options['data_elements'],
+                search_index=options['search_index']
+            )
+
+        for name, count in counts.items():
+            self.stdout.write('%10d %s' % (count, name))
+        self.stdout.write('Generated in %.1fs' % (time.time() - started))
@@ -0,0 +1,54 @@
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ... import models, reports
+
+
+class Command(BaseCommand):
+
+    help = 'Generates queued reports and saves them to the media directory.'
+    prune_interval = 3600  # seconds between deletions of old reports while the worker runs
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', dest='once', default=False, help='Exits once there are no pending reports instead of waiting for more.')
+        parser.add_argument('--interval', type=float, dest='interval', default=5.0, help='The number of seconds to wait between checks for pending reports.')
+        parser.add_argument('--timeout', type=float, dest='timeout', default=settings.REPORT_WORKER_TIMEOUT, help='The number of seconds after which a running report is assumed to be abandoned and is generated again.')
+        parser.add_argument('--retention', type=float, dest='retention', default=settings.REPORT_RETENTION_DAYS, help='The number of days after which finished reports and their files are deleted, or 0 to keep them.')
+
+    def handle(self, *args, **options):
+        pruned = None
+        while True:
+            if options['retention'] and (pruned is None or time.time() - pruned >= self.prune_interval):
+                count = models.ReportJob.objects.prune(timedelta(days=options['retention']))
+                if count:
+                    self.stdout.write('Deleted %d finished reports.' % count)
+                pruned = time.time()
+
+            job = models.ReportJob.objects.claim(stale_after=timedelta(seconds=options['timeout']))
+            if job is not None:
+                self._generate(job)
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['interval'])
+
+    def _generate(self, job):
+        try:
+            report = reports.from_job(job)
+            with tempfile.TemporaryFile() as output:
+                report.write(output)
+                output.seek(0)
+                job.file.save(str(job), File(output), save=False)
+            job.status = models.ReportJob.COMPLETED_STATUS
+        except Exception as e:
+            job.status = models.ReportJob.FAILED_STATUS
+            job.error = str(e)
+            self.stderr.write('Unable to generate "' + str(job) + '": ' + job.error)
+        job.completed_date = timezone.now()
+        job.save()
@@ -1,14 +1,150 @@
+import collections
 import datetime
-
-from django.db import models
-from django.db.models import Avg, Case, Count, IntegerField, Prefetch, Q, Sum, When
+import math
+import operator
+from functools import reduce
+
+from django.db import connections, models, transaction
+from django.db.models import Case, Count, DateField, DateTimeField, DurationField, ExpressionWrapper, F, FloatField, Func, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, TruncDate, TruncMonth
+from django.utils import timezone
+
+
+def _duration(value):
+    """Converts a duration into a timedelta. Some databases return durations as microseconds."""
+    if value and not isinstance(value, datetime.timedelta):
+        return datetime.timedelta(microseconds=value)
+    return value
+
+
+def _day(value):
+    """Returns the date of a datetime in the current time zone, matching TruncDate and __date lookups."""
+    if value is None:
+        return None
+    return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+
+
+class Elapsed(Func):
+    """The duration from a start to an end datetime expression."""
+
+    def __init__(self, end, start):
+        super(Elapsed, self).__init__(end, start, output_field=DurationField())
+
+    def as_sql(self, compiler, connection):
+        end, start = self.get_source_expressions()
+        return compiler.compile(ExpressionWrapper(end - start, output_field=DurationField()))
+
+    def as_sqlite(self, compiler, connection):
+        # SQLite subtracts in floating point microseconds, which are stored as a REAL that cannot be read back as a duration
+        sql, params = self.as_sql(compiler, connection)
+        return 'CAST(ROUND(%s) AS INTEGER)' % sql, params
+
+
+def _average(total_duration, duration_count):
+    if not duration_count:
+        return None
+    return _duration(total_duration) / duration_count
+
+
+def _rollup_aggregates():
+    """Sums DailyMetrics rows into status counts and duration totals."""
+    from .models import Engagement
+
+    def status_count(status):
+        return Sum(Case(When(status=status, then='count'), output_field=IntegerField(), default=0))
+
+    return {
+        'pending_count': status_count(Engagement.PENDING_STATUS),
+        'open_count': status_count(Engagement.OPEN_STATUS),
+        'closed_count': status_count(Engagement.CLOSED_STATUS),
+        'total_count': Sum('count'),
+        'duration_count': Sum('duration_count'),
+        'total_duration': Sum('total_duration')
+    }
+
+
+def _averages(results):
+    """Replaces the duration totals of grouped results with average durations."""
+    results = list(results)
+    for result in results:
+        result['average_duration'] = _average(result.pop('total_duration'), result.pop('duration_count'))
+    return results
+
+
+class BulkUpdateQuerySet(models.QuerySet):
+    def bulk_update(self, objs, fields, batch_size=500):
+        """Saves the given fields of many objects with a single UPDATE ... CASE statement per batch."""
+        fields = [self.model._meta.get_field(name) for name in fields]
+        objs = list(objs)
+        for index in range(0, len(objs), batch_size):
+            batch = objs[index:index + batch_size]
+            updates = {}
+            for field in fields:
+                whens = [When(pk=obj.pk, then=Value(getattr(obj, field.attname), output_field=field)) for obj in batch]
+                case = Case(*whens, output_field=field)
+                if connections[self.db].vendor == 'postgresql':
+                    case = Cast(case, output_field=field)  # PostgreSQL cannot infer the type of CASE parameters
+                updates[field.attname] = case
+            self.filter(pk__in=[obj.pk for obj in batch]).update(**updates)
+
+
+class TransitionQuerySet(BulkUpdateQuerySet):
+    def transition(self, status, batch_size=500):
+        """
+        Moves the objects to the status with set-based updates, setting the open and close dates and the duration as
+        saving each of them would. Returns the number of objects moved.
+        """
+        from .models import DailyMetrics
+        now = timezone.now()
+        moved = 0
+        buckets = set()
+        with transaction.atomic(using=self.db):
+            pks = list(self.exclude(status=status).order_by().values_list('pk', flat=True))
+            for index in range(0, len(pks), batch_size):
+                batch = self.model._default_manager.using(self.db).filter(pk__in=pks[index:index + batch_size])
+                self._transitioning(batch, status)
+                buckets.update(DailyMetrics.objects.buckets(batch))
+                # Only rows still in another status move, in case a concurrent transaction moved some since they were read
+                moved += batch.exclude(status=status).update(**self._transition_values(status, now))
+                buckets.update(DailyMetrics.objects.buckets(batch))
+                self._transitioned(batch, status)
+            for bucket in buckets:
+                DailyMetrics.objects.refresh(*bucket)
+        return moved
+
+    def lock(self):
+        """
+        Locks the rows until the end of the transaction with an update which changes nothing. Unlike select_for_update
+        this also makes concurrent writers wait for each other on SQLite.
+        """
+        return self.update(status=F('status'))
+
+    def _transition_values(self, status, now):
+        """Returns the update for objects moving to the status, matching the dates set when saving one."""
+        now = Value(now, output_field=DateTimeField())
+        values = {field.attname: now for field in self.model._meta.concrete_fields if getattr(field, 'auto_now', False)}
+        values['status'] = status
+        if status == self.model.PENDING_STATUS:
+            values.update(open_date=None, close_date=None)
+        elif status == self.model.OPEN_STATUS:
+            values.update(open_date=now, close_date=None)
+        elif status == self.model.CLOSED_STATUS:
+            open_date = Coalesce('open_date', now)
+            values.update(open_date=open_date, close_date=now, duration=Elapsed(now, open_date))
+        return values
+
+    def _transitioning(self, batch, status):
+        """Prepares for a batch of objects moving to the status."""
+
+    def _transitioned(self, batch, status):
+        """Applies the rules depending on a batch of objects having moved to the status."""
 
 
 class ApplicationManager(models.Manager):
     pass
 
 
-class ApplicationQuerySet(models.QuerySet):
+class ApplicationQuerySet(BulkUpdateQuerySet):
     def requestable(self):
         """Returns Applications permitting external activity requests."""
         return self.filter(requestable=True)
@@ -17,6 +153,42 @@ class ApplicationQuerySet(models.QuerySet):
         """Returns Applications that have all the ThreadFix configurations set."""
         return self.exclude(threadfix__isnull=True).exclude(threadfix_team_id__isnull=True).exclude(threadfix_application_id__isnull=True)
 
+    def refresh_latest_threadfix_metrics(self):
+        """Points each Application at its most recent ThreadFixMetrics using a single update."""
+        from .models import ThreadFixMetrics
+        latest = ThreadFixMetrics.objects.filter(application=OuterRef('pk')).order_by('-created_date', '-id').values('id')[:1]
+        return self.update(latest_threadfix_metrics=Subquery(latest))
+
+    def touch(self):
+        """Marks Applications as modified, e.g., when related data shown with them changes."""
+        return self.update(modified_date=timezone.now())
+
+    def classified(self, levels):
+        """Returns Applications whose data classification level, overridden or calculated, is one of the levels."""
+        return self.filter(Q(override_dcl__in=levels) | Q(override_dcl__isnull=True, calculated_dcl__in=levels))
+
+    def refresh_data_classification(self):
+        """
+        Recomputes the stored data sensitivity value and classification level of each Application with two updates. The
+        weights of each data element category are summed by a correlated aggregate subquery.
+        """
+        from . import helpers
+        from .models import DataElement
+        data_elements = self.model._meta.apps.get_model('boh', 'DataElement')._default_manager
+
+        def category_weight(category):
+            return Coalesce(Sum(Case(When(category=category, then='weight'), default=Value(0), output_field=IntegerField())), Value(0))
+
+        vector = {category: category_weight(category) for category, label in DataElement.CATEGORY_CHOICES}
+        vector[DataElement.GLOBAL_CATEGORY] = Value(1) + vector[DataElement.GLOBAL_CATEGORY]
+        dsv = data_elements.filter(application=OuterRef('pk')).order_by().values('application').annotate(
+            dsv=helpers.data_sensitivity_formula(vector)
+        ).values('dsv')
+        self.update(calculated_dsv=Coalesce(Subquery(dsv, output_field=FloatField()), Value(0.0)))
+
+        levels = [When(calculated_dsv__lt=threshold, then=Value(level)) for threshold, level in helpers.DATA_CLASSIFICATION_THRESHOLDS]
+        self.update(calculated_dcl=Case(*levels, default=Value(helpers.HIGHEST_DATA_CLASSIFICATION_LEVEL), output_field=IntegerField()))
+
 
 class ActivityTypeManager(models.Manager):
     pass
@@ -24,33 +196,26 @@ class ActivityTypeManager(models.Manager):
 
 class ActivityTypeMetrics(models.Manager):
     def stats(self, year=None):
-        """Returns counts of each activity and their average durations."""
+        """Returns counts of each activity and their average durations from the daily metrics rollup."""
         from .models import Activity
-        results = self.get_queryset()
 
-        activity_queryset = Activity.objects.all()
-        if year:
-            activity_queryset = activity_queryset.filter(open_date__year=year)
-
-        results = results.prefetch_related(Prefetch('activity_set', queryset=activity_queryset))
-        results = results.annotate(
-            pending_count=Sum(
-                Case(When(activity__status=Activity.PENDING_STATUS, then=1), output_field=IntegerField(), default=0)
-            ),
-            open_count=Sum(
-                Case(When(activity__status=Activity.OPEN_STATUS, then=1), output_field=IntegerField(), default=0)
-            ),
-            closed_count=Sum(
-                Case(When(activity__status=Activity.CLOSED_STATUS, then=1), output_field=IntegerField(), default=0)
-            )
+        # Conditions live inside the aggregates so activity types without matching activities are still returned
+        in_year = Q(daily_metrics__day__year=year) if year else Q(daily_metrics__isnull=False)
+
+        def rollup_sum(field, condition=Q(), output_field=IntegerField()):
+            return Sum(Case(When(in_year & condition, then='daily_metrics__' + field), output_field=output_field, default=0))
+
+        results = self.get_queryset().annotate(
+            pending_count=rollup_sum('count', Q(daily_metrics__status=Activity.PENDING_STATUS)),
+            open_count=rollup_sum('count', Q(daily_metrics__status=Activity.OPEN_STATUS)),
+            closed_count=rollup_sum('count', Q(daily_metrics__status=Activity.CLOSED_STATUS)),
+            total_count=rollup_sum('count'),
+            duration_count=rollup_sum('duration_count'),
+            total_duration=rollup_sum('total_duration', output_field=DurationField())
         )
-        results = results.annotate(total_count=Count('activity__status'))
-        results = results.annotate(average_duration=Avg('activity__duration'))
 
-        # Convert duration averages into timedelta
         for result in results:
-            if result.average_duration:
-                result.average_duration = datetime.timedelta(microseconds=result.average_duration)
+            result.average_duration = _average(result.total_duration, result.duration_count)
 
         return results
 
@@ -75,39 +240,47 @@ class EngagementManager(models.Manager):
 
 class EngagementMetrics(models.Manager):
     def stats(self, year=None):
-        """Returns counts for each Engagement status and the average duration."""
-        from .models import Engagement
-        results = self.get_queryset()
+        """Returns counts for each Engagement status and the average duration from the daily metrics rollup."""
+        from .models import DailyMetrics
+        results = DailyMetrics.objects.filter(kind=DailyMetrics.ENGAGEMENT_KIND)
 
         if year:
-            results = results.filter(open_date__year=year)
-
-        results = results.aggregate(
-            pending_count=Sum(
-                Case(When(status=Engagement.PENDING_STATUS, then=1), output_field=IntegerField(), default=0)
-            ),
-            open_count=Sum(
-                Case(When(status=Engagement.OPEN_STATUS, then=1), output_field=IntegerField(), default=0)
-            ),
-            closed_count=Sum(
-                Case(When(status=Engagement.CLOSED_STATUS, then=1), output_field=IntegerField(), default=0)
-            ),
-            total_count=Count('id'),
-            average_duration=Avg('duration')
-        )
+            results = results.filter(day__year=year)
 
-        if results['average_duration']:
-            results['average_duration'] = datetime.timedelta(microseconds=results['average_duration'])
+        return _averages([results.aggregate(**_rollup_aggregates())])[0]
 
-        return results
+    def monthly(self, year=None, by_organization=False):
+        """Returns counts for each Engagement status and the average duration per month opened, in a single query."""
+        from .models import DailyMetrics
+        results = DailyMetrics.objects.filter(kind=DailyMetrics.ENGAGEMENT_KIND)
+
+        if year:
+            results = results.filter(day__year=year)
+
+        groups = {'month': TruncMonth('day', output_field=DateField())}
+        ordering = ['month']
+        if by_organization:
+            groups['organization_name'] = F('organization__name')
+            ordering.append('organization_name')
 
+        return _averages(results.values(**groups).annotate(**_rollup_aggregates()).order_by(*ordering))
 
-class EngagementQuerySet(models.QuerySet):
+
+class EngagementQuerySet(TransitionQuerySet):
     def closed(self):
         """Returns Engagements with a closed status."""
         from .models import Engagement
         return self.filter(status=Engagement.CLOSED_STATUS)
 
+    def latest_per_application(self):
+        """Returns only the latest Engagement of each application, matching Engagement.objects.latest()."""
+        latest = self.model.objects.filter(application=OuterRef('application')).order_by('-close_date', '-id').values('id')[:1]
+        return self.annotate(latest_id=Subquery(latest)).filter(id=F('latest_id'))
+
+    def touch(self):
+        """Marks Engagements as modified, e.g., when related data shown with them changes."""
+        return self.update(modified_date=timezone.now())
+
 
 class ActivityManager(models.Manager):
     def distinct_years(self):
@@ -123,8 +296,240 @@ class ActivityManager(models.Manager):
         return years_list
 
 
-class ActivityQuerySet(models.QuerySet):
+class ActivityMetrics(models.Manager):
+    def monthly(self, year=None, by_organization=False):
+        """Returns counts for each Activity status and the average duration per month opened and activity type, in a single query."""
+        from .models import DailyMetrics
+        results = DailyMetrics.objects.filter(kind=DailyMetrics.ACTIVITY_KIND)
+
+        if year:
+            results = results.filter(day__year=year)
+
+        groups = {'month': TruncMonth('day', output_field=DateField()), 'activity_type_name': F('activity_type__name')}
+        ordering = ['month', 'activity_type_name']
+        if by_organization:
+            groups['organization_name'] = F('organization__name')
+            ordering.append('organization_name')
+
+        return _averages(results.values(**groups).annotate(**_rollup_aggregates()).order_by(*ordering))
+
+
+class ActivityQuerySet(TransitionQuerySet):
     def closed(self):
         """Returns Activities with a closed status."""
         from .models import Activity
         return self.filter(status=Activity.CLOSED_STATUS)
+
+    def lock_engagements(self):
+        """
+        Locks the parent engagements. Transitions lock them before changing activities, so concurrent transitions of
+        sibling activities take turns and each sees the others' changes when deciding whether to close an engagement.
+        """
+        from .models import Engagement
+        return Engagement.objects.using(self.db).filter(pk__in=self.values('engagement')).lock()
+
+    def update_engagements(self, status):
+        """Opens the parent engagements of activities moved to open, or closes them once all of their activities are closed."""
+        from .models import Activity, Engagement
+        engagements = Engagement.objects.using(self.db).filter(pk__in=self.values('engagement'))
+        if status == Activity.OPEN_STATUS:
+            engagements.transition(Engagement.OPEN_STATUS)
+        elif status == Activity.CLOSED_STATUS:
+            engagements.exclude(activity__status__in=[Activity.PENDING_STATUS, Activity.OPEN_STATUS]).transition(Engagement.CLOSED_STATUS)
+
+    def _transitioning(self, batch, status):
+        batch.lock_engagements()
+
+    def _transitioned(self, batch, status):
+        batch.update_engagements(status)
+
+
+class ThreadFixMetricsManager(models.Manager):
+    pass
+
+
+class ThreadFixMetricsQuerySet(models.QuerySet):
+    def latest_per_application(self):
+        """Returns only the most recent ThreadFixMetrics of each application."""
+        latest = self.model.objects.filter(application=OuterRef('application')).order_by('-created_date', '-id').values('id')[:1]
+        return self.annotate(latest_id=Subquery(latest)).filter(id=F('latest_id'))
+
+
+class ReportJobManager(models.Manager):
+    pass
+
+
+class ReportJobQuerySet(models.QuerySet):
+    def claim(self, stale_after=None):
+        """
+        Marks the oldest pending ReportJob as running and returns it, or None if none are pending. Jobs running for longer
+        than stale_after, a timedelta, are assumed to belong to a worker which stopped and are claimed again.
+        """
+        from .models import ReportJob
+        claimable = Q(status=ReportJob.PENDING_STATUS)
+        if stale_after is not None:
+            claimable |= Q(status=ReportJob.RUNNING_STATUS, start_date__lt=timezone.now() - stale_after)
+        for job in self.filter(claimable).order_by('created_date')[:10]:
+            # Only one worker can move a job out of the status and start date it was read with
+            if self.filter(pk=job.pk, status=job.status, start_date=job.start_date).update(status=ReportJob.RUNNING_STATUS, start_date=timezone.now()):
+                job.refresh_from_db()
+                return job
+        return None
+
+    def prune(self, older_than):
+        """Deletes the jobs which finished more than older_than, a timedelta, ago along with their files. Returns how many."""
+        from .models import ReportJob
+        finished = self.filter(status__in=[ReportJob.COMPLETED_STATUS, ReportJob.FAILED_STATUS], completed_date__lt=timezone.now() - older_than)
+        count = 0
+        for job in finished.iterator():
+            if job.file:
+                job.file.delete(save=False)
+            job.delete()
+            count += 1
+        return count
+
+
+class DailyMetricsManager(models.Manager):
+    pass
+
+
+class DailyMetricsQuerySet(models.QuerySet):
+    def rebuild(self):
+        """Replaces every rollup row with ones aggregated from all engagements and activities."""
+        with transaction.atomic(using=self.db):
+            self._lock()
+            self.model._default_manager.all().delete()
+            self.model._default_manager.bulk_create(self._aggregate(), batch_size=500)
+
+    def refresh(self, kind, day, organization_id, activity_type_id=None):
+        """Recomputes the rollup rows of one day, organization and activity type from the engagements or activities."""
+        with transaction.atomic(using=self.db):
+            self._lock(organization_id)
+            self.model._default_manager.filter(kind=kind, day=day, organization=organization_id, activity_type=activity_type_id).delete()
+            self.model._default_manager.bulk_create(self._aggregate(kind, day, organization_id, activity_type_id))
+
+    def bucket(self, model, pk):
+        """Returns the (kind, day, organization id, activity type id) rollup key a saved engagement or activity counts towards."""
+        if model._meta.model_name == 'engagement':
+            row = model._default_manager.filter(pk=pk).values('open_date', 'application__organization').first()
+            if row is None:
+                return None
+            return (self.model.ENGAGEMENT_KIND, _day(row['open_date']), row['application__organization'], None)
+
+        row = model._default_manager.filter(pk=pk).values('open_date', 'engagement__application__organization', 'activity_type').first()
+        if row is None:
+            return None
+        return (self.model.ACTIVITY_KIND, _day(row['open_date']), row['engagement__application__organization'], row['activity_type'])
+
+    def buckets(self, queryset):
+        """Returns the distinct rollup keys the engagements or activities of a queryset count towards, in a single query."""
+        queryset = queryset.annotate(day=TruncDate('open_date')).order_by()
+        if queryset.model._meta.model_name == 'engagement':
+            rows = queryset.values_list('day', 'application__organization').distinct()
+            return {(self.model.ENGAGEMENT_KIND, day, organization_id, None) for day, organization_id in rows}
+
+        rows = queryset.values_list('day', 'engagement__application__organization', 'activity_type').distinct()
+        return {(self.model.ACTIVITY_KIND, day, organization_id, activity_type_id) for day, organization_id, activity_type_id in rows}
+
+    def _lock(self, organization_id=None):
+        """
+        Serializes replacing the rollup rows of an organization, or of every organization, until the transaction ends.
+        The unique key cannot do this on its own since the day and activity type are NULL in many rows, and NULLs never
+        collide. SQLite ignores the lock, but only ever lets one transaction write.
+        """
+        organizations = self.model._meta.apps.get_model('boh', 'Organization')._default_manager.using(self.db).select_for_update()
+        if organization_id is not None:
+            organizations = organizations.filter(pk=organization_id)
+        list(organizations.order_by('pk').values_list('pk', flat=True))
+
+    def _aggregate(self, kind=None, day=None, organization_id=None, activity_type_id=None):
+        """Returns unsaved rollup rows grouped from the source tables, limited to one key when a kind is given."""
+        apps = self.model._meta.apps
+        sources = [
+            ('engagement', apps.get_model('boh', 'Engagement'), 'application__organization', None),
+            ('activity', apps.get_model('boh', 'Activity'), 'engagement__application__organization', 'activity_type')
+        ]
+
+        rows = []
+        for source_kind, model, organization, activity_type in sources:
+            if kind is not None and kind != source_kind:
+                continue
+
+            queryset = model._default_manager.all()
+            groups = ['day', 'status', organization] + ([activity_type] if activity_type else [])
+            if kind is not None:
+                queryset = queryset.filter(**{organization: organization_id})
+                queryset = queryset.filter(open_date__date=day) if day else queryset.filter(open_date__isnull=True)
+                if activity_type:
+                    queryset = queryset.filter(**{activity_type: activity_type_id})
+
+            values = queryset.annotate(day=TruncDate('open_date')).values(*groups).annotate(
+                row_count=Count('id'), duration_count=Count('duration'), total_duration=Sum('duration')
+            ).order_by()
+
+            for value in values:
+                rows.append(self.model(
+                    kind=source_kind, day=value['day'], status=value['status'], organization_id=value[organization],
+                    activity_type_id=value[activity_type] if activity_type else None, count=value['row_count'],
+                    duration_count=value['duration_count'], total_duration=_duration(value['total_duration']) or datetime.timedelta(0)
+                ))
+        return rows
+
+
+class SearchTermManager(models.Manager):
+    pass
+
+
+class SearchTermQuerySet(models.QuerySet):
+    def index(self, kind, pks):
+        """Replaces the indexed terms of the given objects of a kind."""
+        from . import search
+        with transaction.atomic(using=self.db):
+            self.remove(kind, pks)
+            self._index_documents(search.documents[kind], pks)
+
+    def remove(self, kind, pks):
+        self.model._default_manager.filter(kind=kind, object_id__in=pks).delete()
+
+    def rebuild(self, batch_size=1000):
+        """Replaces the whole index with the terms of every searchable object."""
+        from . import search
+        with transaction.atomic(using=self.db):
+            self.model._default_manager.all().delete()
+            for document in search.documents.values():
+                model = self.model._meta.apps.get_model('boh', document.model_name)
+                pks = list(model._default_manager.order_by('pk').values_list('pk', flat=True))
+                for offset in range(0, len(pks), batch_size):
+                    self._index_documents(document, pks[offset:offset + batch_size])
+
+    def search(self, query, limit=50):
+        """
+        Returns the kind, object id and score of the objects containing every term of the query, best first. The last
+        term also matches the terms it begins, so results can be shown while typing.
+        """
+        from . import search
+        terms = list(collections.OrderedDict.fromkeys(search.tokenize(query)))[:search.MAX_QUERY_TERMS]
+        if not terms:
+            return []
+
+        # A range rather than startswith, which some databases cannot answer from the index
+        conditions = [Q(term=term) for term in terms[:-1]] + [Q(term__gte=terms[-1], term__lt=terms[-1] + '\uffff')]
+        matching = self.filter(reduce(operator.or_, conditions))
+
+        # Terms found in fewer objects count for more
+        frequencies = matching.aggregate(**{'term_%d' % index: Count(Case(When(condition, then=Value(1)))) for index, condition in enumerate(conditions)})
+        rarities = [1.0 / math.log(2 + frequencies['term_%d' % index]) for index in range(len(conditions))]
+
+        score = ExpressionWrapper(F('weight') * Case(*[When(condition, then=Value(rarity)) for condition, rarity in zip(conditions, rarities)], output_field=FloatField()), output_field=FloatField())
+        results = matching.values('kind', 'object_id').annotate(score=Sum(score))
+        if len(conditions) > 1:
+            matched = Count(Case(*[When(condition, then=Value(index)) for index, condition in enumerate(conditions)], output_field=IntegerField()), distinct=True)
+            results = results.annotate(matched=matched).filter(matched=len(conditions))
+        return list(results.order_by('-score', 'kind', 'object_id')[:limit])
+
+    def _index_documents(self, document, pks):
+        model = self.model._meta.apps.get_model('boh', document.model_name)
+        self.model._default_manager.bulk_create([
+            self.model(term=term, kind=document.kind, object_id=pk, weight=weight)
+            for pk, terms in document.terms(model, pks).items() for term, weight in terms.items()
+        ], batch_size=500)
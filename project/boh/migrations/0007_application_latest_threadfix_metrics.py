@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.22 on 2026-10-18 09:55
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def set_latest_threadfix_metrics(apps, schema_editor):
+    """Points pre-existing applications at their most recent ThreadFix metrics."""
+    Application = apps.get_model('boh', 'Application')
+    ThreadFixMetrics = apps.get_model('boh', 'ThreadFixMetrics')
+    latest = ThreadFixMetrics.objects.filter(application=OuterRef('pk')).order_by('-created_date', '-id').values('id')[:1]
+    Application.objects.update(latest_threadfix_metrics=Subquery(latest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boh', '0006_v0_0_6'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='application',
+            name='latest_threadfix_metrics',
+            field=models.ForeignKey(blank=True, editable=False, help_text='The most recent ThreadFix metrics for this application.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='boh.ThreadFixMetrics'),
+        ),
+        migrations.AddField(
+            model_name='threadfixmetrics',
+            name='checked_date',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, help_text='The date and time when ThreadFix last reported these counts.'),
+        ),
+        migrations.RunPython(set_latest_threadfix_metrics, migrations.RunPython.noop),
+    ]
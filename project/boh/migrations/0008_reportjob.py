@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.22 on 2026-10-18 09:59
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('boh', '0007_application_latest_threadfix_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('modified_date', models.DateTimeField(auto_now=True)),
+                ('report_type', models.CharField(choices=[('engagement_coverage', 'Engagement Coverage Report'), ('threadfix_summary', 'ThreadFix Summary Report'), ('app_summary', 'Application Summary Report')], max_length=19)),
+                ('file_name', models.CharField(max_length=64)),
+                ('file_format', models.CharField(max_length=4)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=9)),
+                ('file', models.FileField(blank=True, help_text='The generated report.', upload_to='reports/%Y/%m/')),
+                ('error', models.TextField(blank=True, help_text='Information about why the report could not be generated.')),
+                ('start_date', models.DateTimeField(blank=True, help_text='The date and time when the report worker began generating the report.', null=True)),
+                ('completed_date', models.DateTimeField(blank=True, help_text='The date and time when the report worker finished.', null=True)),
+                ('applications', models.ManyToManyField(blank=True, to='boh.Application')),
+                ('organizations', models.ManyToManyField(blank=True, to='boh.Organization')),
+                ('requester', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_date'],
+                'get_latest_by': 'created_date',
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.22 on 2026-10-18 10:33
+from __future__ import unicode_literals
+
+import datetime
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def rebuild_daily_metrics(apps, schema_editor):
+    """Aggregates pre-existing engagements and activities into the rollup."""
+    DailyMetrics = apps.get_model('boh', 'DailyMetrics')
+    sources = [
+        ('engagement', apps.get_model('boh', 'Engagement'), 'application__organization', None),
+        ('activity', apps.get_model('boh', 'Activity'), 'engagement__application__organization', 'activity_type')
+    ]
+
+    rows = []
+    for kind, model, organization, activity_type in sources:
+        groups = ['day', 'status', organization] + ([activity_type] if activity_type else [])
+        values = model.objects.annotate(day=TruncDate('open_date')).values(*groups).annotate(
+            row_count=Count('id'), duration_count=Count('duration'), total_duration=Sum('duration')
+        ).order_by()
+
+        for value in values:
+            total_duration = value['total_duration']
+            if total_duration and not isinstance(total_duration, datetime.timedelta):
+                total_duration = datetime.timedelta(microseconds=total_duration)  # Some databases return microseconds
+            rows.append(DailyMetrics(
+                kind=kind, day=value['day'], status=value['status'], organization_id=value[organization],
+                activity_type_id=value[activity_type] if activity_type else None, count=value['row_count'],
+                duration_count=value['duration_count'], total_duration=total_duration or datetime.timedelta(0)
+            ))
+    DailyMetrics.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boh', '0008_reportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMetrics',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('engagement', 'Engagement'), ('activity', 'Activity')], max_length=10)),
+                ('day', models.DateField(blank=True, help_text='The day the engagements or activities were opened.', null=True)),
+                ('status', models.CharField(max_length=7)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('duration_count', models.PositiveIntegerField(default=0, help_text='The number of engagements or activities with a duration.')),
+                ('total_duration', models.DurationField(default=datetime.timedelta(0))),
+                ('activity_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_metrics', to='boh.ActivityType')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_metrics', to='boh.Organization')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily metrics',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailymetrics',
+            unique_together=set([('kind', 'day', 'status', 'organization', 'activity_type')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='dailymetrics',
+            index_together=set([('kind', 'day')]),
+        ),
+        migrations.RunPython(rebuild_daily_metrics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.22 on 2026-10-18 10:41
+from __future__ import unicode_literals
+
+import collections
+import re
+
+from django.db import migrations, models
+
+
+# (kind, model name, [(field path, weight)]) of each searchable model, as indexed when the index was created
+SEARCH_DOCUMENTS = [
+    ('application', 'Application', [('name', 8), ('description', 1), ('applicationcustomfieldvalue__value', 2)]),
+    ('person', 'Person', [('first_name', 8), ('last_name', 8), ('email', 4)]),
+    ('engagement', 'Engagement', [('description', 1)]),
+    ('engagement_comment', 'EngagementComment', [('message', 1)]),
+    ('activity_comment', 'ActivityComment', [('message', 1)]),
+]
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+MAX_TERM_LENGTH = 64
+
+
+def rebuild_search_index(apps, schema_editor, batch_size=1000):
+    """Indexes pre-existing applications, people, engagements and comments."""
+    SearchTerm = apps.get_model('boh', 'SearchTerm')
+    for kind, model_name, fields in SEARCH_DOCUMENTS:
+        model = apps.get_model('boh', model_name)
+        pks = list(model.objects.order_by('pk').values_list('pk', flat=True))
+        for offset in range(0, len(pks), batch_size):
+            weights = collections.defaultdict(collections.Counter)
+            queryset = model.objects.filter(pk__in=pks[offset:offset + batch_size]).order_by()
+            for path, weight in fields:
+                for pk, text in queryset.values_list('pk', path):
+                    for token in TOKEN_PATTERN.findall((text or '').lower()):
+                        weights[pk][token[:MAX_TERM_LENGTH]] += weight
+            SearchTerm.objects.bulk_create([
+                SearchTerm(term=term, kind=kind, object_id=pk, weight=weight)
+                for pk, terms in weights.items() for term, weight in terms.items()
+            ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boh', '0009_dailymetrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('kind', models.CharField(choices=[('application', 'Application'), ('person', 'Person'), ('engagement', 'Engagement'), ('engagement_comment', 'Engagement Comment'), ('activity_comment', 'Activity Comment')], max_length=18)),
+                ('object_id', models.PositiveIntegerField()),
+                ('weight', models.PositiveIntegerField(help_text='The number of occurrences of the term, multiplied by the weight of each field it occurs in.')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='searchterm',
+            index_together=set([('term', 'kind', 'object_id', 'weight'), ('kind', 'object_id')]),
+        ),
+        migrations.RunPython(rebuild_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.22 on 2026-10-18 10:59
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boh', '0010_searchterm'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='activity',
+            index_together=set([('status', 'engagement')]),
+        ),
+        migrations.AlterField(
+            model_name='engagement',
+            name='open_date',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='The date and time when the status is changed to open.', null=True),
+        ),
+        migrations.AlterField(
+            model_name='engagement',
+            name='start_date',
+            field=models.DateField(db_index=True, help_text='The date the engagement is scheduled to begin.'),
+        ),
+        migrations.AlterIndexTogether(
+            name='engagement',
+            index_together=set([('status', 'start_date')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='threadfixmetrics',
+            index_together=set([('application', 'created_date')]),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.22 on 2026-10-18 11:15
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Case, FloatField, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+
+def refresh_data_classification(apps, schema_editor):
+    """Stores the data classification of pre-existing applications."""
+    Application = apps.get_model('boh', 'Application')
+    DataElement = apps.get_model('boh', 'DataElement')
+
+    def category_weight(category):
+        return Coalesce(Sum(Case(When(category=category, then='weight'), default=Value(0), output_field=IntegerField())), Value(0))
+
+    # DSV = Global * (Personal + Student + Government) + PCI + Medical + Company, where Global starts at 1
+    dsv = (
+        (Value(1) + category_weight('global')) *
+        (category_weight('personal') + category_weight('student') + category_weight('government')) +
+        category_weight('pci') + category_weight('medical') + category_weight('company')
+    )
+    dsv = DataElement.objects.filter(application=OuterRef('pk')).order_by().values('application').annotate(dsv=dsv).values('dsv')
+    Application.objects.update(calculated_dsv=Coalesce(Subquery(dsv, output_field=FloatField()), Value(0.0)))
+
+    levels = [When(calculated_dsv__lt=threshold, then=Value(level)) for threshold, level in [(15, 1), (100, 2), (150, 3)]]
+    Application.objects.update(calculated_dcl=Case(*levels, default=Value(4), output_field=IntegerField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boh', '0011_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='application',
+            name='calculated_dcl',
+            field=models.IntegerField(choices=[(None, 'Not Specified'), (1, 'DCL 1'), (2, 'DCL 2'), (3, 'DCL 3'), (4, 'DCL 4')], db_index=True, default=1, editable=False, help_text='The data classification level of the selected data elements.'),
+        ),
+        migrations.AddField(
+            model_name='application',
+            name='calculated_dsv',
+            field=models.FloatField(default=0.0, editable=False, help_text='The data sensitivity value of the selected data elements.'),
+        ),
+        migrations.RunPython(refresh_data_classification, migrations.RunPython.noop),
+    ]
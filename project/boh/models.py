@@ -4,14 +4,14 @@ import re
 import phonenumbers
 
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
 from django.utils import timezone
 from django.utils.translation import ugettext as _
 
-from .behaviors import TimeStampedModel
-from . import helpers, managers
+from .behaviors import DirtyFieldsModel, TimeStampedModel
+from . import managers
 
 
 class Tag(models.Model):
@@ -371,11 +371,14 @@ class Application(TimeStampedModel, models.Model):
     data_elements = models.ManyToManyField(DataElement, blank=True)
     override_dcl = models.IntegerField(choices=DATA_CLASSIFICATION_CHOICES, blank=True, null=True, help_text=_('Overrides the calculated data classification level.'))
     override_reason = models.TextField(blank=True, help_text=_('Specify why the calculated data classification level is being overridden.'))
+    calculated_dsv = models.FloatField(default=0.0, editable=False, help_text=_('The data sensitivity value of the selected data elements.'))
+    calculated_dcl = models.IntegerField(choices=DATA_CLASSIFICATION_CHOICES, default=DCL_1, editable=False, db_index=True, help_text=_('The data classification level of the selected data elements.'))
 
     # ThreadFix
     threadfix = models.ForeignKey(ThreadFix, blank=True, null=True, help_text=_('The ThreadFix service to connect to this application.'))
     threadfix_team_id = models.PositiveIntegerField(blank=True, null=True, help_text=_('The unique team identifier used within ThreadFix.'))
     threadfix_application_id = models.PositiveIntegerField(blank=True, null=True, help_text=_('The unique application identifier used within ThreadFix.'))
+    latest_threadfix_metrics = models.ForeignKey('ThreadFixMetrics', blank=True, null=True, editable=False, related_name='+', on_delete=models.SET_NULL, help_text=_('The most recent ThreadFix metrics for this application.'))
 
     # OWASP
     # TODO Move to OWASP ASVS Benchmark
@@ -409,12 +412,12 @@ class Application(TimeStampedModel, models.Model):
         return self.name
 
     def data_classification_level(self):
-        """Returns the data classification level of the selected data elements."""
-        return helpers.data_classification_level(self.data_sensitivity_value())
+        """Returns the overridden data classification level, or else the one calculated from the selected data elements."""
+        return self.override_dcl or self.calculated_dcl
 
     def data_sensitivity_value(self):
         """Returns the calculated data sensitivity value of the selected data elements."""
-        return helpers.data_sensitivity_value(self.data_elements.all())
+        return self.calculated_dsv
 
     def is_new(self):
         """Returns true if the application was created in the last 7 days"""
@@ -437,14 +440,22 @@ class ThreadFixMetrics(TimeStampedModel, models.Model):
     medium_count = models.PositiveIntegerField(default=0)
     low_count = models.PositiveIntegerField(default=0)
     informational_count = models.PositiveIntegerField(default=0)
+    checked_date = models.DateTimeField(default=timezone.now, editable=False, help_text=_('The date and time when ThreadFix last reported these counts.'))
 
     application = models.ForeignKey(Application)
 
+    objects = managers.ThreadFixMetricsManager.from_queryset(managers.ThreadFixMetricsQuerySet)()
+
     class Meta:
         get_latest_by = 'created_date'
+        index_together = ('application', 'created_date')
         verbose_name = _('ThreadFix metrics')
         verbose_name_plural = _('ThreadFix metrics')
 
+    def counts(self):
+        """Returns the vulnerability counts ordered from critical to informational."""
+        return self.critical_count, self.high_count, self.medium_count, self.low_count, self.informational_count
+
     def total(self):
         return self.critical_count + self.high_count + self.medium_count + self.low_count + self.informational_count
 
@@ -524,7 +535,7 @@ class EnvironmentCredentials(TimeStampedModel, models.Model):
         ordering = ['username', 'password']
 
 
-class Engagement(TimeStampedModel, models.Model):
+class Engagement(TimeStampedModel, DirtyFieldsModel, models.Model):
     """Container for activities performed for an application over a duration."""
 
     PENDING_STATUS = 'pending'
@@ -537,11 +548,11 @@ class Engagement(TimeStampedModel, models.Model):
     )
 
     status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING_STATUS)
-    start_date = models.DateField(help_text=_('The date the engagement is scheduled to begin.'))
+    start_date = models.DateField(db_index=True, help_text=_('The date the engagement is scheduled to begin.'))
     end_date = models.DateField(help_text=_('The date the engagement is scheduled to complete.'))
     description = models.TextField(blank=True)
 
-    open_date = models.DateTimeField(blank=True, null=True, help_text=_('The date and time when the status is changed to open.'))
+    open_date = models.DateTimeField(blank=True, null=True, db_index=True, help_text=_('The date and time when the status is changed to open.'))
     close_date = models.DateTimeField(blank=True, null=True, help_text=_('The date and time when the status is changed to closed.'))
     duration = models.DurationField(blank=True, null=True)
 
@@ -551,16 +562,18 @@ class Engagement(TimeStampedModel, models.Model):
     objects = managers.EngagementManager.from_queryset(managers.EngagementQuerySet)()
     metrics = managers.EngagementMetrics.from_queryset(managers.EngagementQuerySet)()
 
+    guarded_fields = ('status',)
+
     class Meta:
         get_latest_by = 'close_date'
         ordering = ['start_date']
+        index_together = (('status', 'start_date'),)
 
     def save(self, *args, **kwargs):
         """Automatically sets the open and closed dates when the status changes."""
         if self.pk is not None:
-            engagement = Engagement.objects.get(pk=self.pk)
             now = timezone.now()
-            if engagement.status != self.status:
+            if self.has_changed('status'):
                 if self.status == Engagement.PENDING_STATUS:
                     self.open_date = None
                     self.close_date = None
@@ -616,7 +629,7 @@ class ActivityType(TimeStampedModel, models.Model):
         return self.name
 
 
-class Activity(models.Model):
+class Activity(DirtyFieldsModel, models.Model):
     """A unit of work performed for an application over a duration."""
 
     PENDING_STATUS = 'pending'
@@ -639,9 +652,13 @@ class Activity(models.Model):
     users = models.ManyToManyField(settings.AUTH_USER_MODEL, blank=True)
 
     objects = managers.ActivityManager.from_queryset(managers.ActivityQuerySet)()
+    metrics = managers.ActivityMetrics.from_queryset(managers.ActivityQuerySet)()
+
+    guarded_fields = ('status',)
 
     class Meta:
         ordering = ['engagement__start_date']
+        index_together = ('status', 'engagement')
         verbose_name_plural = _('Activities')
 
     def __str__(self):
@@ -653,38 +670,30 @@ class Activity(models.Model):
         Opens parent engagement if child activity is opened.
         Closes parent engagement if all child activities are closed.
         """
-        if self.pk is not None:
-            activity = Activity.objects.get(pk=self.pk)
-            if activity.status != self.status:  # When status changed
-                now = timezone.now()
-                if self.status == Activity.PENDING_STATUS:
-                    self.open_date = None
-                    self.close_date = None
-                elif self.status == Activity.OPEN_STATUS:
+        status_changed = self.pk is not None and self.has_changed('status')
+        if status_changed:
+            now = timezone.now()
+            if self.status == Activity.PENDING_STATUS:
+                self.open_date = None
+                self.close_date = None
+            elif self.status == Activity.OPEN_STATUS:
+                self.open_date = now
+                self.close_date = None
+            elif self.status == Activity.CLOSED_STATUS:
+                if self.open_date is None:
                     self.open_date = now
-                    self.close_date = None
-
-                    # Open the parent engagement if the activity is opened
-                    if self.engagement.status is not Engagement.OPEN_STATUS:
-                        self.engagement.status = Engagement.OPEN_STATUS
-                        self.engagement.save()
-                elif self.status == Activity.CLOSED_STATUS:
-                    if self.open_date is None:
-                        self.open_date = now
-                    self.close_date = now
-
-                    # If all of the parent engagement activities are closed, close the parent engagement
-                    close = True
-                    for current_activity in self.engagement.activity_set.exclude(id=self.id):
-                        if current_activity.status != Activity.CLOSED_STATUS:
-                            close = False
-                            break
-                    if close:
-                        self.engagement.status = Engagement.CLOSED_STATUS
-                        self.engagement.save()
+                self.close_date = now
         if self.open_date is not None and self.close_date is not None:
             self.duration = self.close_date - self.open_date
-        super(Activity, self).save(*args, **kwargs)
+
+        with transaction.atomic(savepoint=False):
+            if status_changed:
+                Activity.objects.filter(pk=self.pk).lock_engagements()
+            super(Activity, self).save(*args, **kwargs)
+            if status_changed:
+                Activity.objects.filter(pk=self.pk).update_engagements(self.status)
+                if Activity.engagement.is_cached(self):
+                    self.engagement.refresh_from_db(fields=['status', 'open_date', 'close_date', 'duration', 'modified_date'])
 
     def is_pending(self):
         return self.status == Activity.PENDING_STATUS
@@ -734,3 +743,134 @@ class ActivityComment(Comment):
     """Comment for a specific activity."""
 
     activity = models.ForeignKey(Activity)
+
+
+class ReportJob(TimeStampedModel, models.Model):
+    """A report queued to be generated in the background by the report worker."""
+
+    ENGAGEMENT_COVERAGE_REPORT = 'engagement_coverage'
+    THREADFIX_SUMMARY_REPORT = 'threadfix_summary'
+    APP_SUMMARY_REPORT = 'app_summary'
+    REPORT_TYPE_CHOICES = (
+        (ENGAGEMENT_COVERAGE_REPORT, _('Engagement Coverage Report')),
+        (THREADFIX_SUMMARY_REPORT, _('ThreadFix Summary Report')),
+        (APP_SUMMARY_REPORT, _('Application Summary Report')),
+    )
+
+    PENDING_STATUS = 'pending'
+    RUNNING_STATUS = 'running'
+    COMPLETED_STATUS = 'completed'
+    FAILED_STATUS = 'failed'
+    STATUS_CHOICES = (
+        (PENDING_STATUS, _('Pending')),
+        (RUNNING_STATUS, _('Running')),
+        (COMPLETED_STATUS, _('Completed')),
+        (FAILED_STATUS, _('Failed')),
+    )
+
+    report_type = models.CharField(max_length=19, choices=REPORT_TYPE_CHOICES)
+    file_name = models.CharField(max_length=64)
+    file_format = models.CharField(max_length=4)
+    status = models.CharField(max_length=9, choices=STATUS_CHOICES, default=PENDING_STATUS)
+    file = models.FileField(upload_to='reports/%Y/%m/', blank=True, help_text=_('The generated report.'))
+    error = models.TextField(blank=True, help_text=_('Information about why the report could not be generated.'))
+
+    start_date = models.DateTimeField(blank=True, null=True, help_text=_('The date and time when the report worker began generating the report.'))
+    completed_date = models.DateTimeField(blank=True, null=True, help_text=_('The date and time when the report worker finished.'))
+
+    organizations = models.ManyToManyField(Organization, blank=True)
+    applications = models.ManyToManyField(Application, blank=True)
+    requester = models.ForeignKey(settings.AUTH_USER_MODEL)
+
+    objects = managers.ReportJobManager.from_queryset(managers.ReportJobQuerySet)()
+
+    class Meta:
+        get_latest_by = 'created_date'
+        ordering = ['-created_date']
+
+    def __str__(self):
+        return self.file_name + '.' + self.file_format
+
+    def is_pending(self):
+        return self.status == ReportJob.PENDING_STATUS
+
+    def is_running(self):
+        return self.status == ReportJob.RUNNING_STATUS
+
+    def is_completed(self):
+        return self.status == ReportJob.COMPLETED_STATUS
+
+    def is_failed(self):
+        return self.status == ReportJob.FAILED_STATUS
+
+
+class DailyMetrics(models.Model):
+    """Pre-aggregated engagement and activity counts for each day opened, status, organization and activity type."""
+
+    ENGAGEMENT_KIND = 'engagement'
+    ACTIVITY_KIND = 'activity'
+    KIND_CHOICES = (
+        (ENGAGEMENT_KIND, _('Engagement')),
+        (ACTIVITY_KIND, _('Activity')),
+    )
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    day = models.DateField(blank=True, null=True, help_text=_('The day the engagements or activities were opened.'))
+    status = models.CharField(max_length=7)
+    organization = models.ForeignKey(Organization, related_name='daily_metrics')
+    activity_type = models.ForeignKey(ActivityType, blank=True, null=True, related_name='daily_metrics')
+
+    count = models.PositiveIntegerField(default=0)
+    duration_count = models.PositiveIntegerField(default=0, help_text=_('The number of engagements or activities with a duration.'))
+    total_duration = models.DurationField(default=timedelta(0))
+
+    objects = managers.DailyMetricsManager.from_queryset(managers.DailyMetricsQuerySet)()
+
+    class Meta:
+        index_together = ('kind', 'day')
+        unique_together = (('kind', 'day', 'status', 'organization', 'activity_type'),)
+        verbose_name_plural = _('Daily metrics')
+
+    def __str__(self):
+        return '%s %s %s: %d' % (self.kind, self.day, self.status, self.count)
+
+
+class SearchTerm(models.Model):
+    """An inverted index entry recording how strongly a term occurs in a searchable object."""
+
+    APPLICATION_KIND = 'application'
+    PERSON_KIND = 'person'
+    ENGAGEMENT_KIND = 'engagement'
+    ENGAGEMENT_COMMENT_KIND = 'engagement_comment'
+    ACTIVITY_COMMENT_KIND = 'activity_comment'
+    KIND_CHOICES = (
+        (APPLICATION_KIND, _('Application')),
+        (PERSON_KIND, _('Person')),
+        (ENGAGEMENT_KIND, _('Engagement')),
+        (ENGAGEMENT_COMMENT_KIND, _('Engagement Comment')),
+        (ACTIVITY_COMMENT_KIND, _('Activity Comment')),
+    )
+
+    term = models.CharField(max_length=64)
+    kind = models.CharField(max_length=18, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    weight = models.PositiveIntegerField(help_text=_('The number of occurrences of the term, multiplied by the weight of each field it occurs in.'))
+
+    objects = managers.SearchTermManager.from_queryset(managers.SearchTermQuerySet)()
+
+    class Meta:
+        # The first index answers searches without reading the table, the second reindexes objects
+        index_together = (('term', 'kind', 'object_id', 'weight'), ('kind', 'object_id'))
+
+    def __str__(self):
+        return '%s %s %d: %d' % (self.term, self.kind, self.object_id, self.weight)
+
+
+class FragmentVersion(models.Model):
+    """The current version of a cached fragment, kept in the database so every process sees when it was invalidated."""
+
+    name = models.CharField(max_length=64, unique=True)
+    version = models.CharField(max_length=12)
+
+    def __str__(self):
+        return '%s %s' % (self.name, self.version)
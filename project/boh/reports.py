@@ -1,40 +1,165 @@
+import csv
+import hashlib
+
 from django.conf import settings
-from django.http import HttpResponse
-from django.template import loader, Context
+from django.core.cache import caches
+from django.db.models import Count, Max, Prefetch, prefetch_related_objects
+from django.template import loader
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from . import models
 
 
+def latest_engagements():
+    """Prefetches each application's latest engagement and its activities into 'latest_engagements'."""
+    return Prefetch(
+        'engagement_set',
+        queryset=models.Engagement.objects.latest_per_application().prefetch_related(
+            Prefetch('activity_set', queryset=models.Activity.objects.select_related('activity_type'))
+        ),
+        to_attr='latest_engagements'
+    )
+
+
+def organization_applications(organizations):
+    """Returns the applications of the organizations, or every application when no organizations are selected."""
+    applications = models.Application.objects.all()
+    if organizations:
+        applications = applications.filter(organization__in=organizations)
+    return applications.order_by('organization__name', 'name')
+
+
+def chunked(iterable, size):
+    """Yields lists of up to size items from the iterable."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def joined(items):
+    return ', '.join(str(item) for item in items)
+
+
+class Echo(object):
+    """A file-like object which returns what is written so csv.writer output can be streamed."""
+
+    def write(self, value):
+        return value
+
+
+def selected_ids(objects):
+    """Returns the sorted primary keys of the selected objects, or an empty tuple when nothing is selected."""
+    if not objects:
+        return ()
+    return tuple(sorted(obj.pk for obj in objects))
+
+
+def data_version():
+    """
+    Returns a stamp which changes whenever applications, engagements or ThreadFix metrics are added, changed or deleted.
+    Changes to activities and activity types mark their engagements as modified, and changes to the tags, data elements,
+    technologies and regulations of applications mark the applications as modified, so they are covered too.
+    """
+    version = []
+    for model in (models.Application, models.Engagement, models.ThreadFixMetrics):
+        stats = model.objects.aggregate(Count('id'), Max('modified_date'))
+        version.append((stats['id__count'], stats['modified_date__max']))
+    return tuple(version)
+
+
+def cache():
+    return caches[settings.REPORT_CACHE]
+
+
+def from_job(job):
+    """Returns the report described by a ReportJob."""
+    if job.report_type == models.ReportJob.ENGAGEMENT_COVERAGE_REPORT:
+        return EngagementCoverageReport(job.file_name, job.file_format, job.organizations.all(), job.requester)
+    elif job.report_type == models.ReportJob.THREADFIX_SUMMARY_REPORT:
+        return ThreadFixSummaryReport(job.file_name, job.file_format, job.organizations.all(), job.requester)
+    elif job.report_type == models.ReportJob.APP_SUMMARY_REPORT:
+        return AppSummaryReport(job.file_name, job.file_format, job.applications.all(), job.requester)
+    raise ValueError(_('Unknown report type: %(report_type)s') % {'report_type': job.report_type})
+
+
 class Report(object):
     """Base class used for generating reports."""
 
+    chunk_size = 500  # Applications prefetched at a time when streaming CSV rows
+
+    content_types = {
+        'csv': 'text/csv',
+        'html': 'text/html'
+    }
+
     def __init__(self, report_type, file_name, file_format, requester):
         self.report_type = report_type
         self.file_name = file_name
         self.file_format = file_format
         self.requester = requester
 
-        content_types = {
-            'csv': 'text/csv',
-            'html': 'text/html'
-        }
-
-        self.content_type = content_types[file_format]
+        self.content_type = self.content_types[file_format]
 
     def __str__(self):
         return '%s: %s.%s' % (self.report_type, self.file_name, self.file_format)
 
+    def queryset(self):
+        """Plans the single, fully prefetched queryset rendered by the report."""
+        raise NotImplementedError(_('Subclasses must override queryset()'))
+
+    def selection(self):
+        """Returns the ids of the objects the report was requested for."""
+        raise NotImplementedError(_('Subclasses must override selection()'))
+
+    def cache_key(self):
+        """
+        Identifies the report output by its inputs and the current data version. HTML reports name the requester and
+        the date they were created, so they are only shared with the same requester on the same day.
+        """
+        key = (type(self).__name__, self.file_format, self.selection(), data_version())
+        if self.file_format == 'html':
+            key += (getattr(self.requester, 'pk', None), timezone.now().date())
+        return 'reports.%s' % hashlib.md5(repr(key).encode('utf-8')).hexdigest()
+
     def generate(self):
         raise NotImplementedError(_('Subclasses must override generate()'))
 
-    def response(self):
-        response = HttpResponse(content_type=self.content_type)
-        if not settings.DEBUG:
-            response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (self.file_name, self.file_format)
-        response.write(self.generate())
-        return response
+    def rows(self):
+        """Yields the CSV header followed by each row, iterating the database in bounded chunks."""
+        raise NotImplementedError(_('Subclasses must override rows()'))
+
+    def stream(self):
+        """Yields the CSV report one line at a time."""
+        writer = csv.writer(Echo())
+        for row in self.rows():
+            yield writer.writerow(row)
+
+    def write(self, output):
+        """Writes the report to a binary file-like object, reusing the cached output of an identical earlier report."""
+        key = self.cache_key()
+        content = cache().get(key)
+        if content is not None:
+            output.write(content)
+            return
+
+        parts = []
+        size = 0
+        for part in self.stream() if self.file_format == 'csv' else [self.generate()]:
+            part = part.encode('utf-8')
+            output.write(part)
+            size += len(part)
+            if parts is not None and size <= settings.REPORT_CACHE_MAX_SIZE:
+                parts.append(part)
+            else:
+                parts = None  # Too large to cache
+        if parts is not None:
+            cache().set(key, b''.join(parts), settings.REPORT_CACHE_TIMEOUT)
 
 
 class EngagementCoverageReport(Report):
@@ -43,20 +168,49 @@ class EngagementCoverageReport(Report):
         super(EngagementCoverageReport, self).__init__(_('Engagement Coverage Report'), file_name, file_format, requester)
         self.organizations = organizations
 
-    def generate(self):
-        if not self.organizations:
-            self.organizations = models.Organization.objects.all()
+    def selection(self):
+        return selected_ids(self.organizations)
+
+    def queryset(self):
+        organizations = self.organizations
+        if not organizations:
+            organizations = models.Organization.objects.all()
+
+        return organizations.prefetch_related(
+            Prefetch('application_set', queryset=models.Application.objects.prefetch_related(latest_engagements()))
+        )
 
+    def generate(self):
         if self.file_format == 'html':
             template = loader.get_template('boh/reports/engagement_coverage.html')
-            context = Context({
+            context = {
                 'current_datetime': timezone.now(),
                 'requester': self.requester,
-                'organizations': self.organizations
-            })
+                'organizations': self.queryset()
+            }
             return template.render(context)
         else:
-            return 'test, test'
+            return ''.join(self.stream())
+
+    def rows(self):
+        yield [_('Organization'), _('Application Name'), _('Criticality'), _('Last Engagement'), _('Elapsed Days'), _('Activities')]
+
+        today = timezone.now().date()
+        applications = organization_applications(self.organizations).select_related('organization').iterator()
+        for chunk in chunked(applications, self.chunk_size):
+            prefetch_related_objects(chunk, latest_engagements())
+            for application in chunk:
+                row = [application.organization.name, application.name, application.get_business_criticality_display()]
+                if application.latest_engagements:
+                    engagement = application.latest_engagements[0]
+                    row += [
+                        engagement.end_date,
+                        (today - engagement.end_date).days,
+                        joined(activity.activity_type for activity in engagement.activity_set.all())
+                    ]
+                else:
+                    row += [None] * 3
+                yield row
 
 
 class ThreadFixSummaryReport(Report):
@@ -65,20 +219,45 @@ class ThreadFixSummaryReport(Report):
         super(ThreadFixSummaryReport, self).__init__(_('ThreadFix Summary Report'), file_name, file_format, requester)
         self.organizations = organizations
 
-    def generate(self):
-        if not self.organizations:
-            self.organizations = models.Organization.objects.all()
+    def selection(self):
+        return selected_ids(self.organizations)
+
+    def queryset(self):
+        organizations = self.organizations
+        if not organizations:
+            organizations = models.Organization.objects.all()
+
+        return organizations.prefetch_related(
+            Prefetch('application_set', queryset=models.Application.objects.select_related('latest_threadfix_metrics'))
+        )
 
+    def generate(self):
         if self.file_format == 'html':
             template = loader.get_template('boh/reports/threadfix_summary.html')
-            context = Context({
+            context = {
                 'current_datetime': timezone.now(),
                 'requester': self.requester,
-                'organizations': self.organizations
-            })
+                'organizations': self.queryset()
+            }
             return template.render(context)
         else:
-            return 'test, test'
+            return ''.join(self.stream())
+
+    def rows(self):
+        yield [
+            _('Organization'), _('Application Name'), _('Critical'), _('High'), _('Medium'), _('Low'), _('Info'),
+            _('Total'), _('Updated')
+        ]
+
+        applications = organization_applications(self.organizations).select_related('organization', 'latest_threadfix_metrics')
+        for application in applications.iterator():
+            row = [application.organization.name, application.name]
+            metrics = application.latest_threadfix_metrics
+            if metrics:
+                row += list(metrics.counts()) + [metrics.total(), metrics.created_date.date()]
+            else:
+                row += [None] * 7
+            yield row
 
 
 class AppSummaryReport(Report):
@@ -87,17 +266,68 @@ class AppSummaryReport(Report):
         super(AppSummaryReport, self).__init__(_('Application Summary Report'), file_name, file_format, requester)
         self.applications = applications
 
-    def generate(self):
-        if not self.applications:
-            self.applications = models.Application.objects.all()
+    def selection(self):
+        return selected_ids(self.applications)
 
+    def queryset(self):
+        applications = self.applications
+        if not applications:
+            applications = models.Application.objects.all()
+
+        return applications.select_related('latest_threadfix_metrics').prefetch_related(
+            latest_engagements(), 'technologies', 'regulations', 'data_elements', 'people'
+        )
+
+    def generate(self):
         if self.file_format == 'html':
             template = loader.get_template('boh/reports/app_summary.html')
-            context = Context({
+            context = {
                 'current_datetime': timezone.now(),
                 'requester': self.requester,
-                'applications': self.applications
-            })
+                'applications': self.queryset()
+            }
             return template.render(context)
         else:
-            return 'test, test'
+            return ''.join(self.stream())
+
+    def rows(self):
+        yield [
+            _('Application Name'), _('Organization'), _('Criticality'), _('Data Classification Level'), _('ASVS Level'),
+            _('ASVS Percent Achieved'), _('ASVS Level Target'), _('Critical'), _('High'), _('Medium'), _('Low'),
+            _('Info'), _('Total'), _('Last Engagement'), _('Activities'), _('Technologies'), _('Regulations'),
+            _('Data Elements'), _('People')
+        ]
+
+        applications = self.applications
+        if not applications:
+            applications = models.Application.objects.all()
+        applications = applications.select_related('organization', 'latest_threadfix_metrics').iterator()
+
+        for chunk in chunked(applications, self.chunk_size):
+            prefetch_related_objects(chunk, latest_engagements(), 'technologies', 'regulations', 'data_elements', 'people')
+            for application in chunk:
+                row = [
+                    application.name, application.organization.name, application.get_business_criticality_display(),
+                    application.data_classification_level(), application.asvs_level, application.asvs_level_percent_achieved,
+                    application.asvs_level_target
+                ]
+
+                metrics = application.latest_threadfix_metrics
+                if metrics:
+                    row += list(metrics.counts()) + [metrics.total()]
+                else:
+                    row += [None] * 6
+
+                if application.latest_engagements:
+                    engagement = application.latest_engagements[0]
+                    row += [engagement.end_date, joined(activity.activity_type for activity in engagement.activity_set.all())]
+                else:
+                    row += [None, None]
+
+                row += [
+                    joined(technology.name for technology in application.technologies.all()),
+                    joined(regulation.acronym for regulation in application.regulations.all()),
+                    joined(data_element.name for data_element in application.data_elements.all()),
+                    joined(application.people.all())
+                ]
+                yield row
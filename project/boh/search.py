@@ -0,0 +1,159 @@
+import collections
+import re
+
+from django.core.urlresolvers import reverse
+from django.utils.text import Truncator
+from django.utils.translation import ugettext_lazy as _
+
+from . import models
+
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 8
+
+Result = collections.namedtuple('Result', ['kind', 'label', 'title', 'summary', 'url', 'score'])
+
+
+def tokenize(text):
+    """Splits text into lowercase word terms."""
+    return [token[:MAX_TERM_LENGTH] for token in TOKEN_PATTERN.findall((text or '').lower())]
+
+
+class Document(object):
+    """Describes which fields of a model are indexed for search and how matching objects are shown."""
+
+    kind = None
+    model_name = None
+    label = None
+    fields = []  # (field path, weight) pairs, paths may span relations
+    select_related = []
+
+    def terms(self, model, pks):
+        """Returns the weight of every term in each of the objects, keyed by primary key."""
+        weights = collections.defaultdict(collections.Counter)
+        queryset = model._default_manager.filter(pk__in=pks).order_by()
+        for path, weight in self.fields:
+            for pk, text in queryset.values_list('pk', path):
+                for term in tokenize(text):
+                    weights[pk][term] += weight
+        return weights
+
+    def objects(self, pks):
+        model = getattr(models, self.model_name)
+        return model.objects.select_related(*self.select_related).in_bulk(pks)
+
+    def title(self, obj):
+        return str(obj)
+
+    def summary(self, obj):
+        return ''
+
+    def url(self, obj):
+        raise NotImplementedError()
+
+
+class ApplicationDocument(Document):
+    kind = models.SearchTerm.APPLICATION_KIND
+    model_name = 'Application'
+    label = _('Application')
+    fields = [('name', 8), ('description', 1), ('applicationcustomfieldvalue__value', 2)]
+    select_related = ['organization']
+
+    def summary(self, obj):
+        return obj.organization.name
+
+    def url(self, obj):
+        return reverse('boh:application.overview', args=[obj.id])
+
+
+class PersonDocument(Document):
+    kind = models.SearchTerm.PERSON_KIND
+    model_name = 'Person'
+    label = _('Person')
+    fields = [('first_name', 8), ('last_name', 8), ('email', 4)]
+
+    def summary(self, obj):
+        return obj.email
+
+    def url(self, obj):
+        return reverse('boh:person.detail', args=[obj.id])
+
+
+class EngagementDocument(Document):
+    kind = models.SearchTerm.ENGAGEMENT_KIND
+    model_name = 'Engagement'
+    label = _('Engagement')
+    fields = [('description', 1)]
+    select_related = ['application']
+
+    def title(self, obj):
+        return obj.application.name
+
+    def summary(self, obj):
+        return Truncator(obj.description).words(24)
+
+    def url(self, obj):
+        return reverse('boh:engagement.detail', args=[obj.id])
+
+
+class EngagementCommentDocument(Document):
+    kind = models.SearchTerm.ENGAGEMENT_COMMENT_KIND
+    model_name = 'EngagementComment'
+    label = _('Engagement Comment')
+    fields = [('message', 1)]
+    select_related = ['engagement__application']
+
+    def title(self, obj):
+        return obj.engagement.application.name
+
+    def summary(self, obj):
+        return Truncator(obj.message).words(24)
+
+    def url(self, obj):
+        return reverse('boh:engagement.detail', args=[obj.engagement_id])
+
+
+class ActivityCommentDocument(Document):
+    kind = models.SearchTerm.ACTIVITY_COMMENT_KIND
+    model_name = 'ActivityComment'
+    label = _('Activity Comment')
+    fields = [('message', 1)]
+    select_related = ['activity__activity_type', 'activity__engagement__application']
+
+    def title(self, obj):
+        return '%s - %s' % (obj.activity.engagement.application.name, obj.activity.activity_type.name)
+
+    def summary(self, obj):
+        return Truncator(obj.message).words(24)
+
+    def url(self, obj):
+        return reverse('boh:activity.detail', args=[obj.activity_id])
+
+
+documents = collections.OrderedDict((document.kind, document) for document in [
+    ApplicationDocument(), PersonDocument(), EngagementDocument(), EngagementCommentDocument(), ActivityCommentDocument()
+])
+
+
+def kind(model):
+    """Returns the kind of search document indexing the model."""
+    return next(document.kind for document in documents.values() if document.model_name == model.__name__)
+
+
+def search(query, limit=50):
+    """Returns the best matching objects of every kind, most relevant first."""
+    matches = models.SearchTerm.objects.search(query, limit=limit)
+
+    pks = collections.defaultdict(list)
+    for match in matches:
+        pks[match['kind']].append(match['object_id'])
+    objects = {match_kind: documents[match_kind].objects(kind_pks) for match_kind, kind_pks in pks.items()}
+
+    results = []
+    for match in matches:
+        document = documents[match['kind']]
+        obj = objects[match['kind']].get(match['object_id'])
+        if obj is not None:  # Deleted without signals since it was indexed
+            results.append(Result(document.kind, document.label, document.title(obj), document.summary(obj), document.url(obj), match['score']))
+    return results
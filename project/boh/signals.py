@@ -0,0 +1,231 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import fragments, models, search
+from .behaviors import DirtyFieldsModel
+
+
+# Fields deciding which rollup row an engagement or activity counts towards and what it adds to it
+DAILY_METRICS_FIELDS = {
+    models.Engagement: ['status', 'open_date', 'duration', 'application'],
+    models.Activity: ['status', 'open_date', 'duration', 'engagement', 'activity_type'],
+}
+
+
+@receiver([post_save, post_delete], sender=models.ThreadFixMetrics)
+def refresh_latest_threadfix_metrics(sender, instance, **kwargs):
+    """Keeps the application's latest ThreadFix metrics up to date when metrics are saved or deleted."""
+    models.Application.objects.filter(pk=instance.application_id).refresh_latest_threadfix_metrics()
+
+
+@receiver(m2m_changed, sender=models.Application.tags.through)
+@receiver(m2m_changed, sender=models.Application.data_elements.through)
+@receiver(m2m_changed, sender=models.Application.technologies.through)
+@receiver(m2m_changed, sender=models.Application.regulations.through)
+@receiver(m2m_changed, sender=models.Application.service_level_agreements.through)
+def touch_application_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    """Marks applications as modified when their many-to-many relations change."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if not reverse:
+        applications = models.Application.objects.filter(pk=instance.pk)
+    elif pk_set is not None:
+        applications = models.Application.objects.filter(pk__in=pk_set)
+    else:
+        rows = sender.objects.filter(**{instance._meta.model_name: instance})
+        applications = models.Application.objects.filter(pk__in=rows.values('application_id'))
+    applications.touch()
+
+
+@receiver(m2m_changed, sender=models.Organization.people.through)
+def touch_organization_people(sender, instance, action, reverse, pk_set, **kwargs):
+    """Marks applications as modified when the people of their organization change."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if not reverse:
+        applications = models.Application.objects.filter(organization=instance)
+    elif pk_set is not None:
+        applications = models.Application.objects.filter(organization__in=pk_set)
+    else:
+        applications = models.Application.objects.filter(organization__people=instance)
+    applications.touch()
+
+
+@receiver([post_save, post_delete], sender=models.Relation)
+def touch_relation(sender, instance, **kwargs):
+    models.Application.objects.filter(pk=instance.application_id).touch()
+
+
+@receiver(post_save, sender=models.Organization)
+def touch_organization(sender, instance, created, **kwargs):
+    if not created:
+        instance.application_set.all().touch()
+
+
+@receiver([post_save, pre_delete], sender=models.Person)
+def touch_person(sender, instance, **kwargs):
+    """Marks the applications and engagements showing a person as modified when the person changes."""
+    if kwargs.get('created'):
+        return
+    instance.application_set.all().touch()
+    models.Application.objects.filter(organization__people=instance).touch()
+    instance.engagement_set.all().touch()
+
+
+@receiver([post_save, post_delete], sender=models.Activity)
+def touch_activity_engagement(sender, instance, **kwargs):
+    """Marks the engagement of an activity as modified when the activity type shown with it changes."""
+    if kwargs.get('signal') is post_save and not instance.has_changed('engagement', 'activity_type'):
+        return
+    models.Engagement.objects.filter(pk=instance.engagement_id).touch()
+
+
+@receiver(post_save, sender=models.ActivityType)
+def touch_activity_type(sender, instance, created, **kwargs):
+    if not created:
+        models.Engagement.objects.filter(activity__activity_type=instance).distinct().touch()
+
+
+@receiver([post_save, pre_delete], sender=models.Tag)
+@receiver([post_save, pre_delete], sender=models.DataElement)
+@receiver([post_save, pre_delete], sender=models.Technology)
+@receiver([post_save, pre_delete], sender=models.Regulation)
+def touch_application_related(sender, instance, **kwargs):
+    """Marks the applications showing a tag, data element, technology or regulation as modified when it changes."""
+    if kwargs.get('created'):
+        return
+    instance.application_set.all().touch()
+
+
+@receiver(m2m_changed, sender=models.Application.data_elements.through)
+def refresh_application_data_classification(sender, instance, action, reverse, pk_set, **kwargs):
+    """Recomputes the stored data classification of applications when their data elements change."""
+    if action == 'pre_clear' and reverse:
+        instance._data_classification_pks = list(instance.application_set.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        models.Application.objects.filter(pk=instance.pk).refresh_data_classification()
+        instance.refresh_from_db(fields=['calculated_dsv', 'calculated_dcl'])
+    else:
+        pks = instance._data_classification_pks if action == 'post_clear' else pk_set
+        models.Application.objects.filter(pk__in=pks).refresh_data_classification()
+    fragments.invalidate_model(models.Application)
+
+
+@receiver(pre_delete, sender=models.DataElement)
+def remember_data_element_applications(sender, instance, **kwargs):
+    """Records the applications storing a data element before it is deleted with their relations."""
+    instance._data_classification_pks = list(instance.application_set.values_list('pk', flat=True))
+
+
+@receiver([post_save, post_delete], sender=models.DataElement)
+def refresh_data_element_classification(sender, instance, **kwargs):
+    """Recomputes the stored data classification of the applications storing a data element when its weight or category may have changed."""
+    if kwargs.get('created'):
+        return
+    if kwargs['signal'] is post_delete:
+        applications = models.Application.objects.filter(pk__in=instance._data_classification_pks)
+    else:
+        applications = instance.application_set.all()
+    applications.refresh_data_classification()
+    fragments.invalidate_model(models.Application)
+
+
+@receiver([pre_save, pre_delete], sender=models.Engagement)
+@receiver([pre_save, pre_delete], sender=models.Activity)
+def remember_daily_metrics(sender, instance, **kwargs):
+    """Records the rollup row an engagement or activity counted towards before it changes."""
+    instance._daily_metrics_changed = kwargs['signal'] is pre_delete or instance.has_changed(*DAILY_METRICS_FIELDS[sender])
+    instance._daily_metrics_bucket = models.DailyMetrics.objects.bucket(sender, instance.pk) if instance.pk and instance._daily_metrics_changed else None
+    if sender is models.Engagement and instance.pk and kwargs['signal'] is pre_save and instance.has_changed('application'):
+        # The activities count towards the organization of the engagement's application, so they move with it
+        instance._daily_metrics_activity_buckets = models.DailyMetrics.objects.buckets(models.Activity.objects.filter(engagement=instance.pk))
+
+
+@receiver([post_save, post_delete], sender=models.Engagement)
+@receiver([post_save, post_delete], sender=models.Activity)
+def refresh_daily_metrics(sender, instance, **kwargs):
+    """Recomputes the rollup rows an engagement or activity counted towards before and after it changed."""
+    if not getattr(instance, '_daily_metrics_changed', True):
+        return
+    buckets = {getattr(instance, '_daily_metrics_bucket', None)}
+    if kwargs['signal'] is post_save:
+        buckets.add(models.DailyMetrics.objects.bucket(sender, instance.pk))
+    activity_buckets = getattr(instance, '_daily_metrics_activity_buckets', None)
+    if activity_buckets is not None:
+        buckets |= activity_buckets | models.DailyMetrics.objects.buckets(models.Activity.objects.filter(engagement=instance.pk))
+        instance._daily_metrics_activity_buckets = None
+    for bucket in sorted(buckets - {None}, key=repr):
+        models.DailyMetrics.objects.refresh(*bucket)
+
+
+@receiver(pre_save, sender=models.Application)
+def remember_application_organization(sender, instance, **kwargs):
+    """Records the organization an application belonged to before it is saved."""
+    instance._previous_organization_id = models.Application.objects.filter(pk=instance.pk).values_list('organization', flat=True).first() if instance.pk else None
+
+
+@receiver(post_save, sender=models.Application)
+def move_daily_metrics(sender, instance, **kwargs):
+    """Recomputes the rollup rows of an application's engagements and activities under its old and new organizations when it moves."""
+    previous = getattr(instance, '_previous_organization_id', None)
+    if previous is None or previous == instance.organization_id:
+        return
+
+    buckets = models.DailyMetrics.objects.buckets(models.Engagement.objects.filter(application=instance))
+    buckets |= models.DailyMetrics.objects.buckets(models.Activity.objects.filter(engagement__application=instance))
+    for kind, day, organization_id, activity_type_id in buckets:
+        models.DailyMetrics.objects.refresh(kind, day, previous, activity_type_id)
+        models.DailyMetrics.objects.refresh(kind, day, organization_id, activity_type_id)
+
+
+@receiver([post_save, post_delete], sender=models.Application)
+@receiver([post_save, post_delete], sender=models.Organization)
+@receiver([post_save, post_delete], sender=models.Tag)
+@receiver([post_save, post_delete], sender=models.Technology)
+@receiver([post_save, post_delete], sender=models.Regulation)
+@receiver([post_save, post_delete], sender=models.ServiceLevelAgreement)
+def invalidate_fragments(sender, instance, **kwargs):
+    """Discards cached pages showing an object when it is saved or deleted."""
+    fragments.invalidate_model(sender)
+
+
+@receiver(m2m_changed, sender=models.Application.tags.through)
+@receiver(m2m_changed, sender=models.Application.technologies.through)
+@receiver(m2m_changed, sender=models.Application.regulations.through)
+@receiver(m2m_changed, sender=models.Application.service_level_agreements.through)
+def invalidate_application_fragments(sender, instance, action, **kwargs):
+    """Discards cached application pages when the relations they show or filter on change."""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        fragments.invalidate_model(models.Application)
+
+
+@receiver(post_save, sender=models.Application)
+@receiver(post_save, sender=models.Person)
+@receiver(post_save, sender=models.Engagement)
+@receiver(post_save, sender=models.EngagementComment)
+@receiver(post_save, sender=models.ActivityComment)
+def index_search_terms(sender, instance, **kwargs):
+    """Keeps the search index up to date with saved objects."""
+    if isinstance(instance, DirtyFieldsModel) and not instance.has_changed(*[path for path, weight in search.documents[search.kind(sender)].fields]):
+        return
+    models.SearchTerm.objects.index(search.kind(sender), [instance.pk])
+
+
+@receiver(post_delete, sender=models.Application)
+@receiver(post_delete, sender=models.Person)
+@receiver(post_delete, sender=models.Engagement)
+@receiver(post_delete, sender=models.EngagementComment)
+@receiver(post_delete, sender=models.ActivityComment)
+def remove_search_terms(sender, instance, **kwargs):
+    models.SearchTerm.objects.remove(search.kind(sender), [instance.pk])
+
+
+@receiver([post_save, post_delete], sender=models.ApplicationCustomFieldValue)
+def index_application_custom_fields(sender, instance, **kwargs):
+    """Reindexes an application when its custom field values change."""
+    models.SearchTerm.objects.index(models.SearchTerm.APPLICATION_KIND, [instance.application_id])
@@ -0,0 +1,146 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+import requests.exceptions
+from requests.adapters import HTTPAdapter
+
+from django.utils import timezone
+
+from threadfix_api import threadfix
+
+from . import models
+
+
+class ThreadFixClient(threadfix.ThreadFixAPI):
+    """A ThreadFix API wrapper which reuses a single HTTP session and limits the number of requests in flight."""
+
+    def __init__(self, host, api_key, verify_ssl=True, semaphore=None, pool_size=10, **kwargs):
+        super(ThreadFixClient, self).__init__(host=host, api_key=api_key, verify_ssl=verify_ssl, **kwargs)
+        self.semaphore = semaphore or threading.BoundedSemaphore(pool_size)
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _request(self, method, url, params=None, files=None):
+        """Mirrors ThreadFixAPI._request using the shared session."""
+        if not params:
+            params = {}
+        params['apiKey'] = self.api_key
+
+        headers = {
+            'User-Agent': self.user_agent,
+            'Accept': 'application/json'
+        }
+
+        try:
+            with self.semaphore:
+                response = self.session.request(method=method, url=self.host + url, params=params, files=files,
+                                                headers=headers, timeout=self.timeout, verify=self.verify_ssl,
+                                                cert=self.cert)
+
+            try:
+                json_response = response.json()
+                return threadfix.ThreadFixResponse(message=json_response['message'], success=json_response['success'],
+                                                   response_code=json_response['responseCode'],
+                                                   data=json_response['object'])
+            except (ValueError, KeyError):
+                return threadfix.ThreadFixResponse(message='JSON response could not be decoded.', success=False)
+        except requests.exceptions.SSLError:
+            return threadfix.ThreadFixResponse(message='An SSL error occurred.', success=False)
+        except requests.exceptions.ConnectionError:
+            return threadfix.ThreadFixResponse(message='A connection error occurred.', success=False)
+        except requests.exceptions.Timeout:
+            return threadfix.ThreadFixResponse(message='The request timed out after ' + str(self.timeout) + ' seconds.', success=False)
+        except requests.exceptions.RequestException:
+            return threadfix.ThreadFixResponse(message='There was an error while handling the request.', success=False)
+
+    def close(self):
+        self.session.close()
+
+
+class ThreadFixSync(object):
+    """Retrieves the latest ThreadFix metrics for many applications concurrently."""
+
+    batch_size = 500
+
+    def __init__(self, workers=8, requests_per_host=4, delta=False):
+        """
+        :param workers: The number of applications fetched at the same time.
+        :param requests_per_host: The maximum number of requests in flight to a single ThreadFix host.
+        :param delta: Only save metrics for applications whose counts differ from their latest metrics. The latest
+        metrics of unchanged applications have their checked date updated to record when they were last checked.
+        """
+        self.workers = workers
+        self.requests_per_host = requests_per_host
+        self.delta = delta
+        self.errors = []
+        self.unchanged = []
+
+    def run(self, applications):
+        """Fetches metrics for the applications and saves them with a single bulk insert. Returns the new metrics."""
+        queryset = applications
+        applications = list(queryset.select_related('threadfix', 'latest_threadfix_metrics'))
+        clients = self._clients(applications)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                responses = list(executor.map(
+                    lambda application: clients[application.threadfix_id].get_application(application_id=application.threadfix_application_id),
+                    applications
+                ))
+        finally:
+            for client in clients.values():
+                client.close()
+
+        metrics = []
+        for application, response in zip(applications, responses):
+            if response.success:
+                current = models.ThreadFixMetrics(
+                    application=application,
+                    critical_count=response.data['criticalVulnCount'],
+                    high_count=response.data['highVulnCount'],
+                    medium_count=response.data['mediumVulnCount'],
+                    low_count=response.data['lowVulnCount'],
+                    informational_count=response.data['infoVulnCount']
+                )
+                previous = application.latest_threadfix_metrics
+                if self.delta and previous is not None and previous.counts() == current.counts():
+                    self.unchanged.append(previous)
+                else:
+                    metrics.append(current)
+            else:
+                self.errors.append('Unable to retrieve ThreadFix data from "' + application.threadfix.name + '" for "' + application.name + '": ' + response.message)
+
+        if metrics:
+            models.ThreadFixMetrics.objects.bulk_create(metrics)
+            queryset.refresh_latest_threadfix_metrics()  # bulk_create does not send post_save
+
+        now = timezone.now()
+        for index in range(0, len(self.unchanged), self.batch_size):
+            batch = self.unchanged[index:index + self.batch_size]
+            models.ThreadFixMetrics.objects.filter(id__in=[previous.id for previous in batch]).update(checked_date=now)
+
+        return metrics
+
+    def _clients(self, applications):
+        """Builds one client per ThreadFix service. Services on the same host share a request limit."""
+        semaphores = {}
+        clients = {}
+        for application in applications:
+            service = application.threadfix
+            if service.id not in clients:
+                host = urlparse(service.host).netloc
+                if host not in semaphores:
+                    semaphores[host] = threading.BoundedSemaphore(self.requests_per_host)
+                clients[service.id] = ThreadFixClient(
+                    host=service.host,
+                    api_key=service.api_key,
+                    verify_ssl=service.verify_ssl,
+                    semaphore=semaphores[host],
+                    pool_size=self.requests_per_host
+                )
+        return clients
@@ -0,0 +1,181 @@
+import datetime
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from . import models
+
+
+FIRST_NAMES = ['Ada', 'Alan', 'Barbara', 'Claude', 'Donald', 'Edsger', 'Frances', 'Grace', 'Ken', 'Margaret', 'Niklaus', 'Radia']
+LAST_NAMES = ['Allen', 'Dijkstra', 'Hamilton', 'Hopper', 'Knuth', 'Liskov', 'Lovelace', 'Perlman', 'Shannon', 'Thompson', 'Turing', 'Wirth']
+WORDS = [
+    'account', 'audit', 'billing', 'cache', 'customer', 'data', 'export', 'gateway', 'identity', 'import', 'inventory',
+    'ledger', 'login', 'mobile', 'partner', 'payment', 'payroll', 'portal', 'report', 'review', 'search', 'session',
+    'storage', 'token', 'upload', 'vendor', 'workflow'
+]
+
+# Most work in a long lived portfolio is finished
+STATUSES = [models.Engagement.PENDING_STATUS] * 10 + [models.Engagement.OPEN_STATUS] * 15 + [models.Engagement.CLOSED_STATUS] * 75
+
+
+class SyntheticData(object):
+    """
+    Generates a reproducible portfolio of organizations, applications with data elements, people, engagements,
+    activities, comments and daily ThreadFix metrics with bulk inserts. The same seed always generates the same data.
+    Object names start with a prefix, which must differ between runs against the same database.
+    """
+
+    def __init__(self, seed=0, prefix=None, years=5, batch_size=1000):
+        self.rng = random.Random(seed)
+        self.prefix = prefix or 'S%d' % seed
+        self.now = timezone.now()
+        self.days = years * 365
+        self.batch_size = batch_size
+        self.ids = {}  # model -> range of the generated primary keys
+
+    def generate(self, organizations=20, applications=1000, people=500, engagements=10000, activities=100000, comments=50000, threadfix_days=30, users=10, data_elements=4, search_index=True):
+        """Creates the objects, then rebuilds the data signals would have kept up to date."""
+        User = get_user_model()
+        password = make_password(None)
+        self._create(User, users, lambda index: User(username='%s-user-%d' % (self.prefix.lower(), index), password=password))
+        self._create(models.ActivityType, 10, lambda index: models.ActivityType(name='%s Activity Type %d' % (self.prefix, index)))
+        self._create(models.Organization, organizations, lambda index: models.Organization(name='%s Org %d' % (self.prefix, index)))
+        self._create(models.Person, people, self._person)
+        self._create(models.Organization.people.through, organizations * min(5, people), lambda index: models.Organization.people.through(
+            organization_id=self.ids[models.Organization][index // min(5, people)],
+            person_id=self.ids[models.Person][(index * 7919) % people]
+        ))
+        self._create(models.Application, applications, self._application)
+        self._create(models.Relation, applications * min(2, people), lambda index: models.Relation(
+            application_id=self.ids[models.Application][index // min(2, people)],
+            person_id=self.ids[models.Person][(index // min(2, people) + index % min(2, people)) % people],
+            owner=index % min(2, people) == 0
+        ))
+        self._data_elements(data_elements)
+        self._create(models.Engagement, engagements, self._engagement)
+        self._create(models.Activity, activities, self._activity)
+        self._create(models.Activity.users.through, activities * 4 // 5, lambda index: models.Activity.users.through(
+            activity_id=self.ids[models.Activity][index * 5 // 4], user_id=self._pick(User)
+        ))
+        self._create(models.EngagementComment, comments // 2, lambda index: models.EngagementComment(
+            engagement_id=self._pick(models.Engagement), user_id=self._pick(User), message=self._sentence(12)
+        ))
+        self._create(models.ActivityComment, comments - comments // 2, lambda index: models.ActivityComment(
+            activity_id=self._pick(models.Activity), user_id=self._pick(User), message=self._sentence(12)
+        ))
+        self._threadfix_metrics(threadfix_days)
+        self._reset_sequences()
+
+        generated_applications = models.Application.objects.filter(pk__range=(self.ids[models.Application][0], self.ids[models.Application][-1]))
+        generated_applications.refresh_latest_threadfix_metrics()
+        generated_applications.refresh_data_classification()
+        models.DailyMetrics.objects.rebuild()
+        if search_index:
+            models.SearchTerm.objects.rebuild()
+
+        return {model._meta.verbose_name_plural: len(ids) for model, ids in self.ids.items()}
+
+    def _create(self, model, count, build):
+        """Inserts count objects built by index in batches, with sequential primary keys so none are read back."""
+        start = (model._default_manager.aggregate(last=Max('pk'))['last'] or 0) + 1
+        self.ids[model] = range(start, start + count)
+        for offset in range(0, count, self.batch_size):
+            batch = []
+            for index in range(offset, min(offset + self.batch_size, count)):
+                obj = build(index)
+                obj.pk = start + index
+                batch.append(obj)
+            model._default_manager.bulk_create(batch)
+
+    def _reset_sequences(self):
+        """Moves database sequences past the explicitly assigned primary keys."""
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), list(self.ids)):
+                cursor.execute(sql)
+
+    def _pick(self, model):
+        return self.rng.choice(self.ids[model])
+
+    def _sentence(self, length):
+        return ' '.join(self.rng.choice(WORDS) for index in range(length)).capitalize() + '.'
+
+    def _dates(self):
+        """Returns a status with matching open and close dates within the generated years."""
+        status = self.rng.choice(STATUSES)
+        open_date = self.now - datetime.timedelta(days=self.rng.randrange(self.days), seconds=self.rng.randrange(86400))
+        if status == models.Engagement.PENDING_STATUS:
+            return status, None, None, None, open_date.date()
+        if status == models.Engagement.OPEN_STATUS:
+            return status, open_date, None, None, open_date.date()
+        duration = datetime.timedelta(hours=self.rng.randint(1, 24 * 30))
+        return status, open_date, open_date + duration, duration, open_date.date()
+
+    def _person(self, index):
+        first_name = self.rng.choice(FIRST_NAMES)
+        last_name = self.rng.choice(LAST_NAMES)
+        return models.Person(
+            first_name=first_name, last_name=last_name, role=self.rng.choice(models.Person.ROLE_CHOICES)[0],
+            email=('%s.%s.%s.%d@example.com' % (first_name, last_name, self.prefix, index)).lower()
+        )
+
+    def _application(self, index):
+        return models.Application(
+            name='%s App %d %s' % (self.prefix, index, self.rng.choice(WORDS).capitalize()), description=self._sentence(20),
+            organization_id=self._pick(models.Organization),
+            business_criticality=self.rng.choice(models.Application.BUSINESS_CRITICALITY_CHOICES)[0],
+            platform=self.rng.choice(models.Application.PLATFORM_CHOICES)[0],
+            lifecycle=self.rng.choice(models.Application.LIFECYCLE_CHOICES)[0],
+            origin=self.rng.choice(models.Application.ORIGIN_CHOICES)[0],
+            external_audience=self.rng.random() < 0.3, internet_accessible=self.rng.random() < 0.4
+        )
+
+    def _engagement(self, index):
+        status, open_date, close_date, duration, start_date = self._dates()
+        return models.Engagement(
+            status=status, start_date=start_date, end_date=start_date + datetime.timedelta(days=self.rng.randint(1, 30)),
+            open_date=open_date, close_date=close_date, duration=duration, description=self._sentence(16),
+            application_id=self._pick(models.Application), requestor_id=self._pick(models.Person)
+        )
+
+    def _activity(self, index):
+        status, open_date, close_date, duration, start_date = self._dates()
+        return models.Activity(
+            status=status, open_date=open_date, close_date=close_date, duration=duration,
+            activity_type_id=self._pick(models.ActivityType), engagement_id=self._pick(models.Engagement)
+        )
+
+    def _data_elements(self, per_application):
+        """Selects up to per_application distinct existing data elements for each application."""
+        data_element_ids = list(models.DataElement.objects.order_by('pk').values_list('pk', flat=True))
+        per_application = min(per_application, len(data_element_ids))
+        applications = self.ids[models.Application]
+        selections = [self.rng.sample(data_element_ids, per_application) for application_id in applications] if per_application else []
+        self._create(models.Application.data_elements.through, len(applications) * per_application, lambda index: models.Application.data_elements.through(
+            application_id=applications[index // per_application], dataelement_id=selections[index // per_application][index % per_application]
+        ))
+
+    def _threadfix_metrics(self, days):
+        """Creates one ThreadFixMetrics per application per day, oldest first."""
+        applications = self.ids[models.Application]
+
+        def build(index):
+            return models.ThreadFixMetrics(
+                application_id=applications[index % len(applications)], critical_count=self.rng.randint(0, 5),
+                high_count=self.rng.randint(0, 20), medium_count=self.rng.randint(0, 50), low_count=self.rng.randint(0, 100),
+                informational_count=self.rng.randint(0, 200)
+            )
+        self._create(models.ThreadFixMetrics, len(applications) * days, build)
+
+        # The created date is set on insert, so each day's contiguous keys are moved back to that day afterwards
+        ids = self.ids[models.ThreadFixMetrics]
+        for day in range(days):
+            day_ids = ids[day * len(applications):(day + 1) * len(applications)]
+            if day_ids:
+                models.ThreadFixMetrics.objects.filter(pk__range=(day_ids[0], day_ids[-1])).update(
+                    created_date=self.now - datetime.timedelta(days=days - 1 - day)
+                )
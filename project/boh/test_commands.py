@@ -0,0 +1,292 @@
+import datetime
+import json
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import Max, Sum
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from . import helpers, models
+
+
+class StubThreadFixServer(ThreadingMixIn, HTTPServer):
+    """A local ThreadFix stand-in serving application vulnerability counts."""
+
+    daemon_threads = True
+
+    def __init__(self, counts, delay=0.0):
+        self.counts = counts  # ThreadFix application id -> critical count
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubThreadFixHandler)
+
+    @property
+    def host(self):
+        return 'http://127.0.0.1:%d/' % self.server_address[1]
+
+
+class StubThreadFixHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+
+        time.sleep(self.server.delay)
+
+        match = re.match(r'^/rest/applications/(\d+)\?', self.path)
+        application_id = int(match.group(1)) if match else None
+        if application_id in self.server.counts:
+            body = {
+                'message': '',
+                'success': True,
+                'responseCode': -1,
+                'object': {
+                    'criticalVulnCount': self.server.counts[application_id],
+                    'highVulnCount': 2,
+                    'mediumVulnCount': 3,
+                    'lowVulnCount': 4,
+                    'infoVulnCount': 5,
+                }
+            }
+        else:
+            body = {'message': 'Invalid application ID.', 'success': False, 'responseCode': -1, 'object': None}
+
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+        with self.server.lock:
+            self.server.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CronThreadFixTests(TestCase):
+
+    def setUp(self):
+        self.server = StubThreadFixServer({application_id: application_id for application_id in range(1, 13)}, delay=0.05)
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+
+        self.org_1 = models.Organization.objects.create(name='Org1')
+        self.tf_1 = models.ThreadFix.objects.create(name='TF1', host=self.server.host, api_key='key')
+        self.tf_2 = models.ThreadFix.objects.create(name='TF2', host=self.server.host, api_key='other')
+
+        for application_id in range(1, 13):
+            models.Application.objects.create(
+                name='App' + str(application_id), organization=self.org_1,
+                threadfix=self.tf_1 if application_id % 2 else self.tf_2,
+                threadfix_team_id=1, threadfix_application_id=application_id
+            )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_threadfix(self):
+        call_command('cron', threadfix=True, workers=8, requests_per_host=3)
+
+        self.assertEqual(12, models.ThreadFixMetrics.objects.count())
+        metrics = models.Application.objects.get(name='App7').latest_threadfix_metrics
+        self.assertEqual(7, metrics.critical_count)
+        self.assertEqual(21, metrics.total())
+
+    def test_threadfix_requests_per_host(self):
+        """Services sharing a host share the in-flight request limit."""
+        call_command('cron', threadfix=True, workers=8, requests_per_host=3)
+
+        self.assertLessEqual(self.server.max_in_flight, 3)
+        self.assertGreater(self.server.max_in_flight, 1)
+
+    def test_threadfix_errors(self):
+        """Failed applications are reported without discarding successful ones."""
+        models.Application.objects.filter(name='App3').update(threadfix_application_id=404)
+
+        stderr = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('cron', threadfix=True, stderr=stderr)
+
+        self.assertEqual(11, models.ThreadFixMetrics.objects.count())
+        self.assertIn('App3', stderr.getvalue())
+
+    def test_threadfix_delta(self):
+        """Only changed applications receive new metrics, unchanged metrics are marked as checked."""
+        call_command('cron', threadfix=True, delta=True)
+        self.assertEqual(12, models.ThreadFixMetrics.objects.count())
+        unchanged = models.ThreadFixMetrics.objects.get(application__name='App1')
+
+        self.server.counts[3] = 30
+        call_command('cron', threadfix=True, delta=True)
+
+        self.assertEqual(13, models.ThreadFixMetrics.objects.count())
+        self.assertEqual(30, models.Application.objects.get(name='App3').latest_threadfix_metrics.critical_count)
+        checked = models.ThreadFixMetrics.objects.get(application__name='App1')
+        self.assertGreater(checked.checked_date, unchanged.checked_date)
+        self.assertEqual(unchanged.modified_date, checked.modified_date)
+
+    def test_threadfix_without_delta(self):
+        call_command('cron', threadfix=True)
+        call_command('cron', threadfix=True)
+
+        self.assertEqual(24, models.ThreadFixMetrics.objects.count())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ReportWorkerTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('reporter', 'reporter@example.com', 'password')
+        self.org_1 = models.Organization.objects.create(name='Org1')
+        self.app_1 = models.Application.objects.create(name='App1', organization=self.org_1)
+        self.app_2 = models.Application.objects.create(name='App2', organization=self.org_1)
+
+    def test_report_worker(self):
+        job = models.ReportJob.objects.create(report_type=models.ReportJob.APP_SUMMARY_REPORT, file_name='app-summary', file_format='csv', requester=self.user)
+        job.applications.add(self.app_2)
+
+        call_command('report_worker', once=True)
+
+        job.refresh_from_db()
+        self.assertTrue(job.is_completed())
+        self.assertIsNotNone(job.completed_date)
+        job.file.open('rb')
+        content = job.file.read().decode('utf-8')
+        job.file.close()
+        self.assertIn('App2', content)
+        self.assertNotIn('App1', content)
+
+    def test_report_worker_failure(self):
+        job = models.ReportJob.objects.create(report_type='unknown', file_name='unknown', file_format='html', requester=self.user)
+
+        call_command('report_worker', once=True, stderr=StringIO())
+
+        job.refresh_from_db()
+        self.assertTrue(job.is_failed())
+        self.assertIn('unknown', job.error)
+
+    def test_claim(self):
+        first = models.ReportJob.objects.create(report_type=models.ReportJob.APP_SUMMARY_REPORT, file_name='first', file_format='html', requester=self.user)
+        models.ReportJob.objects.create(report_type=models.ReportJob.APP_SUMMARY_REPORT, file_name='second', file_format='html', requester=self.user)
+
+        self.assertEqual(first, models.ReportJob.objects.claim())
+        self.assertEqual('second', models.ReportJob.objects.claim().file_name)
+        self.assertIsNone(models.ReportJob.objects.claim())
+        self.assertTrue(models.ReportJob.objects.get(pk=first.pk).is_running())
+
+    def test_claim_stale(self):
+        """A job left running by a stopped worker is claimed again once it times out."""
+        job = models.ReportJob.objects.create(report_type=models.ReportJob.APP_SUMMARY_REPORT, file_name='stale', file_format='html', requester=self.user)
+        models.ReportJob.objects.claim()
+
+        self.assertIsNone(models.ReportJob.objects.claim(stale_after=datetime.timedelta(hours=1)))
+        models.ReportJob.objects.filter(pk=job.pk).update(start_date=timezone.now() - datetime.timedelta(hours=2))
+        self.assertEqual(job, models.ReportJob.objects.claim(stale_after=datetime.timedelta(hours=1)))
+        self.assertIsNone(models.ReportJob.objects.claim(stale_after=datetime.timedelta(hours=1)))
+
+    def test_report_worker_stale(self):
+        job = models.ReportJob.objects.create(report_type=models.ReportJob.APP_SUMMARY_REPORT, file_name='stale', file_format='csv', requester=self.user)
+        models.ReportJob.objects.filter(pk=job.pk).update(status=models.ReportJob.RUNNING_STATUS, start_date=timezone.now() - datetime.timedelta(hours=2))
+
+        call_command('report_worker', once=True, timeout=3600)
+
+        job.refresh_from_db()
+        self.assertTrue(job.is_completed())
+
+
+    def test_report_worker_prunes(self):
+        """Reports which finished before the retention period are deleted with their files."""
+        old = models.ReportJob.objects.create(report_type=models.ReportJob.APP_SUMMARY_REPORT, file_name='old', file_format='csv', requester=self.user)
+        recent = models.ReportJob.objects.create(report_type=models.ReportJob.APP_SUMMARY_REPORT, file_name='recent', file_format='csv', requester=self.user)
+        call_command('report_worker', once=True)
+        old.refresh_from_db()
+        models.ReportJob.objects.filter(pk=old.pk).update(created_date=timezone.now() - datetime.timedelta(days=2), completed_date=timezone.now() - datetime.timedelta(days=2))
+
+        call_command('report_worker', once=True, retention=1, stdout=StringIO())
+
+        self.assertEqual([recent.pk], list(models.ReportJob.objects.values_list('pk', flat=True)))
+        self.assertFalse(old.file.storage.exists(old.file.name))
+
+
+class BenchmarkTests(TestCase):
+
+    def test_metrics(self):
+        stdout = StringIO()
+        call_command('benchmark', 'metrics', activities=300, repeat=2, stdout=stdout)
+
+        self.assertIn('ActivityType.metrics.stats()', stdout.getvalue())
+        self.assertFalse(models.Activity.objects.exists())  # Synthetic data is rolled back
+
+    def test_indexes(self):
+        stdout = StringIO()
+        call_command('benchmark', 'indexes', activities=300, repeat=1, stdout=stdout)
+
+        self.assertIn('Without indexes', stdout.getvalue())
+        self.assertIn('ThreadFixMetrics latest per application', stdout.getvalue())
+        self.assertFalse(models.ThreadFixMetrics.objects.exists())
+
+
+    def test_classification(self):
+        stdout = StringIO()
+        call_command('benchmark', 'classification', activities=100, applications=20, repeat=1, stdout=stdout)
+
+        self.assertIn('refresh_data_classification(), 20 applications', stdout.getvalue())
+        self.assertFalse(models.Application.objects.exists())
+
+class GenerateDataTests(TestCase):
+
+    def generate(self, **options):
+        counts = dict(organizations=2, applications=5, people=4, engagements=10, activities=30, comments=6, threadfix_days=3, users=2)
+        counts.update(options)
+        call_command('generate_data', stdout=StringIO(), **counts)
+
+    def test_generate_data(self):
+        self.generate()
+
+        self.assertEqual(5, models.Application.objects.count())
+        self.assertEqual(30, models.Activity.objects.count())
+        self.assertEqual(3, models.EngagementComment.objects.count())
+        self.assertEqual(3, models.ActivityComment.objects.count())
+        self.assertEqual(8, models.Organization.people.through.objects.count())
+        self.assertEqual(15, models.ThreadFixMetrics.objects.count())
+        self.assertEqual(3, models.ThreadFixMetrics.objects.dates('created_date', 'day').count())
+
+        # Data normally kept up to date by signals is rebuilt
+        self.assertFalse(models.Application.objects.filter(latest_threadfix_metrics=None).exists())
+        self.assertEqual(30, models.DailyMetrics.objects.filter(kind=models.DailyMetrics.ACTIVITY_KIND).aggregate(total=Sum('count'))['total'])
+        self.assertTrue(models.SearchTerm.objects.search('S0 App 1'))
+        self.assertEqual(20, models.Application.data_elements.through.objects.count())
+        for application in models.Application.objects.all():
+            self.assertEqual(helpers.data_sensitivity_value(application.data_elements.all()), application.calculated_dsv)
+
+        # New objects continue after the generated primary keys
+        organization = models.Organization.objects.create(name='Org')
+        self.assertGreater(organization.pk, models.Organization.objects.exclude(pk=organization.pk).aggregate(last=Max('pk'))['last'])
+
+    def test_deterministic(self):
+        self.generate(prefix='First')
+        first = list(models.Application.objects.order_by('id').values_list('name', 'business_criticality', 'organization__name'))
+        self.generate(prefix='Second')
+        second = list(models.Application.objects.order_by('id').values_list('name', 'business_criticality', 'organization__name'))[5:]
+
+        self.assertEqual([tuple(value.replace('First', 'Second') for value in row) for row in first], second)
+
+    def test_generate_data_requires_parents(self):
+        with self.assertRaises(CommandError):
+            self.generate(applications=0)
@@ -1,10 +1,15 @@
 import datetime
+import functools
+import threading
 
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
-from . import models
+from . import helpers, models
+from .behaviors import ConcurrentUpdateError
 
 
 class TagTests(TestCase):
@@ -159,6 +164,59 @@ class ApplicationTests(TestCase):
         self.assertEqual(1122.0, self.app_4.data_sensitivity_value())
         self.assertEqual(models.Application.DCL_4, self.app_4.data_classification_level())
 
+    def test_data_classification_stored(self):
+        # The stored values are read without querying the data elements
+        application = models.Application.objects.get(pk=self.app_4.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(1122.0, application.data_sensitivity_value())
+            self.assertEqual(models.Application.DCL_4, application.data_classification_level())
+
+    def test_data_classification_data_element_changes(self):
+        self.de_gender.application_set.add(self.app_3)
+        self.assertEqual(118.0, models.Application.objects.get(pk=self.app_3.pk).data_sensitivity_value())
+
+        self.de_fname.weight = 40
+        self.de_fname.save()
+        self.assertEqual(43.0, models.Application.objects.get(pk=self.app_1.pk).data_sensitivity_value())
+        self.assertEqual(models.Application.DCL_2, models.Application.objects.get(pk=self.app_1.pk).data_classification_level())
+
+        self.de_lname.delete()
+        self.assertEqual(43.0, models.Application.objects.get(pk=self.app_2.pk).data_sensitivity_value())
+
+        self.de_edu.application_set.clear()
+        self.assertEqual(18.0, models.Application.objects.get(pk=self.app_3.pk).data_sensitivity_value())
+        self.assertEqual(40.0, models.Application.objects.get(pk=self.app_4.pk).data_sensitivity_value())
+
+        self.app_1.data_elements.clear()
+        self.assertEqual(0.0, self.app_1.data_sensitivity_value())
+
+    def test_data_classification_refresh(self):
+        models.Application.objects.create(name='App5', organization=self.org_1)
+        models.Application.objects.update(calculated_dsv=-1, calculated_dcl=models.Application.DCL_4)
+        models.Application.objects.all().refresh_data_classification()
+
+        self.assertEqual(
+            [(5.0, 1), (55.0, 2), (115.0, 3), (1122.0, 4), (0.0, 1)],
+            list(models.Application.objects.order_by('name').values_list('calculated_dsv', 'calculated_dcl'))
+        )
+        for application in models.Application.objects.all():
+            dsv = helpers.data_sensitivity_value(application.data_elements.all())
+            self.assertEqual((dsv, helpers.data_classification_level(dsv)), (application.calculated_dsv, application.calculated_dcl))
+
+    def test_data_classification_override(self):
+        self.app_1.override_dcl = models.Application.DCL_3
+        self.assertEqual(models.Application.DCL_3, self.app_1.data_classification_level())
+
+        self.app_1.override_dcl = None
+        self.assertEqual(models.Application.DCL_1, self.app_1.data_classification_level())
+
+    def test_classified(self):
+        self.app_1.override_dcl = models.Application.DCL_4
+        self.app_1.save()
+
+        self.assertEqual([self.app_1, self.app_4], list(models.Application.objects.classified([models.Application.DCL_4]).order_by('name')))
+        self.assertEqual([self.app_2], list(models.Application.objects.classified([models.Application.DCL_1, models.Application.DCL_2])))
+
     def test_is_new(self):
         self.assertEqual(True, self.app_1.is_new())
         self.assertEqual(False, self.app_2.is_new())
@@ -170,9 +228,59 @@ class ThreadFixMetricsTests(TestCase):
         self.tfm_1 = models.ThreadFixMetrics(critical_count=1, high_count=4, medium_count=16, low_count=10,
                                              informational_count=3)
 
+    def test_counts(self):
+        self.assertEqual((1, 4, 16, 10, 3), self.tfm_1.counts())
+
     def test_total(self):
         self.assertEqual(34, self.tfm_1.total())
 
+    def test_latest_per_application(self):
+        org_1 = models.Organization.objects.create(name='Org1')
+        app_1 = models.Application.objects.create(name='App1', organization=org_1)
+        app_2 = models.Application.objects.create(name='App2', organization=org_1)
+
+        models.ThreadFixMetrics.objects.create(application=app_1, critical_count=1)
+        latest_1 = models.ThreadFixMetrics.objects.create(application=app_1, critical_count=2)
+        latest_2 = models.ThreadFixMetrics.objects.create(application=app_2, critical_count=3)
+
+        latest = models.ThreadFixMetrics.objects.latest_per_application()
+        self.assertEqual({latest_1.id, latest_2.id}, {metrics.id for metrics in latest})
+
+    def test_latest_threadfix_metrics(self):
+        """The application points at its most recent metrics as they are saved and deleted."""
+        org_1 = models.Organization.objects.create(name='Org1')
+        app_1 = models.Application.objects.create(name='App1', organization=org_1)
+
+        first = models.ThreadFixMetrics.objects.create(application=app_1, critical_count=1)
+        second = models.ThreadFixMetrics.objects.create(application=app_1, critical_count=2)
+        app_1.refresh_from_db()
+        self.assertEqual(second, app_1.latest_threadfix_metrics)
+
+        second.delete()
+        app_1.refresh_from_db()
+        self.assertEqual(first, app_1.latest_threadfix_metrics)
+
+        first.delete()
+        app_1.refresh_from_db()
+        self.assertIsNone(app_1.latest_threadfix_metrics)
+
+    def test_refresh_latest_threadfix_metrics(self):
+        org_1 = models.Organization.objects.create(name='Org1')
+        app_1 = models.Application.objects.create(name='App1', organization=org_1)
+        app_2 = models.Application.objects.create(name='App2', organization=org_1)
+
+        models.ThreadFixMetrics.objects.bulk_create([
+            models.ThreadFixMetrics(application=app_1, critical_count=1),
+            models.ThreadFixMetrics(application=app_2, critical_count=2),
+        ])
+        models.Application.objects.all().refresh_latest_threadfix_metrics()
+
+        self.assertEqual(1, models.Application.objects.get(pk=app_1.pk).latest_threadfix_metrics.critical_count)
+        self.assertEqual(2, models.Application.objects.get(pk=app_2.pk).latest_threadfix_metrics.critical_count)
+
+        app_1.delete()
+        self.assertEqual(1, models.ThreadFixMetrics.objects.count())
+
 
 class RelationTests(TestCase):
 
@@ -383,12 +491,104 @@ class EngagementTests(TestCase):
         self.assertFalse(self.eng_1.is_past_due())
 
 
+    def test_changed_fields(self):
+        engagement = models.Engagement.objects.get(pk=self.eng_1.pk)
+        self.assertEqual([], engagement.changed_fields())
+
+        engagement.description = 'Changed'
+        engagement.application_id = self.app_1.id
+        self.assertEqual(['description'], engagement.changed_fields())
+        self.assertTrue(engagement.has_changed('status', 'description'))
+        self.assertFalse(engagement.has_changed('status'))
+
+        engagement.refresh_from_db(fields=['status'])
+        self.assertEqual(['description'], engagement.changed_fields())
+        engagement.refresh_from_db()
+        self.assertEqual([], engagement.changed_fields())
+
+    def test_changed_fields_not_loaded(self):
+        engagement = models.Engagement(pk=self.eng_1.pk, status=models.Engagement.OPEN_STATUS, start_date=self.eng_1.start_date,
+                                       end_date=self.eng_1.end_date, application=self.app_1)
+        self.assertTrue(engagement.has_changed('status'))
+        self.assertFalse(engagement.has_changed('start_date'))
+
+    def test_save_writes_changed_fields(self):
+        engagement = models.Engagement.objects.get(pk=self.eng_1.pk)
+        engagement.end_date = self.eng_1.end_date + datetime.timedelta(days=1)
+
+        with CaptureQueriesContext(connection) as context:
+            engagement.save()
+
+        sql = [query['sql'] for query in context.captured_queries]
+        self.assertFalse([query for query in sql if query.startswith('SELECT') and '"boh_engagement"' in query])
+        update = next(query for query in sql if query.startswith('UPDATE "boh_engagement"'))
+        self.assertIn('"end_date"', update)
+        self.assertIn('"modified_date"', update)
+        self.assertNotIn('"status"', update)
+        self.assertEqual(engagement.end_date, models.Engagement.objects.get(pk=self.eng_1.pk).end_date)
+
+    def test_save_stale_status(self):
+        engagement = models.Engagement.objects.get(pk=self.eng_1.pk)
+        stale = models.Engagement.objects.get(pk=self.eng_1.pk)
+
+        engagement.status = models.Engagement.OPEN_STATUS
+        engagement.save()
+
+        stale.status = models.Engagement.CLOSED_STATUS
+        with self.assertRaises(ConcurrentUpdateError), transaction.atomic():
+            stale.save()
+        self.assertTrue(models.Engagement.objects.get(pk=self.eng_1.pk).is_open())
+
+    def test_save_status_without_reading(self):
+        engagement = models.Engagement.objects.get(pk=self.eng_1.pk)
+        engagement.status = models.Engagement.CLOSED_STATUS
+
+        with CaptureQueriesContext(connection) as context:
+            engagement.save()
+
+        # Only the rollup reads the engagement, joined to its organization
+        sql = [query['sql'] for query in context.captured_queries]
+        self.assertFalse([query for query in sql if query.startswith('SELECT') and 'FROM "boh_engagement" WHERE' in query])
+        engagement = models.Engagement.objects.get(pk=self.eng_1.pk)
+        self.assertTrue(engagement.is_closed())
+        self.assertEqual(engagement.open_date, engagement.close_date)
+        self.assertEqual(datetime.timedelta(0), engagement.duration)
+
+
 class ActivityTypeTests(TestCase):
 
     def test_str(self):
         self.at_1 = models.ActivityType(name='Test')
         self.assertEqual('Test', self.at_1.__str__())
 
+    def test_stats_year(self):
+        """Counts and durations only include activities opened in the year, and every activity type is returned."""
+        org_1 = models.Organization.objects.create(name='Org1')
+        app_1 = models.Application.objects.create(name='App1', organization=org_1)
+        en_1 = models.Engagement.objects.create(start_date=datetime.date.today(), end_date=datetime.date.today(), application=app_1)
+        at_1 = models.ActivityType.objects.create(name='Unittest')
+        at_2 = models.ActivityType.objects.create(name='Unused')
+
+        for year, status, days in [(2019, models.Activity.CLOSED_STATUS, 10), (2020, models.Activity.CLOSED_STATUS, 2), (2020, models.Activity.OPEN_STATUS, None)]:
+            activity = models.Activity.objects.create(engagement=en_1, activity_type=at_1)
+            models.Activity.objects.filter(pk=activity.pk).update(
+                status=status, open_date=datetime.datetime(year, 6, 1, tzinfo=timezone.utc),
+                duration=datetime.timedelta(days=days) if days else None
+            )
+        models.DailyMetrics.objects.rebuild()  # update() bypasses the signals keeping the rollup current
+
+        with self.assertNumQueries(1):
+            stats = {activity_type.id: activity_type for activity_type in models.ActivityType.metrics.stats(2020)}
+
+        self.assertEqual((0, 1, 1, 2), (stats[at_1.id].pending_count, stats[at_1.id].open_count, stats[at_1.id].closed_count, stats[at_1.id].total_count))
+        self.assertEqual(datetime.timedelta(days=2), stats[at_1.id].average_duration)
+        self.assertEqual(0, stats[at_2.id].total_count)
+        self.assertIsNone(stats[at_2.id].average_duration)
+
+        stats = {activity_type.id: activity_type for activity_type in models.ActivityType.metrics.stats()}
+        self.assertEqual(3, stats[at_1.id].total_count)
+        self.assertEqual(datetime.timedelta(days=6), stats[at_1.id].average_duration)
+
 
 class ActivityTests(TestCase):
 
@@ -412,6 +612,83 @@ class ActivityTests(TestCase):
     def test_str(self):
         self.assertEqual('Unittest', self.ac_1.__str__())
 
+    def test_save_writes_changed_fields(self):
+        activity = models.Activity.objects.get(pk=self.ac_1.pk)
+        activity.description = 'Changed'
+
+        with CaptureQueriesContext(connection) as context:
+            activity.save()
+
+        self.assertEqual(1, len(context.captured_queries))
+        self.assertIn('SET "description" = ', context.captured_queries[0]['sql'])
+        self.assertNotIn('"status"', context.captured_queries[0]['sql'])
+
+    def test_save_closes_engagement_without_loading_activities(self):
+        ac_2 = models.Activity.objects.create(engagement=self.en_1, activity_type=self.at_1, status=models.Activity.CLOSED_STATUS)
+        self.ac_1.status = models.Activity.CLOSED_STATUS
+
+        with CaptureQueriesContext(connection) as context:
+            self.ac_1.save()
+
+        self.assertTrue(models.Engagement.objects.get(pk=self.en_1.pk).is_closed())
+        # Sibling activities are checked with a single query instead of being loaded
+        sql = [query['sql'] for query in context.captured_queries]
+        self.assertFalse([query for query in sql if query.startswith('SELECT "boh_activity"."id", "boh_activity"."status"')])
+
+    def test_transition_open(self):
+        ac_2 = models.Activity.objects.create(engagement=self.en_1, activity_type=self.at_1)
+
+        self.assertEqual(2, models.Activity.objects.all().transition(models.Activity.OPEN_STATUS))
+        self.assertEqual(0, models.Activity.objects.all().transition(models.Activity.OPEN_STATUS))
+
+        for activity in models.Activity.objects.filter(pk__in=[self.ac_1.pk, ac_2.pk]):
+            self.assertTrue(activity.is_open())
+            self.assertNotEqual(None, activity.open_date)
+            self.assertEqual(None, activity.close_date)
+        engagement = models.Engagement.objects.get(pk=self.en_1.pk)
+        self.assertTrue(engagement.is_open())
+        self.assertNotEqual(None, engagement.open_date)
+
+    def test_transition_closed(self):
+        ac_2 = models.Activity.objects.create(engagement=self.en_1, activity_type=self.at_1)
+        self.ac_1.status = models.Activity.OPEN_STATUS
+        self.ac_1.save()
+
+        models.Activity.objects.filter(pk=self.ac_1.pk).transition(models.Activity.CLOSED_STATUS)
+        activity = models.Activity.objects.get(pk=self.ac_1.pk)
+        self.assertTrue(activity.is_closed())
+        self.assertEqual(self.ac_1.open_date, activity.open_date)
+        self.assertEqual(activity.close_date - activity.open_date, activity.duration)
+        self.assertTrue(models.Engagement.objects.get(pk=self.en_1.pk).is_open())
+
+        models.Activity.objects.filter(pk=ac_2.pk).transition(models.Activity.CLOSED_STATUS, batch_size=1)
+        activity = models.Activity.objects.get(pk=ac_2.pk)
+        self.assertEqual(activity.open_date, activity.close_date)
+        self.assertEqual(datetime.timedelta(0), activity.duration)
+        engagement = models.Engagement.objects.get(pk=self.en_1.pk)
+        self.assertTrue(engagement.is_closed())
+        self.assertEqual(engagement.close_date - engagement.open_date, engagement.duration)
+
+    def test_transition_closed_durations(self):
+        """Durations computed by the database read back exactly, whatever the microseconds of the dates."""
+        now = timezone.now()
+        models.Activity.objects.bulk_create([
+            models.Activity(engagement=self.en_1, activity_type=self.at_1, status=models.Activity.OPEN_STATUS, open_date=now - datetime.timedelta(microseconds=index * 7919 + 13))
+            for index in range(200)
+        ])
+
+        models.Activity.objects.all().transition(models.Activity.CLOSED_STATUS)
+        for activity in models.Activity.objects.all():
+            self.assertEqual(activity.close_date - activity.open_date, activity.duration)
+
+    def test_transition_pending(self):
+        models.Activity.objects.all().transition(models.Activity.OPEN_STATUS)
+        models.Activity.objects.all().transition(models.Activity.PENDING_STATUS)
+
+        activity = models.Activity.objects.get(pk=self.ac_1.pk)
+        self.assertTrue(activity.is_pending())
+        self.assertEqual((None, None), (activity.open_date, activity.close_date))
+
     def test_save_pending_to_open(self):
         self.ac_1.status = models.Activity.PENDING_STATUS
         self.ac_1.save()
@@ -593,6 +870,170 @@ class ActivityTests(TestCase):
         self.assertFalse(self.ac_1.is_past_due())
 
 
+class DailyMetricsTests(TestCase):
+
+    def setUp(self):
+        self.org_1 = models.Organization.objects.create(name='Org1')
+        self.app_1 = models.Application.objects.create(name='App1', organization=self.org_1)
+        self.at_1 = models.ActivityType.objects.create(name='Unittest')
+
+        today = datetime.date.today()
+        self.en_1 = models.Engagement.objects.create(start_date=today, end_date=today, application=self.app_1)
+        self.ac_1 = models.Activity.objects.create(engagement=self.en_1, activity_type=self.at_1)
+        self.ac_2 = models.Activity.objects.create(engagement=self.en_1, activity_type=self.at_1)
+
+    def rows(self):
+        return sorted(models.DailyMetrics.objects.values_list('kind', 'day', 'status', 'organization', 'activity_type', 'count', 'duration_count', 'total_duration'), key=repr)
+
+    def assertMatchesRebuild(self):
+        """The incrementally maintained rollup equals one rebuilt from scratch."""
+        incremental = self.rows()
+        models.DailyMetrics.objects.rebuild()
+        self.assertEqual(self.rows(), incremental)
+
+    def test_save(self):
+        self.ac_1.status = models.Activity.OPEN_STATUS
+        self.ac_1.save()
+
+        stats = models.Engagement.metrics.stats(timezone.now().year)
+        self.assertEqual((1, 1), (stats['open_count'], stats['total_count']))
+        activity_stats = models.ActivityType.metrics.stats().get(pk=self.at_1.pk)
+        self.assertEqual((1, 1, 2), (activity_stats.pending_count, activity_stats.open_count, activity_stats.total_count))
+        self.assertMatchesRebuild()
+
+    def test_close(self):
+        for activity in (self.ac_1, self.ac_2):
+            activity.status = models.Activity.CLOSED_STATUS
+            activity.save()
+
+        stats = models.Engagement.metrics.stats()
+        self.assertEqual(1, stats['closed_count'])
+        self.assertEqual(models.Engagement.objects.get().duration, stats['average_duration'])
+        self.assertEqual(2, models.ActivityType.metrics.stats().get(pk=self.at_1.pk).closed_count)
+        self.assertMatchesRebuild()
+
+    def test_transition(self):
+        models.Activity.objects.filter(pk=self.ac_1.pk).transition(models.Activity.OPEN_STATUS)
+        self.assertMatchesRebuild()
+
+        models.Activity.objects.all().transition(models.Activity.CLOSED_STATUS)
+        self.assertEqual(1, models.Engagement.metrics.stats()['closed_count'])
+        self.assertMatchesRebuild()
+
+    def test_delete(self):
+        self.ac_1.delete()
+        self.assertEqual(1, models.ActivityType.metrics.stats().get(pk=self.at_1.pk).total_count)
+
+        self.en_1.delete()
+        self.assertFalse(models.DailyMetrics.objects.exists())
+
+    def test_move_application(self):
+        org_2 = models.Organization.objects.create(name='Org2')
+        self.app_1.organization = org_2
+        self.app_1.save()
+
+        self.assertFalse(models.DailyMetrics.objects.filter(organization=self.org_1).exists())
+        self.assertTrue(models.DailyMetrics.objects.filter(organization=org_2).exists())
+        self.assertMatchesRebuild()
+
+    def test_move_engagement(self):
+        org_2 = models.Organization.objects.create(name='Org2')
+        app_2 = models.Application.objects.create(name='App2', organization=org_2)
+        self.ac_1.status = models.Activity.OPEN_STATUS
+        self.ac_1.save()
+
+        engagement = models.Engagement.objects.get(pk=self.en_1.pk)
+        engagement.application = app_2
+        engagement.save()
+
+        self.assertFalse(models.DailyMetrics.objects.filter(organization=self.org_1).exists())
+        self.assertEqual(2, models.DailyMetrics.objects.filter(organization=org_2, kind=models.DailyMetrics.ACTIVITY_KIND).count())
+        self.assertMatchesRebuild()
+
+    def test_refresh_replaces_rows(self):
+        bucket = models.DailyMetrics.objects.bucket(models.Activity, self.ac_1.pk)
+        models.DailyMetrics.objects.refresh(*bucket)
+        models.DailyMetrics.objects.refresh(*bucket)
+        self.assertMatchesRebuild()
+
+
+class ConcurrentTransitionTests(TransactionTestCase):
+    """
+    Activities saved from many threads at once leave their engagement as saving them one after another would. Threads
+    cannot share an in-memory SQLite database, so run these with a test database file or another database.
+    """
+
+    threads = 8
+    rounds = 5
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Threads cannot share an in-memory SQLite database.')
+
+        self.org_1 = models.Organization.objects.create(name='Org1')
+        self.app_1 = models.Application.objects.create(name='App1', organization=self.org_1)
+        self.at_1 = models.ActivityType.objects.create(name='Unittest')
+
+    def create_engagement(self, status):
+        today = datetime.date.today()
+        engagement = models.Engagement.objects.create(start_date=today, end_date=today, application=self.app_1)
+        for index in range(self.threads):
+            models.Activity.objects.create(engagement=engagement, activity_type=self.at_1)
+        engagement.activity_set.all().transition(status)
+        return engagement
+
+    def save_concurrently(self, engagement, status):
+        """Saves each activity of the engagement with the status from its own thread, all starting together."""
+        barrier = threading.Barrier(self.threads)
+        errors = []
+
+        def save(pk):
+            try:
+                activity = models.Activity.objects.get(pk=pk)
+                activity.status = status
+                barrier.wait()
+                activity.save()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=functools.partial(save, pk)) for pk in engagement.activity_set.values_list('pk', flat=True)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+
+    def assertMatchesRebuild(self):
+        incremental = sorted(models.DailyMetrics.objects.values_list('kind', 'day', 'status', 'count', 'duration_count', 'total_duration'), key=repr)
+        models.DailyMetrics.objects.rebuild()
+        self.assertEqual(sorted(models.DailyMetrics.objects.values_list('kind', 'day', 'status', 'count', 'duration_count', 'total_duration'), key=repr), incremental)
+
+    def test_close_last_activities(self):
+        for index in range(self.rounds):
+            engagement = self.create_engagement(models.Activity.OPEN_STATUS)
+            self.save_concurrently(engagement, models.Activity.CLOSED_STATUS)
+
+            engagement.refresh_from_db()
+            self.assertTrue(engagement.is_closed())
+            self.assertEqual(engagement.close_date - engagement.open_date, engagement.duration)
+            for activity in engagement.activity_set.all():
+                self.assertTrue(activity.is_closed())
+                self.assertEqual(activity.close_date - activity.open_date, activity.duration)
+        self.assertMatchesRebuild()
+
+    def test_open_activities(self):
+        for index in range(self.rounds):
+            engagement = self.create_engagement(models.Activity.PENDING_STATUS)
+            self.save_concurrently(engagement, models.Activity.OPEN_STATUS)
+
+            engagement.refresh_from_db()
+            self.assertTrue(engagement.is_open())
+            self.assertLessEqual(engagement.open_date, min(engagement.activity_set.values_list('open_date', flat=True)) + datetime.timedelta(seconds=1))
+        self.assertMatchesRebuild()
+
+
 class EngagementCommentTests(TestCase):
 
     def test_init(self):
@@ -0,0 +1,267 @@
+import csv
+import datetime
+import io
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import models, reports
+
+
+class ReportQueryTests(TestCase):
+    """Reports render with the same number of queries regardless of the number of applications."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('reporter', 'reporter@example.com', 'password')
+        self.activity_type = models.ActivityType.objects.create(name='Review')
+        self.technology = models.Technology.objects.create(name='Python', category=models.Technology.PROGRAMMING_LANGUAGE_CATEGORY)
+        self.regulation = models.Regulation.objects.create(name='Regulation', acronym='REG', category=models.Regulation.OTHER_CATEGORY, jurisdiction='Earth')
+        self.data_element = models.DataElement.objects.create(name='Name', category=models.DataElement.PERSONAL_CATEGORY, weight=2)
+        self.person = models.Person.objects.create(first_name='f', last_name='l', email='f@l.com', role=models.Person.MANAGER_ROLE)
+
+        self.organizations = [models.Organization.objects.create(name='Org' + str(index)) for index in range(2)]
+        self.add_applications(1)
+
+    def add_applications(self, count):
+        today = datetime.date.today()
+        for organization in self.organizations:
+            for index in range(count):
+                application = models.Application.objects.create(
+                    name=organization.name + ' App' + str(models.Application.objects.count()), organization=organization
+                )
+                application.technologies.add(self.technology)
+                application.regulations.add(self.regulation)
+                application.data_elements.add(self.data_element)
+                models.Relation.objects.create(person=self.person, application=application)
+                models.ThreadFixMetrics.objects.create(application=application, critical_count=index)
+
+                for days in (10, 5):
+                    engagement = models.Engagement.objects.create(start_date=today, end_date=today, application=application)
+                    models.Activity.objects.create(engagement=engagement, activity_type=self.activity_type)
+                    engagement.status = models.Engagement.CLOSED_STATUS
+                    engagement.save()
+                    engagement.close_date = engagement.close_date - datetime.timedelta(days=days)
+                    engagement.save()
+
+    def assertConstantQueries(self, report):
+        """Compares the queries issued by a freshly created report before and after more applications are added."""
+        with CaptureQueriesContext(connection) as context:
+            report().generate()
+        self.add_applications(5)
+        with self.assertNumQueries(len(context.captured_queries)):
+            report().generate()
+
+    def test_engagement_coverage(self):
+        self.assertConstantQueries(lambda: reports.EngagementCoverageReport('report', 'html', models.Organization.objects.none(), self.user))
+
+    def test_threadfix_summary(self):
+        self.assertConstantQueries(lambda: reports.ThreadFixSummaryReport('report', 'html', models.Organization.objects.all(), self.user))
+
+    def test_app_summary(self):
+        self.assertConstantQueries(lambda: reports.AppSummaryReport('report', 'html', models.Application.objects.none(), self.user))
+
+    def test_latest_engagement(self):
+        """Reports show the engagement that Engagement.objects.latest() would return."""
+        application = models.Application.objects.first()
+        expected = application.engagement_set.latest()
+
+        organization = reports.EngagementCoverageReport('report', 'html', None, self.user).queryset().get(pk=application.organization_id)
+        self.assertEqual([expected], organization.application_set.all()[0].latest_engagements)
+
+
+class ReportCSVTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('reporter', 'reporter@example.com', 'password')
+        self.org_1 = models.Organization.objects.create(name='Org1')
+        self.org_2 = models.Organization.objects.create(name='Org2')
+        self.app_1 = models.Application.objects.create(name='App1', organization=self.org_1, business_criticality=models.Application.HIGH_CRITICALITY)
+        self.app_2 = models.Application.objects.create(name='App2', organization=self.org_2)
+        self.app_1.technologies.add(models.Technology.objects.create(name='Python', category=models.Technology.PROGRAMMING_LANGUAGE_CATEGORY))
+        models.ThreadFixMetrics.objects.create(application=self.app_1, critical_count=1, high_count=2, medium_count=3, low_count=4, informational_count=5)
+
+        today = datetime.date.today()
+        engagement = models.Engagement.objects.create(start_date=today, end_date=today - datetime.timedelta(days=3), application=self.app_1)
+        models.Activity.objects.create(engagement=engagement, activity_type=models.ActivityType.objects.create(name='Review'))
+
+    def read(self, report):
+        return list(csv.reader(io.StringIO(report.generate())))
+
+    def test_engagement_coverage(self):
+        rows = self.read(reports.EngagementCoverageReport('report', 'csv', models.Organization.objects.filter(pk=self.org_1.pk), self.user))
+
+        self.assertEqual(2, len(rows))
+        self.assertEqual(['Org1', 'App1', 'High', str(datetime.date.today() - datetime.timedelta(days=3)), '3', 'Review'], rows[1])
+
+    def test_engagement_coverage_without_engagements(self):
+        rows = self.read(reports.EngagementCoverageReport('report', 'csv', models.Organization.objects.filter(pk=self.org_2.pk), self.user))
+
+        self.assertEqual(['Org2', 'App2'] + [''] * 4, rows[1])
+
+    def test_threadfix_summary(self):
+        rows = self.read(reports.ThreadFixSummaryReport('report', 'csv', models.Organization.objects.none(), self.user))
+
+        self.assertEqual(3, len(rows))
+        self.assertEqual(['Org1', 'App1', '1', '2', '3', '4', '5', '15'], rows[1][:8])
+        self.assertEqual(['Org2', 'App2'] + [''] * 7, rows[2])
+
+    def test_app_summary(self):
+        rows = self.read(reports.AppSummaryReport('report', 'csv', models.Application.objects.none(), self.user))
+
+        self.assertEqual(3, len(rows))
+        self.assertEqual(len(rows[0]), len(rows[1]))
+        self.assertEqual('App1', rows[1][0])
+        self.assertEqual('Python', rows[1][15])
+        self.assertEqual(str(models.Application.DCL_1), rows[1][3])
+
+    def test_app_summary_dcl_override(self):
+        self.app_1.override_dcl = models.Application.DCL_3
+        self.app_1.save()
+
+        rows = self.read(reports.AppSummaryReport('report', 'csv', models.Application.objects.none(), self.user))
+        self.assertEqual(str(models.Application.DCL_3), rows[1][3])
+
+    def test_write_in_chunks(self):
+        report = reports.AppSummaryReport('report', 'csv', models.Application.objects.none(), self.user)
+        report.chunk_size = 1
+
+        output = io.BytesIO()
+        report.write(output)
+        self.assertEqual(report.generate(), output.getvalue().decode('utf-8'))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ReportJobViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('reporter', 'reporter@example.com', 'password')
+        self.org_1 = models.Organization.objects.create(name='Org1')
+        self.client.login(username='reporter', password='password')
+
+    def test_download_queues_report(self):
+        response = self.client.post(reverse('boh:dashboard.reports.download') + '?report_type=threadfix_summary', {
+            'organizations': [self.org_1.id],
+            'format': 'csv'
+        })
+
+        self.assertRedirects(response, reverse('boh:dashboard.reports'))
+        job = models.ReportJob.objects.get()
+        self.assertTrue(job.is_pending())
+        self.assertEqual(models.ReportJob.THREADFIX_SUMMARY_REPORT, job.report_type)
+        self.assertEqual([self.org_1], list(job.organizations.all()))
+
+    def test_status_and_file(self):
+        models.Application.objects.create(name='App1', organization=self.org_1)
+        job = models.ReportJob.objects.create(report_type=models.ReportJob.THREADFIX_SUMMARY_REPORT, file_name='threadfix-summary', file_format='csv', requester=self.user)
+
+        self.assertEqual('pending', self.client.get(reverse('boh:dashboard.reports.status', args=[job.id])).json()['status'])
+        self.assertEqual(404, self.client.get(reverse('boh:dashboard.reports.file', args=[job.id])).status_code)
+
+        call_command('report_worker', once=True)
+
+        status = self.client.get(reverse('boh:dashboard.reports.status', args=[job.id])).json()
+        self.assertEqual('completed', status['status'])
+        response = self.client.get(status['download_url'])
+        self.assertIn(b'Org1,App1', b''.join(response.streaming_content))
+
+    def test_status_other_requester(self):
+        other = User.objects.create_user('other', 'other@example.com', 'password')
+        job = models.ReportJob.objects.create(report_type=models.ReportJob.THREADFIX_SUMMARY_REPORT, file_name='threadfix-summary', file_format='csv', requester=other)
+
+        self.assertEqual(404, self.client.get(reverse('boh:dashboard.reports.status', args=[job.id])).status_code)
+
+    def test_reports_lists_jobs(self):
+        models.ReportJob.objects.create(report_type=models.ReportJob.APP_SUMMARY_REPORT, file_name='app-summary', file_format='html', requester=self.user)
+
+        response = self.client.get(reverse('boh:dashboard.reports'))
+        self.assertContains(response, 'data-polling="true"')
+
+
+class ReportCacheTests(TestCase):
+
+    def setUp(self):
+        reports.cache().clear()
+        self.user = User.objects.create_user('reporter', 'reporter@example.com', 'password')
+        self.org_1 = models.Organization.objects.create(name='Org1')
+        self.app_1 = models.Application.objects.create(name='App1', organization=self.org_1)
+
+    def tearDown(self):
+        reports.cache().clear()
+
+    def write(self, report):
+        output = io.BytesIO()
+        report.write(output)
+        return output.getvalue()
+
+    def report(self, file_format='csv', organizations=None):
+        return reports.ThreadFixSummaryReport('report', file_format, organizations, self.user)
+
+    def test_repeat_served_from_cache(self):
+        content = self.write(self.report())
+
+        with self.assertNumQueries(3):  # Only the data version is checked
+            self.assertEqual(content, self.write(self.report()))
+
+    def test_data_change_invalidates(self):
+        self.write(self.report())
+
+        models.ThreadFixMetrics.objects.create(application=self.app_1, critical_count=7)
+        self.assertIn(b'Org1,App1,7', self.write(self.report()))
+
+    def test_deletion_invalidates(self):
+        app_2 = models.Application.objects.create(name='App2', organization=self.org_1)
+        self.write(self.report())
+
+        app_2.delete()
+        self.assertNotIn(b'App2', self.write(self.report()))
+
+    def test_inputs_in_key(self):
+        org_2 = models.Organization.objects.create(name='Org2')
+        self.assertNotEqual(self.report().cache_key(), self.report(organizations=[org_2]).cache_key())
+        self.assertNotEqual(self.report().cache_key(), self.report(file_format='html').cache_key())
+        self.assertEqual(self.report(organizations=[org_2, self.org_1]).cache_key(), self.report(organizations=[self.org_1, org_2]).cache_key())
+
+    def test_activity_change_invalidates(self):
+        activity_type = models.ActivityType.objects.create(name='Review')
+        engagement = models.Engagement.objects.create(start_date=datetime.date.today(), end_date=datetime.date.today(), application=self.app_1)
+        report = reports.AppSummaryReport('report', 'csv', models.Application.objects.none(), self.user)
+        key = report.cache_key()
+
+        activity = models.Activity.objects.create(engagement=engagement, activity_type=activity_type)
+        self.assertNotEqual(key, report.cache_key())
+
+        key = report.cache_key()
+        activity_type.name = 'Pentest'
+        activity_type.save()
+        self.assertNotEqual(key, report.cache_key())
+
+        key = report.cache_key()
+        activity.delete()
+        self.assertNotEqual(key, report.cache_key())
+
+    def test_application_relation_change_invalidates(self):
+        technology = models.Technology.objects.create(name='Django', category=models.Technology.FRAMEWORK_CATEGORY)
+        regulation = models.Regulation.objects.create(name='Regulation', acronym='REG', category=models.Regulation.PRIVACY_CATEGORY, jurisdiction='EU')
+        report = reports.AppSummaryReport('report', 'csv', models.Application.objects.none(), self.user)
+        key = report.cache_key()
+
+        self.app_1.technologies.add(technology)
+        self.app_1.regulations.add(regulation)
+        self.assertNotEqual(key, report.cache_key())
+
+        for change in [lambda: technology.save(), lambda: regulation.save(), lambda: technology.delete(), lambda: regulation.delete()]:
+            key = report.cache_key()
+            change()
+            self.assertNotEqual(key, report.cache_key())
+
+    @override_settings(REPORT_CACHE_MAX_SIZE=10)
+    def test_large_report_not_cached(self):
+        self.write(self.report())
+
+        with self.assertNumQueries(4):  # Checks the data version and generates the report again
+            self.write(self.report())
@@ -0,0 +1,87 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from . import models, search
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('searcher', 'searcher@example.com', 'password')
+        self.org_1 = models.Organization.objects.create(name='Org1')
+        self.app_1 = models.Application.objects.create(name='Payroll Portal', description='Pays the staff.', organization=self.org_1)
+        self.app_2 = models.Application.objects.create(name='Wiki', description='Documents the payroll process.', organization=self.org_1)
+        self.person_1 = models.Person.objects.create(first_name='Ada', last_name='Lovelace', email='ada@example.com', role=models.Person.DEVELOPER_ROLE)
+
+        today = datetime.date.today()
+        self.en_1 = models.Engagement.objects.create(start_date=today, end_date=today, description='Review before the audit.', application=self.app_2)
+        self.ac_1 = models.Activity.objects.create(engagement=self.en_1, activity_type=models.ActivityType.objects.create(name='Review'))
+
+    def found(self, query):
+        return [(result.kind, result.url) for result in search.search(query)]
+
+    def test_tokenize(self):
+        self.assertEqual(['ada', 'example', 'com', 'état'], search.tokenize('Ada@Example.com, ÉTAT!'))
+        self.assertEqual([], search.tokenize(None))
+
+    def test_ranked(self):
+        """Matches in names rank above matches in descriptions."""
+        self.assertEqual([
+            ('application', reverse('boh:application.overview', args=[self.app_1.id])),
+            ('application', reverse('boh:application.overview', args=[self.app_2.id])),
+        ], self.found('payroll'))
+
+    def test_every_term_matches(self):
+        self.assertEqual([('application', reverse('boh:application.overview', args=[self.app_2.id]))], self.found('payroll process'))
+        self.assertEqual([], self.found('payroll unknown'))
+
+    def test_prefix(self):
+        """Only the last term matches the terms it begins."""
+        self.assertEqual([('person', reverse('boh:person.detail', args=[self.person_1.id]))], self.found('ada Lovel'))
+        self.assertEqual([], self.found('Lovel ada'))
+
+    def test_comments(self):
+        models.EngagementComment.objects.create(engagement=self.en_1, message='Scope agreed with the auditors.', user=self.user)
+        models.ActivityComment.objects.create(activity=self.ac_1, message='Found an auditing gap.', user=self.user)
+
+        self.assertEqual({
+            ('engagement_comment', reverse('boh:engagement.detail', args=[self.en_1.id])),
+            ('activity_comment', reverse('boh:activity.detail', args=[self.ac_1.id])),
+        }, set(self.found('audit')) - {('engagement', reverse('boh:engagement.detail', args=[self.en_1.id]))})
+
+    def test_custom_field_values(self):
+        custom_field = models.CustomField.objects.create(name='Asset', key='asset')
+        value = models.ApplicationCustomFieldValue.objects.create(application=self.app_1, custom_field=custom_field, value='AS-4411')
+        self.assertEqual(1, len(self.found('as 4411')))
+
+        value.delete()
+        self.assertEqual([], self.found('4411'))
+
+    def test_updates_and_deletes(self):
+        self.person_1.last_name = 'Byron'
+        self.person_1.save()
+        self.assertEqual([], self.found('lovelace'))
+        self.assertEqual(1, len(self.found('byron')))
+
+        self.app_2.delete()
+        self.assertEqual(1, len(self.found('payroll')))
+        self.assertFalse(models.SearchTerm.objects.filter(kind=models.SearchTerm.ENGAGEMENT_KIND).exists())
+
+    def test_rebuild(self):
+        """A rebuilt index matches the one maintained as objects are saved."""
+        models.EngagementComment.objects.create(engagement=self.en_1, message='Scope agreed.', user=self.user)
+        terms = sorted(models.SearchTerm.objects.values_list('term', 'kind', 'object_id', 'weight'))
+
+        models.SearchTerm.objects.rebuild()
+        self.assertEqual(terms, sorted(models.SearchTerm.objects.values_list('term', 'kind', 'object_id', 'weight')))
+
+    def test_view(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('boh:search') + '?q=payroll')
+        self.assertContains(response, 'Payroll Portal')
+        self.assertContains(response, reverse('boh:application.overview', args=[self.app_2.id]))
+        self.assertContains(self.client.get(reverse('boh:search') + '?q=nothing'), 'Nothing matches')
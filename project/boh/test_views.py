@@ -0,0 +1,202 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import translation
+
+from . import fragments, models
+
+
+class ApplicationListCacheTests(TestCase):
+
+    def setUp(self):
+        fragments.cache().clear()
+        self.user = User.objects.create_user('viewer', 'viewer@example.com', 'password')
+        self.client.force_login(self.user)
+        self.org_1 = models.Organization.objects.create(name='Org1')
+        self.app_1 = models.Application.objects.create(name='App1', organization=self.org_1)
+        self.tag_1 = models.Tag.objects.create(name='Tag1')
+
+    def tearDown(self):
+        fragments.cache().clear()
+
+    def get(self, query=''):
+        return self.client.get(reverse('boh:application.list') + query)
+
+    def test_repeat_served_from_cache(self):
+        with CaptureQueriesContext(connection) as context:
+            first = self.get('?organization=%d' % self.org_1.id)
+        with CaptureQueriesContext(connection) as cached:
+            second = self.get('?organization=%d' % self.org_1.id)
+
+        self.assertEqual(first.content, second.content)
+        self.assertLess(len(cached.captured_queries), len(context.captured_queries))
+        self.assertFalse([query for query in cached.captured_queries if 'boh_application' in query['sql']])
+
+    def test_version_shared_between_processes(self):
+        """Versions live in the database, so another process with its own cache sees the same version and its invalidations."""
+        version = fragments.version('application_list')
+        fragments.cache().clear()
+        self.assertEqual(version, fragments.version('application_list'))
+
+        self.app_1.save()
+        fragments.cache().clear()
+        self.assertNotEqual(version, fragments.version('application_list'))
+
+    def test_language_in_key(self):
+        with translation.override('en'):
+            english = fragments.key('application_list', 'rows')
+        with translation.override('pt-br'):
+            self.assertNotEqual(english, fragments.key('application_list', 'rows'))
+
+    def test_equivalent_queries_share_key(self):
+        self.get('?name=App&business_criticality=&organization=%d' % self.org_1.id)
+
+        with CaptureQueriesContext(connection) as context:
+            self.get('?organization=%d&name=App' % self.org_1.id)
+        self.assertFalse([query for query in context.captured_queries if 'boh_application' in query['sql']])
+
+    def test_page_sizes_cached_separately(self):
+        self.get('?page_size=25')
+
+        models.Application.objects.bulk_create([models.Application(name='App2', organization=self.org_1)])  # Sends no signals
+        self.assertNotContains(self.get('?page_size=25'), 'App2')
+        self.assertContains(self.get('?page_size=50'), 'App2')
+
+    def test_application_save_invalidates(self):
+        self.get()
+
+        self.app_1.name = 'Renamed'
+        self.app_1.save()
+        self.assertContains(self.get(), 'Renamed')
+
+    def test_organization_save_invalidates(self):
+        self.get()
+
+        self.org_1.name = 'Renamed'
+        self.org_1.save()
+        self.assertContains(self.get(), 'Renamed')
+
+    def test_tags_invalidate(self):
+        self.get()
+
+        self.app_1.tags.add(self.tag_1)
+        self.assertContains(self.get(), 'Tag1')
+
+        self.tag_1.name = 'Renamed'
+        self.tag_1.save()
+        self.assertContains(self.get(), 'Renamed')
+
+
+    def test_data_elements_invalidate_dcl_filter(self):
+        models.Application.objects.create(name='App2', organization=self.org_1)
+        self.assertNotContains(self.get('?dcl=4'), 'App1')
+
+        data_element = models.DataElement.objects.create(name='ssn', category=models.DataElement.PCI_CATEGORY, weight=200)
+        self.app_1.data_elements.add(data_element)
+        response = self.get('?dcl=4')
+        self.assertContains(response, 'App1')
+        self.assertNotContains(response, 'App2')
+
+        data_element.weight = 1
+        data_element.save()
+        self.assertNotContains(self.get('?dcl=4'), 'App1')
+
+@override_settings(APPLICATION_LIST_CHUNK_SIZE=2)
+class ApplicationListChunkTests(TestCase):
+
+    def setUp(self):
+        fragments.cache().clear()
+        self.user = User.objects.create_user('viewer', 'viewer@example.com', 'password')
+        self.client.force_login(self.user)
+        self.org_1 = models.Organization.objects.create(name='Org1')
+        self.org_2 = models.Organization.objects.create(name='Org2')
+        for index in range(5):
+            models.Application.objects.create(name='App%d' % index, organization=self.org_1)
+        models.Application.objects.create(name='Other', organization=self.org_2)
+
+    def tearDown(self):
+        fragments.cache().clear()
+
+    def test_all_renders_first_chunk(self):
+        response = self.client.get(reverse('boh:application.list') + '?page_size=all')
+
+        self.assertContains(response, 'App1')
+        self.assertNotContains(response, 'App2')
+        self.assertContains(response, '<b>6</b>')
+        self.assertEqual(['App0', 'App1'], [application.name for application in response.context['chunk']['applications']])
+
+    def test_rows_follow_chunks(self):
+        url = self.client.get(reverse('boh:application.list') + '?organization=%d&page_size=all' % self.org_1.id).context['chunk']['next']
+
+        html = ''
+        requests = 0
+        while url:
+            data = self.client.get(url).json()
+            html += data['html']
+            url = data['next']
+            requests += 1
+
+        self.assertEqual(2, requests)
+        for name in ('App2', 'App3', 'App4'):
+            self.assertIn(name, html)
+        self.assertNotIn('App1', html)
+        self.assertNotIn('Other', html)
+
+    def test_rows_bounded(self):
+        with self.assertNumQueries(5):  # Session, user, fragment version, applications and their tags
+            data = self.client.get(reverse('boh:application.rows') + '?after=App1').json()
+        self.assertEqual(2, data['html'].count('<tr>'))
+
+
+class ConcurrentUpdateTests(TestCase):
+    """Status changes which lost a race with another request ask to reload instead of failing."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('viewer', 'viewer@example.com', 'password')
+        self.client.force_login(self.user)
+        application = models.Application.objects.create(name='App1', organization=models.Organization.objects.create(name='Org1'))
+        self.engagement = models.Engagement.objects.create(start_date=datetime.date.today(), end_date=datetime.date.today(), application=application)
+        self.activity = models.Activity.objects.create(engagement=self.engagement, activity_type=models.ActivityType.objects.create(name='Review'))
+
+    def post_stale(self, instance, url, data):
+        """Posts while the view works on a copy loaded before the status was changed elsewhere."""
+        stale = type(instance).objects.get(pk=instance.pk)
+        instance.status = instance.OPEN_STATUS
+        instance.save()
+        with mock.patch('boh.views.get_object_or_404', return_value=stale):
+            return self.client.post(url, data, follow=True)
+
+    def test_engagement_status(self):
+        response = self.post_stale(self.engagement, reverse('boh:engagement.status', args=[self.engagement.id]), {'status': models.Engagement.CLOSED_STATUS})
+
+        self.assertRedirects(response, reverse('boh:engagement.detail', args=[self.engagement.id]))
+        self.assertIn('modified by someone else', [str(message) for message in response.context['messages']][0])
+        self.assertEqual(models.Engagement.OPEN_STATUS, models.Engagement.objects.get().status)
+
+    def test_activity_edit(self):
+        data = {'status': models.Activity.CLOSED_STATUS, 'activity_type': self.activity.activity_type_id, 'users': [self.user.id]}
+        response = self.post_stale(self.activity, reverse('boh:activity.edit', args=[self.activity.id]), data)
+
+        self.assertRedirects(response, reverse('boh:activity.detail', args=[self.activity.id]))
+        self.assertEqual(models.Activity.OPEN_STATUS, models.Activity.objects.get().status)
+
+
+class ApplicationAdminTests(TestCase):
+
+    def test_order_by_dcl(self):
+        """The DCL column orders by the overriding level when one is set, as it is displayed."""
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        organization = models.Organization.objects.create(name='Org1')
+        models.Application.objects.create(name='App1', organization=organization, calculated_dcl=models.Application.DCL_2)
+        models.Application.objects.create(name='App2', organization=organization, calculated_dcl=models.Application.DCL_3)
+        models.Application.objects.create(name='App3', organization=organization, override_dcl=models.Application.DCL_4)
+
+        response = self.client.get(reverse('admin:boh_application_changelist'), {'o': '-10'})
+
+        self.assertEqual(['App3', 'App2', 'App1'], [application.name for application in response.context['cl'].result_list])
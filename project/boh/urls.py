@@ -10,6 +10,8 @@ urlpatterns = [
     url(r'^metrics/$', views.dashboard_metrics, name='dashboard.metrics'),
     url(r'^reports/$', views.dashboard_reports, name='dashboard.reports'),
     url(r'^reports/download/$', views.dashboard_reports_download, name='dashboard.reports.download'),
+    url(r'^reports/(?P<report_job_id>\d+)/status/$', views.dashboard_reports_status, name='dashboard.reports.status'),
+    url(r'^reports/(?P<report_job_id>\d+)/download/$', views.dashboard_reports_file, name='dashboard.reports.file'),
 
     # Management
     url(r'^manage/$', views.management_overview, name='management.overview'),
@@ -53,6 +55,7 @@ urlpatterns = [
 
     # Application
     url(r'^applications/$', views.application_list, name='application.list'),
+    url(r'^applications/rows/$', views.application_rows, name='application.rows'),
     url(r'^applications/add/$', views.application_add, name='application.add'),
     url(r'^applications/(?P<application_id>\d+)/$', views.application_overview, name='application.overview'),
     url(r'^applications/(?P<application_id>\d+)/engagements/$', views.application_engagements, name='application.engagements'),
@@ -94,6 +97,9 @@ urlpatterns = [
     url(r'^activities/(?P<activity_id>\d+)/delete/$', views.activity_delete, name='activity.delete'),
     url(r'^activities/(?P<activity_id>\d+)/comments/add/$', views.activity_comment_add, name='activity.comment.add'),
 
+    # Search
+    url(r'^search/$', views.search_results, name='search'),
+
     # People
     url(r'^people/$', views.person_list, name='person.list'),
     url(r'^people/add/$', views.person_add, name='person.add'),
@@ -1,6 +1,7 @@
 import random
 
 from django import forms as django_forms
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.decorators import login_required
@@ -9,16 +10,20 @@ from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.admin.views.decorators import staff_member_required
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.core.urlresolvers import reverse
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.db.models import Avg, Count, Prefetch, Q
 from django.forms.formsets import formset_factory
 from django.forms.models import inlineformset_factory
+from django.http import FileResponse, JsonResponse
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from django.utils.translation import ugettext_lazy as _
 from django.shortcuts import get_object_or_404, render, redirect
+from django.template.loader import render_to_string
 from django.views.decorators.http import require_http_methods
 
-from . import filters, forms, models, reports
+from . import filters, forms, fragments, models, reports, search
+from .behaviors import ConcurrentUpdateError
 
 from threadfix_api import threadfix as tf_api
 
@@ -167,10 +172,13 @@ def dashboard_reports(request):
     tf_report_form = forms.ThreadFixSummaryReportForm()
     as_report_form = forms.AppSummaryReportForm()
 
+    report_jobs = models.ReportJob.objects.filter(requester=request.user)[:10]
+
     return render(request, 'boh/dashboard/reports.html', {
         'ec_report_form': ec_report_form,
         'tf_report_form': tf_report_form,
         'as_report_form': as_report_form,
+        'report_jobs': report_jobs,
         'active_top': 'dashboard',
         'active_tab': 'reports'
     })
@@ -180,26 +188,61 @@ def dashboard_reports(request):
 def dashboard_reports_download(request):
     timestamp = timezone.now().strftime('%y%m%d%H%M%S')
 
+    job = None
     report_type = request.GET.get('report_type')
     if report_type == 'engagement_coverage':
         form = forms.EngagementCoverageReportForm(request.POST)
         if form.is_valid():
-            file_name = 'engagement-coverage_' + timestamp
-            return reports.EngagementCoverageReport(file_name, form.cleaned_data['format'], form.cleaned_data['organizations'], request.user).response()
+            job = models.ReportJob(report_type=models.ReportJob.ENGAGEMENT_COVERAGE_REPORT, file_name='engagement-coverage_' + timestamp)
     elif report_type == 'threadfix_summary':
         form = forms.ThreadFixSummaryReportForm(request.POST)
         if form.is_valid():
-            file_name = 'threadfix-summary_' + timestamp
-            return reports.ThreadFixSummaryReport(file_name, form.cleaned_data['format'], form.cleaned_data['organizations'], request.user).response()
+            job = models.ReportJob(report_type=models.ReportJob.THREADFIX_SUMMARY_REPORT, file_name='threadfix-summary_' + timestamp)
     elif report_type == 'app_summary':
         form = forms.AppSummaryReportForm(request.POST)
         if form.is_valid():
-            file_name = 'app-summary_' + timestamp
-            return reports.AppSummaryReport(file_name, form.cleaned_data['format'], form.cleaned_data['applications'], request.user).response()
+            job = models.ReportJob(report_type=models.ReportJob.APP_SUMMARY_REPORT, file_name='app-summary_' + timestamp)
+
+    if job is None:
+        messages.error(request, _('There was a problem downloading the report.'), extra_tags=random.choice(error_messages))
+        return redirect('boh:dashboard.reports')
+
+    job.file_format = form.cleaned_data['format']
+    job.requester = request.user
+    job.save()
+    if 'organizations' in form.cleaned_data:
+        job.organizations.set(form.cleaned_data['organizations'])
+    if 'applications' in form.cleaned_data:
+        job.applications.set(form.cleaned_data['applications'])
 
-    messages.error(request, _('There was a problem downloading the report.'), extra_tags=random.choice(error_messages))
+    messages.success(request, _('Your report has been queued. It will be available for download below once generated.'), extra_tags=random.choice(success_messages))
     return redirect('boh:dashboard.reports')
 
+
+@login_required
+@require_http_methods(['GET'])
+def dashboard_reports_status(request, report_job_id):
+    job = get_object_or_404(models.ReportJob, pk=report_job_id, requester=request.user)
+
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'download_url': reverse('boh:dashboard.reports.file', args=[job.id]) if job.is_completed() else None
+    })
+
+
+@login_required
+@require_http_methods(['GET'])
+def dashboard_reports_file(request, report_job_id):
+    job = get_object_or_404(models.ReportJob, pk=report_job_id, requester=request.user, status=models.ReportJob.COMPLETED_STATUS)
+
+    job.file.open('rb')
+    response = FileResponse(job.file, content_type=reports.Report.content_types[job.file_format])
+    if not settings.DEBUG:
+        response['Content-Disposition'] = 'attachment; filename="%s"' % job
+    return response
+
 # Management
 
 @login_required
@@ -878,42 +921,89 @@ def application_list(request):
         page_size_form = forms.PageSizeForm(request.GET)
         if page_size_form.is_valid():
             page_size = page_size_form.cleaned_data['page_size']
-            if page_size == 'all':
-                page_size = 10000000
-            else:
+            if page_size != 'all':
                 page_size = int(page_size)
 
-    paginator = Paginator(application_filter.qs, page_size)
-
     page = request.GET.get('page')
 
-    try:
-        applications = paginator.page(page)
-    except PageNotAnInteger:
-        applications = paginator.page(1)
-    except EmptyPage:
-        applications = paginator.page(paginator.num_pages)
+    # Everything is rendered a chunk at a time, the first with the page and the rest requested by the page
+    chunk = None
+    if page_size == 'all':
+        chunk = SimpleLazyObject(lambda: _application_chunk(request, application_filter.qs))
+
+    def paginate():
+        paginator = Paginator(application_filter.qs, page_size)
+        try:
+            return paginator.page(page)
+        except PageNotAnInteger:
+            return paginator.page(1)
+        except EmptyPage:
+            return paginator.page(paginator.num_pages)
+
+    # The page is only queried when its cached fragments have expired
+    applications = SimpleLazyObject(paginate)
 
     #
     show_advanced = False
-    if request.GET.get('platform') or request.GET.get('lifecycle') or request.GET.get('origin') or request.GET.get('technologies') or request.GET.get('regulations') or request.GET.get('tags') or request.GET.get('service_level_agreements') or request.GET.get('asvs_level') or (request.GET.get('external_audience') and request.GET.get('external_audience') is not '1') or (request.GET.get('internet_accessible') and request.GET.get('internet_accessible') is not '1'):
+    if request.GET.get('platform') or request.GET.get('lifecycle') or request.GET.get('origin') or request.GET.get('technologies') or request.GET.get('regulations') or request.GET.get('tags') or request.GET.get('service_level_agreements') or request.GET.get('asvs_level') or request.GET.get('dcl') or (request.GET.get('external_audience') and request.GET.get('external_audience') is not '1') or (request.GET.get('internet_accessible') and request.GET.get('internet_accessible') is not '1'):
         show_advanced = True
 
     return render(request, 'boh/application/list.html', {
         'form': application_filter.form,
         'applications': applications,
+        'chunk': chunk,
+        'total': SimpleLazyObject(application_filter.qs.count),
         'queries': queries,
         'page_size_form': page_size_form,
         'page_size': str(page_size),
         'show_advanced': show_advanced,
+        'cache_key': fragments.key('application_list', fragments.normalized_query(queries), page, page_size),
+        'cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+        'cache_name': settings.FRAGMENT_CACHE,
         'active_top': 'applications'
     })
 
 
+@login_required
+@require_http_methods(['GET'])
+def application_rows(request):
+    application_filter = filters.ApplicationFilter(request.GET, queryset=models.Application.objects.all().select_related('organization').prefetch_related('tags'))
+
+    key = fragments.key('application_list', fragments.normalized_query(request.GET), 'rows')
+    content = fragments.cache().get(key)
+    if content is None:
+        chunk = _application_chunk(request, application_filter.qs, request.GET.get('after'))
+        content = {
+            'html': render_to_string('boh/snippets/application/_rows.html', {'applications': chunk['applications']}, request),
+            'next': chunk['next']
+        }
+        fragments.cache().set(key, content, settings.FRAGMENT_CACHE_TIMEOUT)
+
+    return JsonResponse(content)
+
+
+def _application_chunk(request, queryset, after=None):
+    """Returns the applications following the named application, in name order, and the URL of the next chunk."""
+    if after:
+        queryset = queryset.filter(name__gt=after)
+    applications = list(queryset.order_by('name')[:settings.APPLICATION_LIST_CHUNK_SIZE + 1])
+
+    next_url = None
+    if len(applications) > settings.APPLICATION_LIST_CHUNK_SIZE:
+        applications = applications[:-1]
+        queries = request.GET.copy()
+        queries['after'] = applications[-1].name
+        for name in ('page', 'page_size'):
+            queries.pop(name, None)
+        next_url = reverse('boh:application.rows') + '?' + queries.urlencode()
+
+    return {'applications': applications, 'next': next_url}
+
+
 @login_required
 @require_http_methods(['GET'])
 def application_overview(request, application_id):
-    application = get_object_or_404(models.Application, pk=application_id)
+    application = get_object_or_404(models.Application.objects.select_related('latest_threadfix_metrics'), pk=application_id)
 
     return render(request, 'boh/application/overview.html', {
         'application': application,
@@ -1172,7 +1262,7 @@ def application_settings_data_elements(request, application_id):
         'application': application,
         'data_elements_form': data_elements_form,
         'dcl_override_form': dcl_override_form,
-        'dcl': application.data_classification_level,
+        'dcl': application.calculated_dcl,
         'dsv': application.data_sensitivity_value,
         'active_top': 'applications',
         'active_tab': 'settings',
@@ -1507,7 +1597,12 @@ def engagement_edit(request, engagement_id):
     form = forms.EngagementEditForm(request.POST or None, instance=engagement)
 
     if request.method == 'POST' and form.is_valid():
-        engagement = form.save()
+        try:
+            with transaction.atomic():
+                engagement = form.save()
+        except ConcurrentUpdateError:
+            messages.error(request, _('This engagement was modified by someone else. Reload it and try again.'), extra_tags=random.choice(error_messages))
+            return redirect('boh:engagement.detail', engagement_id=engagement.id)
         messages.success(request, _('You successfully updated this engagement.'), extra_tags=random.choice(success_messages))
         return redirect('boh:engagement.detail', engagement_id=engagement.id)
 
@@ -1528,7 +1623,12 @@ def engagement_status(request, engagement_id):
     status_form = forms.EngagementStatusForm(request.POST, instance=engagement)
 
     if status_form.is_valid():
-        engagement = status_form.save()
+        try:
+            with transaction.atomic():
+                engagement = status_form.save()
+        except ConcurrentUpdateError:
+            messages.error(request, _('This engagement was modified by someone else. Reload it and try again.'), extra_tags=random.choice(error_messages))
+            return redirect('boh:engagement.detail', engagement_id=engagement.id)
         eng_status = engagement.get_status_display().lower()
         messages.success(request, _('You successfully updated this engagement\'s status to "%(eng_status)s".') % {'eng_status': eng_status}, extra_tags=random.choice(success_messages))
 
@@ -1621,7 +1721,12 @@ def activity_edit(request, activity_id):
     form = forms.ActivityEditForm(request.POST or None, instance=activity)
 
     if request.method == 'POST' and form.is_valid():
-        activity = form.save()
+        try:
+            with transaction.atomic():
+                activity = form.save()
+        except ConcurrentUpdateError:
+            messages.error(request, _('This activity was modified by someone else. Reload it and try again.'), extra_tags=random.choice(error_messages))
+            return redirect('boh:activity.detail', activity_id=activity.id)
         messages.success(request, _('You successfully updated this activity.'), extra_tags=random.choice(success_messages))
         return redirect('boh:activity.detail', activity_id=activity.id)
 
@@ -1642,7 +1747,12 @@ def activity_status(request, activity_id):
     status_form = forms.ActivityStatusForm(request.POST, instance=activity)
 
     if status_form.is_valid():
-        activity = status_form.save()
+        try:
+            with transaction.atomic():
+                activity = status_form.save()
+        except ConcurrentUpdateError:
+            messages.error(request, _('This activity was modified by someone else. Reload it and try again.'), extra_tags=random.choice(error_messages))
+            return redirect('boh:activity.detail', activity_id=activity.id)
         activity_status = activity.get_status_display().lower()
         messages.success(request, _('You successfully updated this activity\'s status to "%(activity_status)s".') % {'activity_status': activity_status}, extra_tags=random.choice(success_messages))
 
@@ -1719,6 +1829,17 @@ def person_add(request):
     })
 
 
+@login_required
+@require_http_methods(['GET'])
+def search_results(request):
+    query = request.GET.get('q', '')
+
+    return render(request, 'boh/search.html', {
+        'query': query,
+        'results': search.search(query),
+    })
+
+
 @login_required
 @require_http_methods(['GET'])
 def person_detail(request, person_id):
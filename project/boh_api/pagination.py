@@ -0,0 +1,47 @@
+from rest_framework import pagination
+
+
+class KeysetPagination(pagination.CursorPagination):
+    """Pages through results by primary key so every page costs the same and no count query is issued."""
+
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class OptionalCursorPagination(pagination.BasePagination):
+    """
+    Page number pagination which switches to keyset pagination when requested with '?pagination=cursor' or when a
+    cursor is given. Responses in cursor mode contain only 'next', 'previous' and 'results'.
+    """
+
+    mode_query_param = 'pagination'
+    cursor_mode = 'cursor'
+
+    def __init__(self):
+        self.paginator = pagination.PageNumberPagination()
+
+    @property
+    def display_page_controls(self):
+        return self.paginator.display_page_controls
+
+    def use_cursor(self, request):
+        return request.query_params.get(self.mode_query_param) == self.cursor_mode or \
+            KeysetPagination.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            self.paginator = KeysetPagination()
+        return self.paginator.paginate_queryset(queryset, request, view=view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    def get_results(self, data):
+        return self.paginator.get_results(data)
+
+    def get_schema_fields(self, view):
+        return self.paginator.get_schema_fields(view)
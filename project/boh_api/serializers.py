@@ -1,31 +1,85 @@
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ObjectDoesNotExist
+from django.utils.translation import ugettext_lazy as _
 
-from rest_framework import serializers
+from rest_framework import permissions, serializers
 
 from boh import models
 
 
-class UserSerializer(serializers.ModelSerializer):
+def requested_fields(request):
+    """
+    Returns the sets of field names listed in the 'fields' and 'expand' query parameters of a read request. Fields is
+    None when every field is requested. Expand is None when neither parameter is given, which expands every relation.
+    """
+    if request is None or request.method not in permissions.SAFE_METHODS:
+        return None, None
+
+    fields = request.query_params.get('fields')
+    expand = request.query_params.get('expand')
+    if fields is None and expand is None:
+        return None, None
+
+    if fields is not None:
+        fields = set(name.strip() for name in fields.split(',') if name.strip())
+    expand = set(name.strip() for name in (expand or '').split(',') if name.strip())
+    return fields, expand
+
+
+def is_included(name, fields, expand):
+    return fields is None or name in fields or (expand is not None and name in expand)
+
+
+def is_expanded(name, field, expand):
+    """Nested serializers are expanded unless the request selects which relations to expand."""
+    return expand is None or name in expand or not isinstance(field, serializers.BaseSerializer)
+
+
+class ExpandableFieldsMixin(object):
+    """
+    Serializes only the fields listed in '?fields=' (e.g., '?fields=id,name'). Once either '?fields=' or '?expand=' is
+    given, nested relations are serialized as primary keys unless listed in '?expand=' (e.g., '?expand=organization').
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(ExpandableFieldsMixin, self).__init__(*args, **kwargs)
+
+        fields, expand = requested_fields(self.context.get('request'))
+        for name, field in list(self.fields.items()):
+            if not is_included(name, fields, expand):
+                self.fields.pop(name)
+            elif not is_expanded(name, field, expand):
+                self.fields[name] = self.collapse(name, field)
+
+    def collapse(self, name, field):
+        """Returns a primary key field in place of a nested serializer."""
+        kwargs = {'read_only': True}
+        if field.source != name:
+            kwargs['source'] = field.source
+        if isinstance(field, serializers.ListSerializer):
+            kwargs['many'] = True
+        return serializers.PrimaryKeyRelatedField(**kwargs)
+
+
+class UserSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = get_user_model()
         fields = ['id', 'username', 'first_name', 'last_name', 'email', 'is_active', 'last_login']
         read_only_fields = fields
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Tag
         fields = ['id', 'name', 'color', 'description']
 
 
-class PersonSerializer(serializers.ModelSerializer):
+class PersonSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Person
         fields = ['id', 'first_name', 'last_name', 'email', 'role', 'phone_work', 'phone_mobile', 'job_title']
 
 
-class OrganizationSerializer(serializers.ModelSerializer):
+class OrganizationSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     people = PersonSerializer(many = True, read_only = True)
 
     class Meta:
@@ -33,28 +87,34 @@ class OrganizationSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'people']
 
 
-class ActivityTypeSerializer(serializers.ModelSerializer):
+class ActivityTypeSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = models.ActivityType
         fields = ['id', 'name', 'documentation']
 
 
-class ActivitySerializer(serializers.ModelSerializer):
+class ActivitySerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     activity_type = ActivityTypeSerializer(read_only = True)
+    activity_type_id = serializers.PrimaryKeyRelatedField(source='activity_type', queryset=models.ActivityType.objects.all(), write_only = True, required = False)
     users = UserSerializer(many = True, read_only = True)
 
     class Meta:
         model = models.Activity
-        fields = ['id', 'status', 'description', 'open_date', 'close_date', 'duration', 'activity_type', 'engagement', 'users']
+        fields = ['id', 'status', 'description', 'open_date', 'close_date', 'duration', 'activity_type', 'activity_type_id', 'engagement', 'users']
+
+    def validate(self, attrs):
+        if self.instance is None and 'activity_type' not in attrs:
+            raise serializers.ValidationError({'activity_type_id': _('This field is required.')})
+        return attrs
 
 
-class DataElementSerializer(serializers.ModelSerializer):
+class DataElementSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = models.DataElement
         fields = ['id', 'name', 'description']
 
 
-class ApplicationSerializer(serializers.ModelSerializer):
+class ApplicationSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     class ApplicationCustomFieldValueSerializer(serializers.ModelSerializer):
         key = serializers.SerializerMethodField()
 
@@ -67,6 +127,7 @@ class ApplicationSerializer(serializers.ModelSerializer):
 
     threadfix_metrics = serializers.SerializerMethodField()
     organization = OrganizationSerializer(read_only = True)
+    organization_id = serializers.PrimaryKeyRelatedField(source='organization', queryset=models.Organization.objects.all(), write_only = True, required = False)
     tags = TagSerializer(many = True, read_only = True)
     data_elements = DataElementSerializer(many = True, read_only = True)
     custom_fields = ApplicationCustomFieldValueSerializer(source='applicationcustomfieldvalue_set', many = True, read_only = True)
@@ -74,25 +135,30 @@ class ApplicationSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = models.Application
-        fields = ['id', 'organization', 'name', 'description', 'business_criticality', 'platform', 'lifecycle', 'origin', 'user_records', 'revenue', 'external_audience', 'internet_accessible', 'threadfix_metrics', 'tags', 'data_elements', 'custom_fields', 'people']
+        fields = ['id', 'organization', 'organization_id', 'name', 'description', 'business_criticality', 'platform', 'lifecycle', 'origin', 'user_records', 'revenue', 'external_audience', 'internet_accessible', 'threadfix_metrics', 'tags', 'data_elements', 'custom_fields', 'people']
+
+    def validate(self, attrs):
+        if self.instance is None and 'organization' not in attrs:
+            raise serializers.ValidationError({'organization_id': _('This field is required.')})
+        return attrs
 
     def get_threadfix_metrics(self, application):
-        try:
-            metrics = models.ThreadFixMetrics.objects.filter(application=application).latest()
-            result = {
-                'critical_count': metrics.critical_count,
-                'high_count': metrics.high_count,
-                'medium_count': metrics.medium_count,
-                'low_count:': metrics.low_count,
-                'informational_count': metrics.informational_count,
-                'created_date': metrics.created_date
-            }
-            return result
-        except ObjectDoesNotExist:
+        metrics = application.latest_threadfix_metrics
+        if metrics is None:
             return None
 
+        result = {
+            'critical_count': metrics.critical_count,
+            'high_count': metrics.high_count,
+            'medium_count': metrics.medium_count,
+            'low_count:': metrics.low_count,
+            'informational_count': metrics.informational_count,
+            'created_date': metrics.created_date
+        }
+        return result
 
-class EngagementSerializer(serializers.ModelSerializer):
+
+class EngagementSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     requestor = PersonSerializer(read_only = True)
 
     class Meta:
@@ -100,3 +166,28 @@ class EngagementSerializer(serializers.ModelSerializer):
         fields = ['id', 'status', 'start_date', 'end_date', 'description', 'open_date', 'close_date', 'duration', 'requestor', 'application']
 
 
+class MetricsQuerySerializer(serializers.Serializer):
+    year = serializers.IntegerField(required=False, min_value=1)
+    group_by = serializers.ChoiceField(choices=['organization'], required=False)
+
+
+class StatusCountsSerializer(serializers.Serializer):
+    pending_count = serializers.IntegerField()
+    open_count = serializers.IntegerField()
+    closed_count = serializers.IntegerField()
+    total_count = serializers.IntegerField()
+    average_duration = serializers.DurationField()
+
+
+class ActivityTypeStatsSerializer(StatusCountsSerializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+
+
+class EngagementTrendSerializer(StatusCountsSerializer):
+    month = serializers.DateField()
+    organization = serializers.CharField(source='organization_name', required=False)
+
+
+class ActivityTrendSerializer(EngagementTrendSerializer):
+    activity_type = serializers.CharField(source='activity_type_name')
@@ -1,3 +1,425 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from boh import models, search
+
+from . import viewsets
+
+
+class APITestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('api', 'api@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.organization = models.Organization.objects.create(name='Org1')
+
+
+class CursorPaginationTests(APITestCase):
+
+    def setUp(self):
+        super(CursorPaginationTests, self).setUp()
+        for index in range(7):
+            models.Application.objects.create(name='App' + str(index), organization=self.organization)
+
+    def test_page_number_default(self):
+        response = self.client.get('/api/v0/applications/', {'page': 1})
+
+        self.assertEqual(7, response.data['count'])
+        self.assertEqual(7, len(response.data['results']))
+
+    def test_cursor_walks_all(self):
+        names = []
+        url = '/api/v0/applications/?pagination=cursor&page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertNotIn('count', response.data)
+            names += [application['name'] for application in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(['App' + str(index) for index in range(7)], names)
+
+    def test_cursor_no_count_or_offset(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/v0/applications/?pagination=cursor&page_size=3')
+        sql = ' '.join(query['sql'] for query in context.captured_queries)
+
+        self.assertNotIn('COUNT(', sql)
+        self.assertNotIn('OFFSET', sql)
+
+
+class RelatedObjectsTestCase(APITestCase):
+
+    def setUp(self):
+        super(RelatedObjectsTestCase, self).setUp()
+        self.person = models.Person.objects.create(first_name='f', last_name='l', email='f@l.com', role=models.Person.MANAGER_ROLE)
+        self.organization.people.add(self.person)
+        self.tag = models.Tag.objects.create(name='Tag')
+        self.data_element = models.DataElement.objects.create(name='Name', category=models.DataElement.PERSONAL_CATEGORY, weight=2)
+        self.custom_field = models.CustomField.objects.create(name='Field', key='field')
+        self.activity_type = models.ActivityType.objects.create(name='Review')
+        self.add_objects()
+
+    def add_objects(self):
+        organization = models.Organization.objects.create(name='Organization' + str(models.Organization.objects.count()))
+        organization.people.add(self.person)
+        application = models.Application.objects.create(name='App' + str(models.Application.objects.count()), organization=organization)
+        application.tags.add(self.tag)
+        application.data_elements.add(self.data_element)
+        models.Relation.objects.create(person=self.person, application=application)
+        models.ApplicationCustomFieldValue.objects.create(application=application, custom_field=self.custom_field, value='value')
+        models.ThreadFixMetrics.objects.create(application=application)
+        engagement = models.Engagement.objects.create(start_date='2020-01-01', end_date='2020-01-02', application=application, requestor=self.person)
+        activity = models.Activity.objects.create(engagement=engagement, activity_type=self.activity_type)
+        activity.users.add(self.user)
+
+    def assertConstantQueries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(200, self.client.get(url).status_code)
+        for index in range(4):
+            self.add_objects()
+        with self.assertNumQueries(len(context.captured_queries)):
+            response = self.client.get(url)
+        self.assertGreaterEqual(len(response.data['results']), 5)
+
+
+class QueryCountTests(RelatedObjectsTestCase):
+    """List endpoints issue the same number of queries regardless of the number of objects on the page."""
+
+    def test_organizations(self):
+        self.assertConstantQueries('/api/v0/organizations/')
+
+    def test_applications(self):
+        self.assertConstantQueries('/api/v0/applications/')
+
+    def test_engagements(self):
+        self.assertConstantQueries('/api/v0/engagements/')
+
+    def test_activities(self):
+        self.assertConstantQueries('/api/v0/activities/')
+
+
+class ExpandableFieldsTests(RelatedObjectsTestCase):
+
+    def test_fields(self):
+        response = self.client.get('/api/v0/applications/', {'fields': 'id,name,business_criticality'})
+
+        self.assertEqual(['id', 'name', 'business_criticality'], list(response.data['results'][0]))
+
+    def test_fields_skip_relations(self):
+        with self.assertNumQueries(3):  # Version, count and page
+            self.client.get('/api/v0/applications/', {'fields': 'id,name,business_criticality'})
+
+    def test_collapsed_relations(self):
+        application = models.Application.objects.get()
+        response = self.client.get('/api/v0/applications/', {'fields': 'id,organization,tags,custom_fields'})
+
+        result = response.data['results'][0]
+        self.assertEqual(application.organization_id, result['organization'])
+        self.assertEqual([self.tag.id], result['tags'])
+        self.assertEqual([application.applicationcustomfieldvalue_set.get().id], result['custom_fields'])
+
+    def test_expand(self):
+        response = self.client.get('/api/v0/applications/', {'fields': 'id', 'expand': 'organization'})
+
+        result = response.data['results'][0]
+        self.assertEqual(['id', 'organization'], list(result))
+        self.assertEqual([self.person.id], [person['id'] for person in result['organization']['people']])
+
+    def test_expand_constant_queries(self):
+        self.assertConstantQueries('/api/v0/applications/?expand=organization,custom_fields')
+
+    def test_default_unchanged(self):
+        response = self.client.get('/api/v0/activities/')
+
+        self.assertEqual('Review', response.data['results'][0]['activity_type']['name'])
+        self.assertEqual(self.user.username, response.data['results'][0]['users'][0]['username'])
+
+    def test_write_ignores_fields(self):
+        response = self.client.post('/api/v0/tags/?fields=id', {'name': 'New', 'color': 'ffffff'}, format='json')
+
+        self.assertEqual(201, response.status_code)
+        self.assertEqual('ffffff', models.Tag.objects.get(name='New').color)
+
+    def test_update_keeps_relations(self):
+        """The write-only relation ids are only required on create, an update without them keeps the current value."""
+        application = models.Application.objects.get()
+        activity = models.Activity.objects.get()
+
+        self.assertEqual(200, self.client.put('/api/v0/applications/%d/' % application.id, {'name': 'Renamed'}, format='json').status_code)
+        self.assertEqual(200, self.client.put('/api/v0/activities/%d/' % activity.id, {'engagement': activity.engagement_id, 'status': models.Activity.OPEN_STATUS}, format='json').status_code)
+        self.assertEqual(application.organization_id, models.Application.objects.get().organization_id)
+        self.assertEqual(self.activity_type.id, models.Activity.objects.get().activity_type_id)
+
+        response = self.client.post('/api/v0/activities/', {'engagement': activity.engagement_id}, format='json')
+        self.assertEqual(400, response.status_code)
+        self.assertIn('activity_type_id', response.data)
+
+
+class ConditionalGetTests(RelatedObjectsTestCase):
+
+    def get(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_list_not_modified(self):
+        response = self.client.get('/api/v0/applications/')
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(304, self.get('/api/v0/applications/', response).status_code)
+
+    def test_detail_invalid_id(self):
+        self.assertEqual(404, self.client.get('/api/v0/applications/abc/').status_code)
+        self.assertEqual(404, self.client.get('/api/v0/applications/0/').status_code)
+
+    def test_detail_not_modified(self):
+        url = '/api/v0/engagements/%d/' % models.Engagement.objects.get().id
+        response = self.client.get(url)
+
+        self.assertEqual(304, self.get(url, response).status_code)
+        self.assertEqual(200, self.get('/api/v0/engagements/', response).status_code)
+
+    def test_if_modified_since(self):
+        response = self.client.get('/api/v0/applications/')
+
+        self.assertEqual(304, self.client.get('/api/v0/applications/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code)
+
+    def test_query_string_varies(self):
+        response = self.client.get('/api/v0/applications/')
+
+        self.assertEqual(200, self.get('/api/v0/applications/?fields=id', response).status_code)
+
+    def test_changes_modify(self):
+        application = models.Application.objects.get()
+        changes = [
+            lambda: application.tags.add(models.Tag.objects.create(name='Other')),
+            lambda: models.Tag.objects.filter(pk=self.tag.pk).get().save(),
+            lambda: self.person.save(),
+            lambda: models.Organization.objects.get(pk=application.organization_id).people.remove(self.person),
+            lambda: models.Organization.objects.get(pk=application.organization_id).save(),
+            lambda: models.ThreadFixMetrics.objects.create(application=application),
+            lambda: application.applicationcustomfieldvalue_set.get().save(),
+            lambda: models.Relation.objects.get().delete(),
+            lambda: models.Application.objects.create(name='Other', organization=self.organization),
+        ]
+        for index, change in enumerate(changes):
+            response = self.client.get('/api/v0/applications/')
+            change()
+            self.assertEqual(200, self.get('/api/v0/applications/', response).status_code, index)
+
+
+class BulkTests(RelatedObjectsTestCase):
+
+    def test_create(self):
+        response = self.client.post('/api/v0/applications/bulk/', [
+            {'name': 'Bulk1', 'organization_id': self.organization.id},
+            {'name': 'Bulk2', 'organization_id': self.organization.id, 'business_criticality': models.Application.HIGH_CRITICALITY}
+        ], format='json')
+
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(['Bulk1', 'Bulk2'], [result['name'] for result in response.data])
+        self.assertEqual(self.organization.id, response.data[0]['organization']['id'])
+        self.assertEqual(models.Application.HIGH_CRITICALITY, models.Application.objects.get(name='Bulk2').business_criticality)
+
+    def test_create_single_insert(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/api/v0/applications/bulk/', [
+                {'name': 'Bulk%d' % index, 'organization_id': self.organization.id} for index in range(3)
+            ], format='json')
+
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(1, len([query for query in context.captured_queries if query['sql'].startswith('INSERT INTO "boh_application"')]))
+        for result in response.data:
+            self.assertEqual(result['name'], models.Application.objects.get(pk=result['id']).name)
+        self.assertTrue(models.SearchTerm.objects.filter(kind=search.kind(models.Application), object_id=response.data[0]['id']).exists())
+
+    def test_create_one_at_a_time(self):
+        """Databases which neither return ids from bulk inserts nor lock for the transaction insert each object."""
+        with mock.patch.object(viewsets.BulkMixin, 'inserts_in_bulk', return_value=False):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post('/api/v0/applications/bulk/', [
+                    {'name': 'Bulk%d' % index, 'organization_id': self.organization.id} for index in range(3)
+                ], format='json')
+
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(3, len([query for query in context.captured_queries if query['sql'].startswith('INSERT INTO "boh_application"')]))
+        self.assertEqual(['Bulk0', 'Bulk1', 'Bulk2'], [models.Application.objects.get(pk=result['id']).name for result in response.data])
+
+    def test_create_invalid(self):
+        """Nothing is written when any item is invalid, and errors are reported per item."""
+        response = self.client.post('/api/v0/applications/bulk/', [
+            {'name': 'Bulk1', 'organization_id': self.organization.id},
+            {'name': 'Bulk2'}
+        ], format='json')
+
+        self.assertEqual(400, response.status_code)
+        self.assertEqual({}, response.data[0])
+        self.assertIn('organization_id', response.data[1])
+        self.assertFalse(models.Application.objects.filter(name__startswith='Bulk').exists())
+
+    def test_update(self):
+        for index in range(3):
+            self.add_objects()
+        applications = list(models.Application.objects.all())
+
+        items = [{'id': application.id, 'description': 'Updated ' + application.name} for application in applications]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch('/api/v0/applications/bulk/', items, format='json')
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([item['description'] for item in items], [result['description'] for result in response.data])
+        self.assertEqual(1, len([query for query in context.captured_queries if query['sql'].startswith('UPDATE "boh_application"')]))
+        for application in models.Application.objects.all():
+            self.assertEqual('Updated ' + application.name, application.description)
+
+    def test_update_organization(self):
+        """Applications moving to another organization are saved individually, which moves their metrics rollup rows."""
+        application = models.Application.objects.get()
+        response = self.client.patch('/api/v0/applications/bulk/', [{'id': application.id, 'organization_id': self.organization.id}], format='json')
+
+        self.assertEqual(200, response.status_code)
+        rows = sorted(models.DailyMetrics.objects.values_list('kind', 'day', 'status', 'organization', 'activity_type', 'count'), key=repr)
+        models.DailyMetrics.objects.rebuild()
+        self.assertEqual(sorted(models.DailyMetrics.objects.values_list('kind', 'day', 'status', 'organization', 'activity_type', 'count'), key=repr), rows)
+        self.assertTrue(models.DailyMetrics.objects.filter(organization=self.organization).exists())
+
+    def test_duplicate_names(self):
+        """Unique values repeated within the items are reported per item instead of failing in the database."""
+        response = self.client.post('/api/v0/applications/bulk/', [
+            {'name': 'Bulk', 'organization_id': self.organization.id},
+            {'name': 'Other', 'organization_id': self.organization.id},
+            {'name': 'Bulk', 'organization_id': self.organization.id}
+        ], format='json')
+
+        self.assertEqual(400, response.status_code)
+        self.assertEqual([{'name': ['Duplicate value.']}, {}, {'name': ['Duplicate value.']}], response.data)
+        self.assertFalse(models.Application.objects.filter(name='Bulk').exists())
+
+        self.add_objects()
+        applications = list(models.Application.objects.all())
+        response = self.client.patch('/api/v0/applications/bulk/', [{'id': application.id, 'name': 'Same'} for application in applications], format='json')
+        self.assertEqual(400, response.status_code)
+        self.assertEqual([{'name': ['Duplicate value.']}] * 2, response.data)
+
+    def test_update_conflict(self):
+        """An update which lost a race with another transaction is answered with 409 and writes nothing."""
+        engagements = [models.Engagement.objects.get()]
+        self.add_objects()
+        engagements.append(models.Engagement.objects.latest('pk'))
+        stale = models.Engagement.objects.get(pk=engagements[1].pk)
+        engagements[1].status = models.Engagement.OPEN_STATUS
+        engagements[1].save()
+
+        items = [{'id': engagement.id, 'status': models.Engagement.CLOSED_STATUS} for engagement in engagements]
+        with mock.patch.object(models.Engagement.objects, 'in_bulk', return_value={engagements[0].id: models.Engagement.objects.get(pk=engagements[0].pk), stale.id: stale}):
+            response = self.client.patch('/api/v0/engagements/bulk/', items, format='json')
+
+        self.assertEqual(409, response.status_code)
+        self.assertEqual(models.Engagement.PENDING_STATUS, models.Engagement.objects.get(pk=engagements[0].pk).status)
+        self.assertEqual(models.Engagement.OPEN_STATUS, models.Engagement.objects.get(pk=engagements[1].pk).status)
+
+    def test_update_missing(self):
+        application = models.Application.objects.get()
+        response = self.client.patch('/api/v0/applications/bulk/', [{'id': application.id, 'name': 'Renamed'}, {'id': 0}], format='json')
+
+        self.assertEqual(400, response.status_code)
+        self.assertIn('id', response.data[1])
+        self.assertNotEqual('Renamed', models.Application.objects.get().name)
+
+    def test_boolean_ids(self):
+        """JSON true is not the id 1."""
+        response = self.client.patch('/api/v0/applications/bulk/', [{'id': True, 'name': 'Renamed'}], format='json')
+
+        self.assertEqual(400, response.status_code)
+        self.assertNotEqual('Renamed', models.Application.objects.get().name)
+        self.assertEqual(400, self.client.delete('/api/v0/applications/bulk/', [True], format='json').status_code)
+        self.assertTrue(models.Application.objects.exists())
+
+    def test_update_engagement_status(self):
+        """Models with save() side effects are saved individually."""
+        engagement = models.Engagement.objects.get()
+        response = self.client.patch('/api/v0/engagements/bulk/', [{'id': engagement.id, 'status': models.Engagement.OPEN_STATUS}], format='json')
+
+        self.assertEqual(200, response.status_code)
+        self.assertIsNotNone(models.Engagement.objects.get().open_date)
+
+    def test_create_activities(self):
+        engagement = models.Engagement.objects.get()
+        response = self.client.post('/api/v0/activities/bulk/', [
+            {'engagement': engagement.id, 'activity_type_id': self.activity_type.id} for index in range(2)
+        ], format='json')
+
+        self.assertEqual(201, response.status_code)
+        self.assertEqual('Review', response.data[1]['activity_type']['name'])
+        self.assertEqual(3, engagement.activity_set.count())
+
+    def test_destroy(self):
+        self.add_objects()
+        ids = list(models.Activity.objects.values_list('id', flat=True))
+
+        self.assertEqual(400, self.client.delete('/api/v0/activities/bulk/', ids + [0], format='json').status_code)
+        self.assertEqual(2, models.Activity.objects.count())
+
+        response = self.client.delete('/api/v0/activities/bulk/', ids, format='json')
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(models.Activity.objects.exists())
+
+    def test_not_a_list(self):
+        self.assertEqual(400, self.client.post('/api/v0/applications/bulk/', {'name': 'Bulk'}, format='json').status_code)
+
+
+class MetricsTests(APITestCase):
+
+    def setUp(self):
+        super(MetricsTests, self).setUp()
+        other = models.Organization.objects.create(name='Org2')
+        self.review = models.ActivityType.objects.create(name='Review')
+
+        for organization, opened in [(self.organization, (2019, 12, 30)), (self.organization, (2020, 1, 5)), (other, (2020, 1, 20)), (other, (2020, 3, 1))]:
+            application = models.Application.objects.create(name='App' + str(models.Application.objects.count()), organization=organization)
+            engagement = models.Engagement.objects.create(start_date='2020-01-01', end_date='2020-01-02', application=application)
+            activity = models.Activity.objects.create(engagement=engagement, activity_type=self.review)
+            open_date = datetime.datetime(*opened, tzinfo=timezone.utc)
+            models.Engagement.objects.filter(pk=engagement.pk).update(status=models.Engagement.CLOSED_STATUS, open_date=open_date, duration=datetime.timedelta(days=2))
+            models.Activity.objects.filter(pk=activity.pk).update(status=models.Activity.OPEN_STATUS, open_date=open_date)
+        models.DailyMetrics.objects.rebuild()  # update() bypasses the signals keeping the rollup current
+
+    def test_overview(self):
+        response = self.client.get('/api/v0/metrics/')
+
+        self.assertEqual(4, response.data['engagements']['closed_count'])
+        self.assertEqual('2 00:00:00', response.data['engagements']['average_duration'])
+        review = [stats for stats in response.data['activity_types'] if stats['name'] == 'Review'][0]
+        self.assertEqual(4, review['open_count'])
+
+    def test_engagements_monthly(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v0/metrics/engagements/', {'year': 2020})
+
+        self.assertEqual([('2020-01-01', 2), ('2020-03-01', 1)], [(result['month'], result['closed_count']) for result in response.data])
+
+    def test_engagements_by_organization(self):
+        response = self.client.get('/api/v0/metrics/engagements/', {'group_by': 'organization'})
+
+        self.assertEqual(
+            [('2019-12-01', 'Org1', 1), ('2020-01-01', 'Org1', 1), ('2020-01-01', 'Org2', 1), ('2020-03-01', 'Org2', 1)],
+            [(result['month'], result['organization'], result['total_count']) for result in response.data]
+        )
+
+    def test_activities_monthly(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v0/metrics/activities/', {'year': 2020, 'group_by': 'organization'})
+
+        self.assertEqual(3, len(response.data))
+        self.assertEqual({'month': '2020-01-01', 'activity_type': 'Review', 'organization': 'Org1', 'open_count': 1}, {key: response.data[0][key] for key in ('month', 'activity_type', 'organization', 'open_count')})
 
-# Create your tests here.
+    def test_invalid_query(self):
+        self.assertEqual(400, self.client.get('/api/v0/metrics/engagements/', {'group_by': 'color'}).status_code)
@@ -1,4 +1,14 @@
-from rest_framework import generics, renderers
+from django.utils.translation import ugettext_lazy as _
+
+from rest_framework import generics, renderers, status, views
 from rest_framework.response import Response
 
+from boh.behaviors import ConcurrentUpdateError
+
 
+def exception_handler(exc, context):
+    """Answers updates which lost a race with another transaction with 409 Conflict, see behaviors.DirtyFieldsModel."""
+    if isinstance(exc, ConcurrentUpdateError):
+        views.set_rollback()
+        return Response({'detail': _('The object was modified by someone else, reload it and try again.')}, status=status.HTTP_409_CONFLICT)
+    return views.exception_handler(exc, context)
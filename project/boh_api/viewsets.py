@@ -1,20 +1,326 @@
+import calendar
+import collections
+import hashlib
+
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, Max, Model, Prefetch
+from django.http import Http404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.utils.translation import ugettext as _
 
-from rest_framework import viewsets
+from rest_framework import serializers as rest_serializers, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.utils import model_meta
 
-from boh import models
+from boh import fragments, models, search
 
 from . import serializers
 
 
-class OrganizationViewSet(viewsets.ModelViewSet):
+class ExpandableFieldsMixin(object):
+    """Joins and prefetches only the relations of the fields which will be serialized, see serializers.ExpandableFieldsMixin."""
+
+    select_related_fields = {}  # Field name -> select_related lookups used when the field is expanded
+    prefetch_related_fields = {}  # Field name -> prefetch_related lookups used when the field is expanded
+
+    def get_queryset(self):
+        queryset = super(ExpandableFieldsMixin, self).get_queryset()
+
+        fields, expand = serializers.requested_fields(self.request)
+        declared_fields = self.get_serializer_class()._declared_fields
+
+        for name, lookups in self.select_related_fields.items():
+            if serializers.is_included(name, fields, expand) and serializers.is_expanded(name, declared_fields.get(name), expand):
+                queryset = queryset.select_related(*lookups)
+
+        for name, lookups in self.prefetch_related_fields.items():
+            if serializers.is_included(name, fields, expand) and serializers.is_expanded(name, declared_fields.get(name), expand):
+                queryset = queryset.prefetch_related(*lookups)
+
+        # Collapsed to-many relations are serialized as lists of primary keys
+        for name, field in declared_fields.items():
+            if isinstance(field, rest_serializers.ListSerializer) and serializers.is_included(name, fields, expand) and not serializers.is_expanded(name, field, expand):
+                queryset = queryset.prefetch_related(field.source or name)
+
+        return queryset
+
+
+class ConditionalGetMixin(object):
+    """
+    Adds ETag and Last-Modified headers to list and detail responses, computed from the number of matching objects and
+    their latest modified dates rather than from the response body. Unchanged resources return 304 Not Modified without
+    being serialized.
+    """
+
+    last_modified_fields = ['modified_date']  # Dates which change whenever the serialized objects change
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional_response(queryset, super(ConditionalGetMixin, self).list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(**{self.lookup_field: kwargs[lookup_url_kwarg]})
+        except (TypeError, ValueError, ValidationError):
+            raise Http404  # As get_object_or_404 does for lookups which are not valid for the field
+        return self.conditional_response(queryset, super(ConditionalGetMixin, self).retrieve, request, *args, **kwargs)
+
+    def conditional_response(self, queryset, view, request, *args, **kwargs):
+        if getattr(self.paginator, 'use_cursor', None) and self.paginator.use_cursor(request):
+            return view(request, *args, **kwargs)  # Keyset pages avoid aggregating the whole list
+
+        etag, last_modified = self.validators(queryset)
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = view(request, *args, **kwargs)
+
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def validators(self, queryset):
+        """Returns the ETag and last modified timestamp of the objects using a single aggregate query."""
+        aggregates = {'version_count': Count('pk', distinct=True)}
+        for index, field in enumerate(self.last_modified_fields):
+            aggregates['version_%d' % index] = Max(field)
+        version = queryset.order_by().aggregate(**aggregates)
+
+        dates = [version['version_%d' % index] for index in range(len(self.last_modified_fields))]
+        present = [date for date in dates if date is not None]
+        last_modified = calendar.timegm(max(present).utctimetuple()) if present else None
+
+        # The representation also depends on the query string (pages, fields) and the negotiated format
+        key = [self.request.get_full_path(), self.request.accepted_renderer.format, version['version_count']] + dates
+        etag = quote_etag(hashlib.md5(repr(key).encode('utf-8')).hexdigest())
+        return etag, last_modified
+
+
+def bulk_id(value):
+    """Returns the value if it can be the id of an object, else None. JSON booleans are not ids even though bool is an int."""
+    return value if isinstance(value, int) and not isinstance(value, bool) else None
+
+
+class BulkMixin(object):
+    """
+    Adds a 'bulk/' endpoint accepting a list of items: POST creates objects, PATCH partially updates objects (each item
+    includes its 'id') and DELETE deletes objects (a list of ids). Every item is validated before anything is written,
+    then all items are written in a single transaction. Responses list one result, or one set of errors, per item.
+
+    Created objects are inserted with one query on PostgreSQL, which returns their ids, and on SQLite, which locks the
+    database for the transaction so the ids can be read back. Other databases insert them one at a time.
+    """
+
+    max_bulk_size = 1000
+    # Objects are saved one at a time when these fields change, for the post_save receivers which depend on them
+    saved_individually_on_change = []
+
+    @action(detail=False, methods=['post', 'patch', 'delete'], url_path='bulk')
+    def bulk(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'detail': _('Expected a list of items.')}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.max_bulk_size:
+            return Response({'detail': _('No more than %(count)d items may be sent at once.') % {'count': self.max_bulk_size}}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            if request.method == 'POST':
+                return self.bulk_create(items)
+            elif request.method == 'PATCH':
+                return self.bulk_update(items)
+            return self.bulk_destroy(items)
+        except IntegrityError:
+            return Response({'detail': _('The items conflict with existing objects.')}, status=status.HTTP_400_BAD_REQUEST)
+
+    def bulk_create(self, items):
+        item_serializers = [self.get_serializer(data=item) for item in items]
+        if not all([serializer.is_valid() for serializer in item_serializers]):
+            return Response([serializer.errors for serializer in item_serializers], status=status.HTTP_400_BAD_REQUEST)
+
+        model = self.get_queryset().model
+        errors = self.duplicate_errors(model, [serializer.validated_data for serializer in item_serializers])
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        instances = []
+        relations = []
+        for serializer in item_serializers:
+            fields, many_to_many = self.split_many_to_many(model, serializer.validated_data)
+            instances.append(model(**fields))
+            relations.append(many_to_many)
+
+        with transaction.atomic():
+            if not self.inserts_in_bulk(model):
+                for instance in instances:
+                    instance.save()
+            else:
+                model.objects.bulk_create(instances)
+                if not connection.features.can_return_ids_from_bulk_insert:
+                    # No other connection can insert until the transaction ends, so the newest rows are these
+                    pks = list(model.objects.order_by('-pk').values_list('pk', flat=True)[:len(instances)])
+                    for instance, pk in zip(instances, reversed(pks)):
+                        instance.pk = pk
+                self.bulk_written(model, instances)  # bulk_create() sends no post_save signals
+            self.set_many_to_many(instances, relations)
+
+        return Response(self.bulk_results(instances), status=status.HTTP_201_CREATED)
+
+    def bulk_update(self, items):
+        ids = [bulk_id(item.get('id')) if isinstance(item, dict) else None for item in items]
+        instances = self.get_queryset().model.objects.in_bulk([pk for pk in ids if pk is not None])
+        occurrences = collections.Counter(ids)
+
+        item_serializers = []
+        errors = []
+        for pk, item in zip(ids, items):
+            if pk not in instances:
+                errors.append({'id': [_('Not found.')]})
+            elif occurrences[pk] > 1:
+                errors.append({'id': [_('Duplicate id.')]})
+            else:
+                serializer = self.get_serializer(instances[pk], data=item, partial=True)
+                item_serializers.append(serializer)
+                errors.append({} if serializer.is_valid() else serializer.errors)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        model = self.get_queryset().model
+        errors = self.duplicate_errors(model, [serializer.validated_data for serializer in item_serializers])
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        updated = []
+        individually = []
+        relations = []
+        field_names = set()
+        for serializer in item_serializers:
+            fields, many_to_many = self.split_many_to_many(model, serializer.validated_data)
+            if self.saves_individually(model) or self.changes(model, serializer.instance, fields, self.saved_individually_on_change):
+                individually.append(serializer.instance)
+            for attr, value in fields.items():
+                setattr(serializer.instance, attr, value)
+            updated.append(serializer.instance)
+            relations.append(many_to_many)
+            field_names.update(fields)
+
+        with transaction.atomic():
+            for instance in individually:
+                instance.save()
+            saved = {instance.pk for instance in individually}
+            in_bulk = [instance for instance in updated if instance.pk not in saved]
+            if in_bulk and field_names:
+                if any(field.name == 'modified_date' for field in model._meta.get_fields()):
+                    now = timezone.now()
+                    for instance in in_bulk:
+                        instance.modified_date = now
+                    field_names.add('modified_date')
+                model.objects.bulk_update(in_bulk, field_names)
+                self.bulk_written(model, in_bulk)
+            self.set_many_to_many(updated, relations)
+
+        return Response(self.bulk_results(updated))
+
+    def bulk_destroy(self, items):
+        ids = [bulk_id(pk) for pk in items]
+        queryset = self.get_queryset().model.objects.filter(pk__in=[pk for pk in ids if pk is not None])
+        existing = set(queryset.values_list('pk', flat=True))
+
+        errors = [{} if pk in existing else {'id': [_('Not found.')]} for pk in ids]
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            queryset.delete()
+
+        return Response([{'id': pk, 'deleted': True} for pk in items])
+
+    def bulk_results(self, instances):
+        """Serializes the written objects in request order using the viewset's optimized queryset."""
+        written = self.get_queryset().in_bulk([instance.pk for instance in instances])
+        return self.get_serializer([written[instance.pk] for instance in instances], many=True).data
+
+    def saves_individually(self, model):
+        """Models overriding save() with side effects are saved one at a time, still within the single transaction."""
+        return model.save is not Model.save
+
+    def inserts_in_bulk(self, model):
+        """Returns true if created objects are inserted with one query, which needs their ids back from the database."""
+        return not self.saves_individually(model) and (connection.features.can_return_ids_from_bulk_insert or connection.vendor == 'sqlite')
+
+    def changes(self, model, instance, fields, names):
+        """Returns true if the validated fields change the value of any of the named fields of the instance."""
+        for name in names:
+            if name in fields:
+                value = fields[name]
+                if getattr(instance, model._meta.get_field(name).attname) != getattr(value, 'pk', value):
+                    return True
+        return False
+
+    def duplicate_errors(self, model, items):
+        """Reports values of unique fields repeated within the items, which the serializers only check against the database."""
+        errors = [{} for item in items]
+        for field in model._meta.concrete_fields:
+            if not field.unique or field.primary_key:
+                continue
+            occurrences = collections.Counter(item[field.name] for item in items if field.name in item)
+            for item, error in zip(items, errors):
+                if field.name in item and occurrences[item[field.name]] > 1:
+                    error[field.name] = [_('Duplicate value.')]
+        return errors
+
+    def bulk_written(self, model, instances):
+        """Updates what post_save receivers would have for objects written without saving them individually."""
+        fragments.invalidate_model(model)
+        if model.__name__ in [document.model_name for document in search.documents.values()]:
+            models.SearchTerm.objects.index(search.kind(model), [instance.pk for instance in instances])
+
+    def split_many_to_many(self, model, validated_data):
+        info = model_meta.get_field_info(model)
+        fields = dict(validated_data)
+        many_to_many = {}
+        for name in list(fields):
+            if name in info.relations and info.relations[name].to_many:
+                many_to_many[name] = fields.pop(name)
+        return fields, many_to_many
+
+    def set_many_to_many(self, instances, relations):
+        for instance, many_to_many in zip(instances, relations):
+            for name, value in many_to_many.items():
+                getattr(instance, name).set(value)
+
+
+class OrganizationViewSet(ExpandableFieldsMixin, viewsets.ModelViewSet):
     queryset = models.Organization.objects.all()
+    prefetch_related_fields = {'people': ['people']}
     serializer_class = serializers.OrganizationSerializer
 
 
-class ApplicationViewSet(viewsets.ModelViewSet):
+class ApplicationViewSet(BulkMixin, ConditionalGetMixin, ExpandableFieldsMixin, viewsets.ModelViewSet):
     queryset = models.Application.objects.all()
+    last_modified_fields = [
+        'modified_date', 'latest_threadfix_metrics__modified_date', 'applicationcustomfieldvalue__modified_date',
+        'applicationcustomfieldvalue__custom_field__modified_date'
+    ]
+    select_related_fields = {
+        'organization': ['organization'],
+        'threadfix_metrics': ['latest_threadfix_metrics']
+    }
+    prefetch_related_fields = {
+        'organization': ['organization__people'],
+        'tags': ['tags'],
+        'data_elements': ['data_elements'],
+        'custom_fields': [Prefetch('applicationcustomfieldvalue_set', queryset=models.ApplicationCustomFieldValue.objects.select_related('custom_field'))],
+        'people': ['people']
+    }
     serializer_class = serializers.ApplicationSerializer
+    saved_individually_on_change = ['organization']
 
 
 class TagViewSet(viewsets.ModelViewSet):
@@ -27,17 +333,20 @@ class PersonViewSet(viewsets.ModelViewSet):
     serializer_class = serializers.PersonSerializer
 
 
-class EngagementViewSet(viewsets.ModelViewSet):
+class EngagementViewSet(BulkMixin, ConditionalGetMixin, ExpandableFieldsMixin, viewsets.ModelViewSet):
     queryset = models.Engagement.objects.all()
+    select_related_fields = {'requestor': ['requestor']}
     serializer_class = serializers.EngagementSerializer
 
 
-class ActivityViewSet(viewsets.ModelViewSet):
+class ActivityViewSet(BulkMixin, ExpandableFieldsMixin, viewsets.ModelViewSet):
     queryset = models.Activity.objects.all()
+    select_related_fields = {'activity_type': ['activity_type']}
+    prefetch_related_fields = {'users': ['users']}
     serializer_class = serializers.ActivitySerializer
 
 
-class ActivityTypeViewSet(viewsets.ModelViewSet):
+class ActivityTypeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = models.ActivityType.objects.all()
     serializer_class = serializers.ActivityTypeSerializer
 
@@ -45,3 +354,36 @@ class ActivityTypeViewSet(viewsets.ModelViewSet):
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = get_user_model().objects.all()
     serializer_class = serializers.UserSerializer
+
+
+class MetricsViewSet(viewsets.ViewSet):
+    """
+    Engagement and activity metrics computed in the database. Accepts '?year=' to count only what was opened that year
+    and, for the monthly trends, '?group_by=organization'.
+    """
+
+    def query(self):
+        query = serializers.MetricsQuerySerializer(data=self.request.query_params)
+        query.is_valid(raise_exception=True)
+        return query.validated_data.get('year'), query.validated_data.get('group_by') == 'organization'
+
+    def list(self, request):
+        year, by_organization = self.query()
+        return Response({
+            'engagements': serializers.StatusCountsSerializer(models.Engagement.metrics.stats(year)).data,
+            'activity_types': serializers.ActivityTypeStatsSerializer(models.ActivityType.metrics.stats(year), many=True).data
+        })
+
+    @action(detail=False)
+    def engagements(self, request):
+        """Engagement counts per month opened."""
+        year, by_organization = self.query()
+        results = models.Engagement.metrics.monthly(year, by_organization=by_organization)
+        return Response(serializers.EngagementTrendSerializer(results, many=True).data)
+
+    @action(detail=False)
+    def activities(self, request):
+        """Activity counts per month opened and activity type."""
+        year, by_organization = self.query()
+        results = models.Activity.metrics.monthly(year, by_organization=by_organization)
+        return Response(serializers.ActivityTrendSerializer(results, many=True).data)
@@ -121,6 +121,34 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.JSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'boh_api.pagination.OptionalCursorPagination',
+    'EXCEPTION_HANDLER': 'boh_api.views.exception_handler',
     'PAGE_SIZE': 25,
 }
+
+# Caches
+# Cached pages are invalidated through versions kept in the database, so a per-process backend stays correct with many
+# processes. A shared backend such as memcached lets the processes also share the pages they render.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Rendered list pages are cached until the data they show changes, or for at most this many seconds.
+FRAGMENT_CACHE = 'default'
+FRAGMENT_CACHE_TIMEOUT = 300
+
+# Lists showing every application load this many at a time.
+APPLICATION_LIST_CHUNK_SIZE = 100
+
+# Reports
+# Generated reports are cached until the data they were generated from changes, or for at most this many seconds.
+# Use a cache backend shared between processes, such as memcached, so every report worker sees the same reports.
+REPORT_CACHE = 'default'
+REPORT_CACHE_TIMEOUT = 3600
+REPORT_CACHE_MAX_SIZE = 16 * 1024 * 1024  # bytes, larger reports are not cached
+# Reports running for longer than this many seconds are assumed to belong to a stopped worker and are generated again.
+REPORT_WORKER_TIMEOUT = 3600
+# Finished reports and their files are deleted by the report worker this many days after they were generated.
+REPORT_RETENTION_DAYS = 30